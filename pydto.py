@@ -1,21 +1,53 @@
-from collections import defaultdict
+import codecs
+from collections import defaultdict, OrderedDict
+import copy
+import csv
 from contextlib import contextmanager
+import operator
 import sys
 import decimal
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
+import itertools
+import json
+import json.decoder
+import json.encoder
+import mmap
+import multiprocessing
+import numbers
+import inspect
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 if sys.version_info >= (3,):
     iteritems = dict.items
+    intern = sys.intern
     strtype = str
+    STRING_TYPES = (str,)
     PRIMITIVE_TYPES = (str, int, decimal.Decimal, float,
                        complex, bool)
 else:
     iteritems = dict.iteritems
     # flake8: noqa
     strtype = basestring
+    STRING_TYPES = (str, unicode)
     PRIMITIVE_TYPES = (str, unicode, int, decimal.Decimal, float,
                        complex, bool)
 
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
 __author__ = 'Dmitry Kurkin'
 __version__ = '0.5.1'
 
@@ -37,21 +69,26 @@ def aggregate_schema_errors(errors_list, path=None):
         errors_list.append(Invalid(str(e), path))
 
 
+def collect_invalids(error, path=None):
+    path = path or []
+    if isinstance(error, MultipleInvalid):
+        errs = [ie for ie in error.errors]
+        for e in errs:
+            e.path = path + e.path
+        return errs
+    elif isinstance(error, Invalid):
+        error.path = path + error.path
+        return [error]
+    else:
+        return [Invalid(str(error), path)]
+
+
 @contextmanager
 def aggregate_invalids(invalids_list, path=None):
-    path = path or []
     try:
         yield
-    except MultipleInvalid as e:
-        errs = [ie for ie in e.errors]
-        for e in errs:
-            e.path = path + e.path
-        invalids_list.extend(errs)
-    except Invalid as e:
-        e.path = path + e.path
-        invalids_list.append(e)
     except Exception as e:
-        invalids_list.append(Invalid(str(e), path))
+        invalids_list.extend(collect_invalids(e, path))
 
 
 class Error(Exception):
@@ -189,6 +226,14 @@ class RangeInvalid(Invalid):
     """Data is not in specified range."""
 
 
+class VariantInvalid(Invalid):
+    """Union does not have a variant for the discriminator value."""
+
+
+class LimitInvalid(Invalid):
+    """Data exceeds one of Limits."""
+
+
 class Undefined(object):
     def __nonzero__(self):
         return False
@@ -205,11 +250,559 @@ class Extras(object):
     PREVENT, ALLOW, REMOVE, INHERIT = values
 
 
+class Construction(object):
+    values = ['init', 'attributes', 'positional']
+    INIT, ATTRIBUTES, POSITIONAL = values
+
+
+class Limits(object):
+    """
+    Limits of incoming data size, that are checked before any conversion
+    takes place. None means no limit:
+
+    >>> schema = Schema(UnvalidatedList(), limits=Limits(max_depth=2))
+    >>> assert [[1]] == schema([[1]])
+    >>> try:
+    ...     schema([[[1]]])
+    ...     assert False, "an exception should've been raised"
+    ... except MultipleInvalid as e:
+    ...     assert isinstance(e.errors[0], LimitInvalid)
+    ...     assert [0, 0] == e.path
+    """
+
+    def __init__(self, max_depth=None, max_list_len=None, max_str_len=None,
+                 max_keys=None, max_total_nodes=None):
+        """
+        :param max_depth: maximal nesting level of dictionaries and lists.
+        Top level container has level 1.
+        :param max_list_len: maximal length of lists
+        :param max_str_len: maximal length of strings, including
+        dictionary keys
+        :param max_keys: maximal number of keys in dictionaries
+        :param max_total_nodes: maximal number of values (containers and
+        scalars) in data
+        """
+        for name, value in (('max_depth', max_depth),
+                            ('max_list_len', max_list_len),
+                            ('max_str_len', max_str_len),
+                            ('max_keys', max_keys),
+                            ('max_total_nodes', max_total_nodes)):
+            if value is not None and (not isinstance(value, int) or
+                                      value < 0):
+                raise SchemaError('%s should be a non-negative integer'
+                                  % name)
+        self.max_depth = max_depth
+        self.max_list_len = max_list_len
+        self.max_str_len = max_str_len
+        self.max_keys = max_keys
+        self.max_total_nodes = max_total_nodes
+
+    def check(self, data):
+        """
+        Walks data without recursion and raises LimitInvalid on the first
+        exceeded limit.
+        """
+        self.check_nested(data, 0, self.max_total_nodes)
+
+    def check_nested(self, data, depth, budget):
+        """
+        Same as check, but for data nested at depth, when budget values
+        are left of max_total_nodes. Returns a number of values, that
+        are left.
+        """
+        max_depth = self.max_depth
+        max_list_len = self.max_list_len
+        max_str_len = self.max_str_len
+        max_keys = self.max_keys
+        strings = (strtype, bytes)
+        # Entries are (value, depth, parent entry, key in parent)
+        stack = [(data, depth, None, None)]
+        while stack:
+            entry = stack.pop()
+            value = entry[0]
+            if budget is not None:
+                budget -= 1
+                if budget < 0:
+                    raise self._invalid('data has more than %d values'
+                                        % self.max_total_nodes, entry)
+            if isinstance(value, strings):
+                if max_str_len is not None and len(value) > max_str_len:
+                    raise self._invalid('string is longer than %d'
+                                        % max_str_len, entry)
+            elif isinstance(value, dict):
+                depth = entry[1] + 1
+                if max_depth is not None and depth > max_depth:
+                    raise self._invalid('data is nested deeper than %d'
+                                        % max_depth, entry)
+                if max_keys is not None and len(value) > max_keys:
+                    raise self._invalid('dictionary has more than %d keys'
+                                        % max_keys, entry)
+                if budget is not None and len(value) > budget:
+                    raise self._invalid('data has more than %d values'
+                                        % self.max_total_nodes, entry)
+                for key, item in iteritems(value):
+                    if max_str_len is not None and \
+                            isinstance(key, strings) and \
+                            len(key) > max_str_len:
+                        raise self._invalid('key is longer than %d'
+                                            % max_str_len, entry)
+                    stack.append((item, depth, entry, key))
+            elif isinstance(value, (list, tuple)):
+                depth = entry[1] + 1
+                if max_depth is not None and depth > max_depth:
+                    raise self._invalid('data is nested deeper than %d'
+                                        % max_depth, entry)
+                if max_list_len is not None and len(value) > max_list_len:
+                    raise self._invalid('list is longer than %d'
+                                        % max_list_len, entry)
+                if budget is not None and len(value) > budget:
+                    raise self._invalid('data has more than %d values'
+                                        % self.max_total_nodes, entry)
+                for idx, item in enumerate(value):
+                    stack.append((item, depth, entry, idx))
+        return budget
+
+    @staticmethod
+    def _invalid(message, entry):
+        path = []
+        while entry[2] is not None:
+            path.append(entry[3])
+            entry = entry[2]
+        path.reverse()
+        return LimitInvalid(message, path)
+
+
+class Sample(object):
+    """
+    A sample of list elements, that are validated. Other elements are
+    trusted: they are only projected (see Schema.project). By default every
+    n-th element is sampled, so a rate of 0.25 samples elements 0, 4, 8 and
+    so on. If a seed (or a random.Random instance) is given, elements are
+    sampled at random, so different elements of lists are sampled on every
+    call. Elements of lists should be projectable (see Schema.project),
+    SchemaError is raised otherwise. Invalid sampled elements are projected
+    too, unless the error rate of the sample exceeds max_error_rate. Then
+    sample errors are raised, or a hook is called instead, if there is one:
+
+    >>> schema = Schema(List({Required('id'): int},
+    ...                      sample=Sample(0.5, max_error_rate=0.5)))
+    >>> assert [{'id': 1}, {'id': '2'}, {'id': 'x'}, {'id': '4'}] == \\
+    ...     schema([{'id': '1'}, {'id': '2'}, {'id': 'x'}, {'id': '4'}])
+    >>> try:
+    ...     schema([{'id': 'x'}, {'id': '2'}, {'id': 'x'}, {'id': '4'}])
+    ...     assert False, "an exception should've been raised"
+    ... except MultipleInvalid as e:
+    ...     assert [[0, 'id'], [2, 'id']] == [e.path for e in e.errors]
+
+    A hook is called for every validated list with a dictionary, that
+    describes the sample: a number of elements ('size'), a number of
+    sampled elements ('sampled'), a number of invalid sampled elements
+    ('invalid'), their share ('error_rate'), whether it exceeds
+    max_error_rate ('exceeded') and errors of sampled elements ('errors').
+    The hook can raise an exception itself.
+    """
+
+    def __init__(self, rate, seed=None, max_error_rate=0.0, hook=None):
+        """
+        :param rate: a share of elements to validate, greater than 0 and
+        at most 1
+        :param seed: a seed or a random.Random instance to sample elements
+        at random. Elements are sampled at even intervals if it is None.
+        :param max_error_rate: a maximal share of invalid sampled elements
+        :param hook: a callable, that receives descriptions of samples
+        """
+        if not 0 < rate <= 1:
+            raise SchemaError('sample rate should be greater than 0 and '
+                              'at most 1')
+        if hook is not None and not callable(hook):
+            raise SchemaError('hook should be callable')
+        self.rate = rate
+        self.seed = seed
+        if seed is None or isinstance(seed, random.Random):
+            self._random = seed
+        else:
+            self._random = random.Random(seed)
+        self.max_error_rate = max_error_rate
+        self.hook = hook
+
+    def positions(self, size):
+        """
+        Returns sorted positions of sampled elements.
+        """
+        if self._random is None:
+            return range(0, size, max(1, int(round(1 / self.rate))))
+        count = min(size, max(1, int(round(size * self.rate))))
+        return sorted(self._random.sample(range(size), count)) \
+            if size else []
+
+    def check(self, size, sampled, invalid, errors):
+        error_rate = float(invalid) / sampled if sampled else 0.0
+        exceeded = error_rate > self.max_error_rate
+        if self.hook is not None:
+            self.hook({'size': size, 'sampled': sampled, 'invalid': invalid,
+                       'error_rate': error_rate, 'exceeded': exceeded,
+                       'errors': errors})
+        elif exceeded:
+            raise MultipleInvalid(errors)
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+_CACHEABLE_TYPES = frozenset((type(None), bool, int, float, complex,
+                              decimal.Decimal, bytes) + STRING_TYPES)
+
+if hasattr(hashlib, 'blake2b'):
+    def _digest(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+else:
+    def _digest(data):
+        return hashlib.sha1(data).digest()
+
+
+def _structural_digest(data):
+    """
+    Returns a digest of a canonical representation of data. Dictionaries
+    are equal regardless of the order of their keys. Values of other types,
+    than builtin scalars, naive datetimes, dictionaries, lists and tuples,
+    raise _Uncacheable, because their representation may not identify them.
+    """
+    chunks = []
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        value_type = type(value)
+        if value_type in _CACHEABLE_TYPES or \
+                value_type is datetime and value.tzinfo is None:
+            chunks.append(value_type.__name__)
+            chunks.append(repr(value))
+        elif value_type is dict:
+            chunks.append('dict')
+            chunks.append(str(len(value)))
+            try:
+                items = sorted(iteritems(value),
+                               key=lambda item: (type(item[0]).__name__,
+                                                 item[0]))
+            except TypeError:
+                raise _Uncacheable()
+            for key, item in reversed(items):
+                stack.append(item)
+                stack.append(key)
+        elif value_type is list or value_type is tuple:
+            chunks.append(value_type.__name__)
+            chunks.append(str(len(value)))
+            stack.extend(reversed(value))
+        else:
+            raise _Uncacheable()
+    return _digest('\x00'.join(chunks).encode('utf-8'))
+
+
+def _estimate_size(value):
+    size = 0
+    seen = set()
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            for key, item in iteritems(value):
+                stack.append(key)
+                stack.append(item)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            stack.extend(value)
+        elif hasattr(value, '__dict__'):
+            stack.append(value.__dict__)
+    return size
+
+
+class Cache(object):
+    """
+    A cache of validation results, keyed by a digest of incoming data:
+    of raw JSON documents for Schema.loads and of a canonical
+    representation of data for Schema calls. Both results and errors are
+    cached. Results are copied, so neither a caller nor the cache can
+    change results of another call:
+
+    >>> schema = Schema({Required('id'): int}, cache=Cache(max_entries=2))
+    >>> assert {'id': 1} == schema({'id': '1'})
+    >>> res = schema({'id': '1'})
+    >>> res['id'] = 2
+    >>> assert {'id': 1} == schema({'id': '1'})
+    >>> try:
+    ...     schema({'id': 'x'})
+    ...     assert False, "an exception should've been raised"
+    ... except MultipleInvalid as e:
+    ...     assert ['id'] == e.path
+    >>> stats = schema.cache.stats()
+    >>> assert (2, 2, 2) == (stats['hits'], stats['misses'], stats['entries'])
+
+    Data, that contains values of other types, than builtin scalars,
+    naive datetimes, dictionaries, lists and tuples, is validated without
+    caching ('skipped' in stats).
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, max_bytes=None,
+                 copy=True, clock=time.time):
+        """
+        :param max_entries: maximal number of cached results. Least
+        recently used results are evicted first.
+        :param ttl: a number of seconds, after which results expire
+        :param max_bytes: an approximate limit of memory, that is taken by
+        cached results
+        :param copy: copy results, that are stored or returned. If False,
+        cached results are shared and must not be changed.
+        :param clock: a function, that returns current time in seconds
+        """
+        for name, value in (('max_entries', max_entries),
+                            ('max_bytes', max_bytes)):
+            if value is not None and (not isinstance(value, int) or
+                                      value < 1):
+                raise SchemaError('%s should be a positive integer' % name)
+        if ttl is not None and ttl <= 0:
+            raise SchemaError('ttl should be positive')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.copy = copy
+        self.clock = clock
+        # Keys don't identify schemas, so a cache serves a single schema
+        self._attached = False
+        self.clear()
+
+    def __getstate__(self):
+        # Cached results are not worth pickling, locks can't be pickled
+        state = self.__dict__.copy()
+        for name in ('_entries', '_lock', '_bytes', '_counters'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.clear()
+
+    def clear(self):
+        """
+        Removes all cached results and resets stats.
+        """
+        # Entries are (expiration time, is valid, result or errors, size)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._counters = dict.fromkeys(('hits', 'misses', 'evictions',
+                                        'expirations', 'skipped'), 0)
+
+    def stats(self):
+        """
+        Returns numbers of hits, misses, evicted and expired results, calls,
+        that were not cached ('skipped'), current number of entries and
+        approximate size of cached results in bytes.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        return stats
+
+    def call(self, key, data, validate):
+        """
+        Returns a cached result of validate(data) or calls it and caches
+        its result. MultipleInvalid errors are cached and raised again.
+
+        :param key: a hashable key, that identifies validation
+        :param data: incoming data
+        :param validate: a function, that validates data
+        """
+        try:
+            if isinstance(data, bytes):
+                key = (key, _digest(data))
+            elif isinstance(data, STRING_TYPES) and key[0] == 'json':
+                key = (key, _digest(data.encode('utf-8')))
+            else:
+                key = (key, _structural_digest(data))
+        except (_Uncacheable, UnicodeError):
+            with self._lock:
+                self._counters['skipped'] += 1
+            return validate(data)
+        entry = self._get(key)
+        if entry is not None:
+            # Callers prefix paths of errors, so errors are always copied
+            if not entry[1]:
+                raise MultipleInvalid(copy.deepcopy(entry[2]))
+            return copy.deepcopy(entry[2]) if self.copy else entry[2]
+        try:
+            result = validate(data)
+        except MultipleInvalid as e:
+            self._put(key, False, copy.deepcopy(e.errors))
+            raise
+        self._put(key, True, copy.deepcopy(result) if self.copy else result)
+        return result
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self._counters['misses'] += 1
+            elif entry[0] is not None and entry[0] <= self.clock():
+                self._bytes -= entry[3]
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                entry = None
+            else:
+                self._entries[key] = entry
+                self._counters['hits'] += 1
+            return entry
+
+    def _put(self, key, valid, value):
+        size = _estimate_size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._entries[key] = (expires, valid, value, size)
+            self._bytes += size
+            while (self.max_entries is not None and
+                   len(self._entries) > self.max_entries) or \
+                    (self.max_bytes is not None and
+                     self._bytes > self.max_bytes):
+                self._bytes -= self._entries.popitem(last=False)[1][3]
+                self._counters['evictions'] += 1
+
+
+def _is_data_descriptor(object_class, name):
+    for cls in object_class.__mro__:
+        if name in cls.__dict__:
+            descriptor_type = type(cls.__dict__[name])
+            return hasattr(descriptor_type, '__set__') or \
+                hasattr(descriptor_type, '__delete__')
+    return False
+
+
+def _init_parameters(object_class):
+    """
+    Returns names of positional parameters of class constructor.
+    """
+    if sys.version_info >= (3,):
+        parameters = inspect.signature(object_class).parameters.values()
+        return [p.name for p in parameters
+                if p.kind == p.POSITIONAL_OR_KEYWORD]
+    else:
+        init = object_class.__init__
+        if not inspect.ismethod(init):
+            return []
+        return inspect.getargspec(init).args[1:]
+
+
 class _Compilable(object):
     def _compile(self, compiler):
         raise NotImplementedError()
 
 
+# Column conversion is used by columnar lists: a converter gets a whole column
+# of values at once and returns a list of results along with a dictionary
+# mapping positions of failed values to the exceptions they raised. Built-in
+# converters define a _convert_column method, every other callable is applied
+# element by element.
+
+_MAPPED_COLUMN_CONVERTERS = frozenset([int, float, str])
+
+
+def _convert_column(converter, values):
+    if isinstance(converter, type):
+        if converter in _MAPPED_COLUMN_CONVERTERS:
+            try:
+                return list(map(converter, values)), {}
+            except Exception:
+                pass
+    else:
+        convert_column = getattr(converter, '_convert_column', None)
+        if convert_column is not None:
+            return convert_column(values)
+    results = list(values)
+    failures = {}
+    _convert_positions(converter, results, range(len(values)), failures)
+    return results, failures
+
+
+def _convert_positions(converter, results, positions, failures):
+    """
+    Converts values of results list at given positions one by one in place.
+    Returns positions that were converted successfully.
+    """
+    converted = []
+    for pos in positions:
+        try:
+            results[pos] = converter(results[pos])
+            converted.append(pos)
+        except Exception as e:
+            failures[pos] = e
+    return converted
+
+
+def _convert_column_subset(converter, results, positions, failures):
+    """
+    Same as _convert_positions, but converts values as a column.
+    """
+    positions = list(positions)
+    converted, failed = _convert_column(converter,
+                                        [results[pos] for pos in positions])
+    survivors = []
+    for idx, pos in enumerate(positions):
+        if idx in failed:
+            failures[pos] = failed[idx]
+        else:
+            results[pos] = converted[idx]
+            survivors.append(pos)
+    return survivors
+
+
+class _SingleTupleGetter(object):
+    def __init__(self, get):
+        self.get = get
+
+    def __call__(self, obj):
+        return (self.get(obj),)
+
+
+def _tuple_getter(getter, keys):
+    """
+    Returns operator.itemgetter or operator.attrgetter for given keys,
+    that always returns a tuple.
+    """
+    if len(keys) == 1:
+        return _SingleTupleGetter(getter(keys[0]))
+    elif keys:
+        return getter(*keys)
+    return _empty_tuple
+
+
+def _empty_tuple(obj):
+    return ()
+
+
+def _positions_out_of_bounds(values, min, max, min_inclusive, max_inclusive):
+    if numpy is not None:
+        array = numpy.asarray(values)
+        valid = numpy.ones(len(values), dtype=bool)
+        if min is not None:
+            valid &= (array >= min) if min_inclusive else (array > min)
+        if max is not None:
+            valid &= (array <= max) if max_inclusive else (array < max)
+        return [int(pos) for pos in numpy.flatnonzero(~valid)]
+    # Validity is tested, as it is with numpy, so NaN is out of bounds
+    above_min = operator.ge if min_inclusive else operator.gt
+    below_max = operator.le if max_inclusive else operator.lt
+    return [pos for pos, v in enumerate(values)
+            if (min is not None and not above_min(v, min)) or
+            (max is not None and not below_max(v, max))]
+
+
 class _Mapping(_Compilable):
     def __init__(self, inner_schema,
                  extras=Extras.INHERIT,
@@ -250,6 +843,8 @@ class _Mapping(_Compilable):
         if errors:
             raise MultipleSchemaError(errors)
         self.inner_schema = compiled_inner_schema
+        self._markers_by_name = dict((marker.name, marker)
+                                     for marker in compiled_inner_schema)
         return self
 
     def prepare_data(self, data):
@@ -299,6 +894,19 @@ class _Mapping(_Compilable):
                     errors.append(
                         RequiredInvalid('required field is missing',
                                         [key]))
+        return self._finish(data, result, inclusive, exclusive, errors)
+
+    def _finish(self, data, result, inclusive, exclusive, errors):
+        self._check_monitors(inclusive, exclusive, errors)
+        with aggregate_invalids(errors):
+            self.check_extras(data, result)
+        with aggregate_invalids(errors):
+            result = self.prepare_result(result)
+        if errors:
+            raise MultipleInvalid(errors)
+        return result
+
+    def _check_monitors(self, inclusive, exclusive, errors):
         if inclusive:
             for monitor, values in iteritems(inclusive):
                 missing = self.inclusive_monitors[monitor] - values
@@ -317,19 +925,13 @@ class _Mapping(_Compilable):
                                          ' and only one of them should be '
                                          'present'
                                          % list(values)))
-        with aggregate_invalids(errors):
-            self.check_extras(data, result)
-        with aggregate_invalids(errors):
-            result = self.prepare_result(result)
-        if errors:
-            raise MultipleInvalid(errors)
-        return result
 
 
 class _Compiler(object):
-    def __init__(self, extras, substitutions):
+    def __init__(self, extras, substitutions, definitions=None):
         self.extras = self._validate_extras(extras)
         self.substitutions = self._validate_substitutions(substitutions)
+        self.definitions = definitions
 
     @classmethod
     def _validate_extras(cls, value):
@@ -379,46 +981,1695 @@ class _Compiler(object):
         raise SchemaError('%r is not a valid value in schema' % schema)
 
 
-class Schema(object):
-    """
-    PyDTO main object.
-    """
-    PRIMITIVE_TYPES = (strtype, int, decimal.Decimal, float,
-                       complex, bool)
+_JSON_WHITESPACE = json.decoder.WHITESPACE
+JSONDecodeError = getattr(json.decoder, 'JSONDecodeError', ValueError)
+
+
+def _json_error(message, s, idx):
+    if JSONDecodeError is ValueError:
+        return ValueError('%s: char %d' % (message, idx))
+    return JSONDecodeError(message, s, idx)
+
+
+class _JsonDecoder(object):
+    """
+    Decodes JSON text, converting decoded values with a compiled schema
+    on the fly. Objects and arrays, that correspond to Dict and List nodes,
+    are parsed by the decoder itself, so that values are passed to converters
+    as soon as they are decoded and no intermediate tree is built. Fields,
+    that are removed by Extras.REMOVE, are dropped as soon as they are
+    scanned. All other values are decoded by json module's scanner and passed
+    to the schema node as is.
+
+    Every decode method returns a (result, errors, end) tuple, where errors
+    is a list of Invalid exceptions and end is an index of the first
+    character after the decoded value. Malformed JSON raises ValueError.
+    """
+
+    def __init__(self, limits=None):
+        self.scan_once = json.decoder.JSONDecoder().scan_once
+        # Limits are checked while decoding, with a depth of containers,
+        # that are being decoded, and a number of values left
+        self.limits = limits
+        self.depth = 0
+        self.budget = None if limits is None else limits.max_total_nodes
+
+    def skip_whitespace(self, s, idx):
+        return _JSON_WHITESPACE.match(s, idx).end()
+
+    def decode(self, node, s, idx):
+        char = s[idx:idx + 1]
+        if char == '{' and isinstance(node, Dict):
+            return self.decode_dict(node, s, idx)
+        elif char == '[' and isinstance(node, List) and \
+                not node.columnar and node.sample is None:
+            return self.decode_list(node, s, idx)
+        value, end = self.decode_value(s, idx)
+        try:
+            return node(value), [], end
+        except Exception as e:
+            return None, collect_invalids(e), end
+
+    def decode_value(self, s, idx):
+        try:
+            value, end = self.scan_once(s, idx)
+        except StopIteration as e:
+            raise _json_error('Expecting value', s, e.args[0])
+        if self.limits is not None:
+            self.budget = self.limits.check_nested(value, self.depth,
+                                                   self.budget)
+        return value, end
+
+    def enter(self, size_limit, message):
+        """
+        Checks limits for a container, that is decoded by the decoder
+        itself. Returns a function, that checks its size.
+        """
+        limits = self.limits
+        self.depth += 1
+        if self.budget is not None:
+            self.budget -= 1
+            if self.budget < 0:
+                raise LimitInvalid('data has more than %d values'
+                                   % limits.max_total_nodes)
+        if limits.max_depth is not None and self.depth > limits.max_depth:
+            raise LimitInvalid('data is nested deeper than %d'
+                               % limits.max_depth)
+        max_size = getattr(limits, size_limit)
+
+        def check_size(size):
+            if max_size is not None and size > max_size:
+                raise LimitInvalid(message % max_size)
+        return check_size
+
+    @staticmethod
+    def nested_limit(e, key):
+        e.path = [key] + e.path
+        return e
+
+    def decode_items(self, s, idx, closing, decode_item):
+        idx = self.skip_whitespace(s, idx + 1)
+        if s[idx:idx + 1] == closing:
+            return idx + 1
+        while True:
+            idx = self.skip_whitespace(s, decode_item(s, idx))
+            char = s[idx:idx + 1]
+            if char == closing:
+                return idx + 1
+            elif char != ',':
+                raise _json_error("Expecting ',' delimiter", s, idx)
+            idx = self.skip_whitespace(s, idx + 1)
+
+    def decode_dict(self, node, s, idx):
+        markers = node._markers_by_name
+        values = {}
+        field_errors = {}
+        data = {}
+        limits = self.limits
+        if limits is not None:
+            check_size = self.enter('max_keys',
+                                    'dictionary has more than %d keys')
+            keys = set()
+
+        def decode_field(s, idx):
+            if s[idx:idx + 1] != '"':
+                raise _json_error('Expecting property name enclosed in '
+                                  'double quotes', s, idx)
+            key, idx = json.decoder.scanstring(s, idx + 1)
+            idx = self.skip_whitespace(s, idx)
+            if s[idx:idx + 1] != ':':
+                raise _json_error("Expecting ':' delimiter", s, idx)
+            idx = self.skip_whitespace(s, idx + 1)
+            if limits is not None:
+                keys.add(key)
+                check_size(len(keys))
+                if limits.max_str_len is not None and \
+                        len(key) > limits.max_str_len:
+                    raise LimitInvalid('key is longer than %d'
+                                       % limits.max_str_len)
+                try:
+                    return decode_known(key, s, idx)
+                except LimitInvalid as e:
+                    raise self.nested_limit(e, key)
+            return decode_known(key, s, idx)
+
+        def decode_known(key, s, idx):
+            if key in markers:
+                value, errors, idx = self.decode(
+                    node.inner_schema[markers[key]], s, idx)
+                values[key] = value
+                field_errors[key] = errors
+            elif node.extras == Extras.REMOVE:
+                # The value is dropped right away and never gets into
+                # the result tree
+                idx = self.decode_value(s, idx)[1]
+            else:
+                data[key], idx = self.decode_value(s, idx)
+            return idx
+
+        end = self.decode_items(s, idx, '}', decode_field)
+        if limits is not None:
+            self.depth -= 1
+        result = {}
+        inclusive = defaultdict(set)
+        exclusive = defaultdict(set)
+        errors = []
+        for marker in node.inner_schema:
+            key = marker.name
+            if key in values:
+                if isinstance(marker, Inclusive):
+                    inclusive[marker._monitor].add(key)
+                if isinstance(marker, Exclusive):
+                    exclusive[marker._monitor].add(key)
+                if field_errors[key]:
+                    for e in field_errors[key]:
+                        e.path = [key] + e.path
+                    errors.extend(field_errors[key])
+                else:
+                    result[marker.rename_to or key] = values[key]
+            elif isinstance(marker, Required):
+                errors.append(RequiredInvalid('required field is missing',
+                                              [key]))
+        try:
+            return node._finish(data, result, inclusive, exclusive,
+                                errors), [], end
+        except MultipleInvalid as e:
+            return None, e.errors, end
+
+    def decode_list(self, node, s, idx):
+        result = []
+        errors = []
+        limits = self.limits
+        if limits is not None:
+            check_size = self.enter('max_list_len', 'list is longer than %d')
+
+        def decode_element(s, idx):
+            if limits is not None:
+                check_size(len(result) + 1)
+                try:
+                    value, element_errors, idx = self.decode(
+                        node.inner_schema, s, idx)
+                except LimitInvalid as e:
+                    raise self.nested_limit(e, len(result))
+            else:
+                value, element_errors, idx = self.decode(node.inner_schema,
+                                                         s, idx)
+            for e in element_errors:
+                e.path = [len(result)] + e.path
+            errors.extend(element_errors)
+            result.append(value)
+            return idx
+
+        end = self.decode_items(s, idx, ']', decode_element)
+        if limits is not None:
+            self.depth -= 1
+        if errors:
+            return None, errors, end
+        return result, [], end
+
+    def iterdecode(self, node, fp, chunk_size):
+        """
+        Decodes elements of a top-level JSON array one by one with inner
+        schema of a List node, reading a file by chunks. Yields results of
+        valid elements and MultipleInvalid exceptions for invalid ones.
+        """
+        stream = _JsonStream(fp, chunk_size)
+        if stream.peek() != '[':
+            raise MultipleInvalid([ListInvalid('expected a JSON array')])
+        stream.idx += 1
+        if self.limits is not None:
+            check_size = self.limit_errors(self.enter)(
+                'max_list_len', 'list is longer than %d')
+        if stream.peek() == ']':
+            stream.idx += 1
+        else:
+            index = 0
+            while True:
+                stream.peek()
+                if self.limits is not None:
+                    self.limit_errors(check_size)(index + 1)
+                    value, errors = self.limit_errors(
+                        self.decode_from_stream, [index])(node.inner_schema,
+                                                          stream)
+                else:
+                    value, errors = self.decode_from_stream(
+                        node.inner_schema, stream)
+                if errors:
+                    for e in errors:
+                        e.path = [index] + e.path
+                    yield MultipleInvalid(errors)
+                else:
+                    yield value
+                index += 1
+                char = stream.peek()
+                stream.idx += 1
+                if char == ']':
+                    break
+                elif char != ',':
+                    stream.idx -= 1
+                    raise stream.error("Expecting ',' delimiter")
+        if stream.peek():
+            raise stream.error('Extra data')
+
+    @staticmethod
+    def limit_errors(f, path=None):
+        """
+        Returns a function, that raises MultipleInvalid, when f exceeds
+        limits.
+        """
+        def call(*args):
+            try:
+                return f(*args)
+            except LimitInvalid as e:
+                raise MultipleInvalid(collect_invalids(e, path))
+        return call
+
+    def decode_from_stream(self, node, stream):
+        # A value is decoded again after more data is read, if it is not
+        # complete or if it isn't followed by a delimiter of array elements
+        # in the buffer (a number could continue in the next chunk: "1."
+        # is scanned as 1)
+        depth = self.depth
+        budget = self.budget
+        while True:
+            self.depth = depth
+            self.budget = budget
+            try:
+                value, errors, end = self.decode(node, stream.buffer,
+                                                 stream.idx)
+                following = self.skip_whitespace(stream.buffer, end)
+                if stream.buffer[following:following + 1] in (',', ']') or \
+                        stream.eof:
+                    stream.idx = end
+                    return value, errors
+            except ValueError:
+                if stream.eof:
+                    raise
+            stream.read(len(stream.buffer) - stream.idx)
+
+    def loads(self, node, s):
+        if not isinstance(s, strtype):
+            s = s.decode('utf-8')
+        idx = self.skip_whitespace(s, 0)
+        if self.limits is not None:
+            result, errors, end = self.limit_errors(self.decode)(node, s, idx)
+        else:
+            result, errors, end = self.decode(node, s, idx)
+        end = self.skip_whitespace(s, end)
+        if end != len(s):
+            raise _json_error('Extra data', s, end)
+        if errors:
+            raise MultipleInvalid(errors)
+        return result
+
+
+def _view(node, data, path):
+    """
+    Returns a lazy view for Dict and List nodes and a converted value
+    for other nodes.
+    """
+    try:
+        if type(node) is Dict:
+            return DictView(node, data, path)
+        elif type(node) is List and not node.columnar and \
+                node.sample is None:
+            return ListView(node, data, path)
+        return node(data)
+    except Exception as e:
+        raise MultipleInvalid(collect_invalids(e, path[:]))
+
+
+def _materialize(node, data, path):
+    try:
+        return node(data)
+    except Exception as e:
+        raise MultipleInvalid(collect_invalids(e, path[:]))
+
+
+class DictView(Mapping):
+    """
+    A read-only view of a dictionary, validated by a Dict node. Presence of
+    required fields, mutually inclusive and exclusive fields and unknown
+    fields are checked when the view is created. Values are converted on the
+    first access and then cached. Nested dictionaries and lists are returned
+    as views too. See Schema.view.
+    """
+
+    def __init__(self, node, data, path=None):
+        self._node = node
+        self._path = path or []
+        if not isinstance(data, dict):
+            raise DictInvalid('expected a dictionary, got %r instead'
+                              % data)
+        self._data = data
+        self._markers = {}
+        self._cache = {}
+        inclusive = defaultdict(set)
+        exclusive = defaultdict(set)
+        errors = []
+        for marker in node.inner_schema:
+            key = marker.name
+            if key in data:
+                self._markers[marker.rename_to or key] = marker
+                if isinstance(marker, Inclusive):
+                    inclusive[marker._monitor].add(key)
+                if isinstance(marker, Exclusive):
+                    exclusive[marker._monitor].add(key)
+            elif isinstance(marker, Required):
+                errors.append(RequiredInvalid('required field is missing',
+                                              [key]))
+        unknown = dict((key, value) for key, value in iteritems(data)
+                       if key not in node._markers_by_name)
+        self._extras = node._finish(unknown, {}, inclusive, exclusive,
+                                    errors)
+
+    def __getitem__(self, key):
+        if key in self._extras:
+            return self._extras[key]
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        marker = self._markers[key]
+        value = self._cache[key] = _view(self._node.inner_schema[marker],
+                                         self._data[marker.name],
+                                         self._path + [marker.name])
+        return value
+
+    def __iter__(self):
+        for key in self._markers:
+            if key not in self._extras:
+                yield key
+        for key in self._extras:
+            yield key
+
+    def __len__(self):
+        return len(self._markers) + len(
+            [key for key in self._extras if key not in self._markers])
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self._data)
+
+    def materialize(self):
+        """
+        Validates and converts the whole dictionary.
+        """
+        return _materialize(self._node, self._data, self._path)
+
+
+class ListView(Sequence):
+    """
+    A read-only view of a list, validated by a List node. Elements are
+    converted on the first access and then cached. See Schema.view.
+    """
+
+    def __init__(self, node, data, path=None):
+        self._node = node
+        self._path = path or []
+        if not isinstance(data, list):
+            raise ListInvalid('expected a list, got %r instead'
+                              % type(data))
+        self._data = data
+        self._cache = {}
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self._data)))]
+        if idx < 0:
+            idx += len(self._data)
+        if not 0 <= idx < len(self._data):
+            raise IndexError('list index out of range')
+        try:
+            return self._cache[idx]
+        except KeyError:
+            pass
+        value = self._cache[idx] = _view(self._node.inner_schema,
+                                         self._data[idx], self._path + [idx])
+        return value
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self._data)
+
+    def materialize(self):
+        """
+        Validates and converts the whole list.
+        """
+        return _materialize(self._node, self._data, self._path)
+
+
+class _JsonEncoder(object):
+    """
+    Encodes objects into JSON text with a compiled schema, without building
+    intermediate dictionaries: fields of FromObject nodes are converted and
+    written one by one with JSON-encoded keys, prepared once per node.
+    Elements of List nodes are written one by one too. Results of other
+    nodes are encoded with json module. The output is the same as
+    json.dumps(schema(data)) output.
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self.encode_text = json.encoder.encode_basestring_ascii
+        self.encoder = json.JSONEncoder()
+        self.encoding_error = None
+
+    def dump(self, node, data):
+        """
+        Validation errors are raised as MultipleInvalid. If data is valid,
+        but some values cannot be encoded into JSON, the same exception as
+        json.dumps would raise is raised.
+        """
+        try:
+            self.encode(node, data)
+        except MultipleInvalid:
+            raise
+        except Invalid as e:
+            raise MultipleInvalid([e])
+        except Exception as e:
+            raise MultipleInvalid([Invalid(str(e))])
+        if self.encoding_error is not None:
+            raise self.encoding_error
+
+    def encode(self, node, data):
+        if isinstance(node, FromObject):
+            self.encode_object(node, data)
+        elif isinstance(node, List) and not node.columnar and \
+                node.sample is None and isinstance(data, list):
+            self.encode_list(node, data)
+        else:
+            self.encode_value(node(data))
+
+    def encode_object(self, node, data):
+        write = self.write
+        encode_value = self.encode_value
+        errors = []
+        present = []
+        first = True
+        for marker, key, encoded_keys, converter, is_leaf in \
+                node._encoding_plan:
+            try:
+                value = getattr(data, key)
+            except AttributeError:
+                if isinstance(marker, Required):
+                    errors.append(RequiredInvalid('required field is missing',
+                                                  [key]))
+                continue
+            present.append(marker)
+            write(encoded_keys[first])
+            first = False
+            try:
+                if is_leaf:
+                    encode_value(converter(value))
+                else:
+                    self.encode(converter, value)
+            except Exception as e:
+                errors.extend(collect_invalids(e, [key]))
+        write('{}' if first else '}')
+        if errors or node.inclusive_monitors or node.exclusive_monitors:
+            inclusive = defaultdict(set)
+            exclusive = defaultdict(set)
+            for marker in present:
+                if isinstance(marker, Inclusive):
+                    inclusive[marker._monitor].add(marker.name)
+                if isinstance(marker, Exclusive):
+                    exclusive[marker._monitor].add(marker.name)
+            node._finish(data, {}, inclusive, exclusive, errors)
+
+    def encode_list(self, node, data):
+        write = self.write
+        errors = []
+        inner_schema = node.inner_schema
+        if self.is_leaf(inner_schema):
+            encode = lambda value: self.encode_value(inner_schema(value))
+        else:
+            encode = lambda value: self.encode(inner_schema, value)
+        write('[')
+        for idx, value in enumerate(data):
+            if idx:
+                write(', ')
+            try:
+                encode(value)
+            except Exception as e:
+                errors.extend(collect_invalids(e, [idx]))
+        write(']')
+        if errors:
+            raise MultipleInvalid(errors)
+
+    @staticmethod
+    def is_leaf(node):
+        return not isinstance(node, (FromObject, List))
+
+    def encode_value(self, value):
+        value_type = type(value)
+        if value_type is str:
+            self.write(self.encode_text(value))
+        elif value is None:
+            self.write('null')
+        elif value is True:
+            self.write('true')
+        elif value is False:
+            self.write('false')
+        elif value_type is int:
+            self.write(int.__repr__(value))
+        else:
+            try:
+                self.write(self.encoder.encode(value))
+            except (TypeError, ValueError) as e:
+                if self.encoding_error is None:
+                    self.encoding_error = e
+
+
+class _JsonStream(object):
+    """
+    A buffer over a file-like object, that is read by chunks. Text files
+    are read as is, binary files are decoded as UTF-8. Already consumed
+    data is dropped from the buffer when more data is read.
+    """
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.idx = 0
+        self.eof = False
+        self.text_decoder = None
+
+    def read(self, size=None):
+        """
+        Reads at least size characters more into the buffer.
+        Returns False if the end of file was reached.
+        """
+        chunks = [self.buffer[self.idx:]]
+        self.idx = 0
+        read = 0
+        while not self.eof and read < (size or self.chunk_size):
+            chunk = self.fp.read(max(size or 0, self.chunk_size))
+            if not chunk:
+                self.eof = True
+            if not isinstance(chunk, strtype):
+                if self.text_decoder is None:
+                    self.text_decoder = \
+                        codecs.getincrementaldecoder('utf-8')()
+                chunk = self.text_decoder.decode(chunk, self.eof)
+            read += len(chunk)
+            chunks.append(chunk)
+        self.buffer = ''.join(chunks)
+        return read > 0
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character or an empty string
+        at the end of file.
+        """
+        while True:
+            self.idx = _JSON_WHITESPACE.match(self.buffer, self.idx).end()
+            if self.idx < len(self.buffer) or not self.read():
+                return self.buffer[self.idx:self.idx + 1]
+
+    def error(self, message):
+        return _json_error(message, self.buffer, self.idx)
+
+
+def _describe_schema(node, stack=()):
+    """
+    Returns a string, that describes a structure of a compiled schema.
+    It is used to make sure, that packed data is unpacked with the same
+    schema.
+    """
+    if id(node) in stack:
+        return '<recursion>'
+    stack += (id(node),)
+    if isinstance(node, _Adaptive):
+        return _describe_schema(node.converter, stack)
+    if isinstance(node, _Mapping):
+        return '%s(%s){%s}' % (
+            type(node).__name__, node.extras,
+            ','.join('%s(%r,%r):%s' % (type(marker).__name__, marker.name,
+                                      marker.rename_to,
+                                      _describe_schema(
+                                          node.inner_schema[marker], stack))
+                     for marker in _sorted_markers(node)))
+    elif isinstance(node, List):
+        return 'List(%s)' % _describe_schema(node.inner_schema, stack)
+    elif isinstance(node, FixedList):
+        return 'FixedList(%s)' % ','.join(_describe_schema(n, stack)
+                                          for n in node.inner_schemas)
+    elif isinstance(node, Enum):
+        return 'Enum(%s)' % ','.join(_describe_schema(v, stack)
+                                     for v in _sorted_enum_values(node))
+    elif isinstance(node, Literal):
+        return 'Literal(%r)' % (node.value,)
+    elif isinstance(node, Chain):
+        return 'Chain(%s)' % ','.join(_describe_schema(f, stack)
+                                      for f in node.validators)
+    elif isinstance(node, (NotNone, Nullable)):
+        return '%s(%s)' % (type(node).__name__,
+                           _describe_schema(node._f, stack))
+    elif isinstance(node, Union):
+        return 'Union(%r,%s,%s)' % (
+            node.discriminator,
+            ','.join('%r:%s' % (tag, _describe_schema(node.variants[tag],
+                                                      stack))
+                     for tag in sorted(node.variants, key=repr)),
+            _describe_schema(node.fallback, stack))
+    return getattr(node, '__name__', type(node).__name__)
+
+
+def _sorted_markers(node):
+    return sorted(node.inner_schema, key=lambda marker: marker.name)
+
+
+def _sorted_enum_values(node):
+    return sorted(node.values,
+                  key=lambda v: (type(v.value).__name__, repr(v.value)))
+
+
+try:
+    _RecursionError = RecursionError
+except NameError:
+    # Python 2
+    _RecursionError = RuntimeError
+
+
+class _BinaryCodec(object):
+    """
+    Packs results of a compiled schema into a compact binary form, using
+    the schema as a template. Dictionaries, that correspond to Dict nodes,
+    are packed without key names (result names of fields) as a bitmap of
+    present fields followed by their values (fields are ordered by name),
+    values of Enum nodes are packed as indexes, elements of FixedList nodes
+    are packed without a length. Other values are packed with one byte type
+    tags, numbers and datetimes are packed with struct. Packed data starts
+    with a header, containing a fingerprint of the schema.
+    """
+
+    MAGIC = b'PD\x01'
+    (NONE, TRUE, FALSE, INT, BIG_INT, FLOAT, DECIMAL, TEXT, BYTES, LIST, MAP,
+     DICT, SCHEMA_LIST, FIXED_LIST, ENUM, DATETIME) = range(16)
+    INT64 = struct.Struct('<q')
+    FLOAT64 = struct.Struct('<d')
+    DATETIME64 = struct.Struct('<HBBBBBI')
+    FINGERPRINT = struct.Struct('<I')
+
+    def __init__(self, node):
+        self.node = node
+        fingerprint = zlib.crc32(_describe_schema(node).encode('utf-8'))
+        self.header = self.MAGIC + self.FINGERPRINT.pack(
+            fingerprint & 0xffffffff)
+        self.markers = {}
+        self.names = {}
+        self.enum_values = {}
+        self.enum_indexes = {}
+        self.node_types = {self.DICT: Dict, self.SCHEMA_LIST: List,
+                           self.FIXED_LIST: FixedList, self.ENUM: Enum}
+
+    def sorted_markers(self, node):
+        try:
+            return self.markers[id(node)]
+        except KeyError:
+            markers = self.markers[id(node)] = _sorted_markers(node)
+            self.names[id(node)] = set(m.rename_to for m in markers)
+            return markers
+
+    def enum_index(self, node):
+        try:
+            return self.enum_indexes[id(node)]
+        except KeyError:
+            values = self.enum_values[id(node)] = [
+                v.value for v in _sorted_enum_values(node)]
+            indexes = self.enum_indexes[id(node)] = dict(
+                ((type(v), v), idx) for idx, v in enumerate(values))
+            return indexes
+
+    def pack(self, data):
+        buf = bytearray(self.header)
+        self.encode(self.node, data, buf)
+        return bytes(buf)
+
+    def encode(self, node, data, buf):
+        if isinstance(node, Dict) and isinstance(data, dict):
+            present = []
+            bitmap = 0
+            for idx, marker in enumerate(self.sorted_markers(node)):
+                if marker.rename_to in data:
+                    present.append(marker)
+                    bitmap |= 1 << idx
+            buf.append(self.DICT)
+            self.encode_uint(bitmap, buf)
+            for marker in present:
+                self.encode(node.inner_schema[marker], data[marker.rename_to],
+                            buf)
+            names = self.names[id(node)]
+            extras = [key for key in data if key not in names]
+            self.encode_uint(len(extras), buf)
+            for key in extras:
+                self.encode_value(key, buf)
+                self.encode_value(data[key], buf)
+        elif isinstance(node, List) and isinstance(data, list):
+            buf.append(self.SCHEMA_LIST)
+            self.encode_uint(len(data), buf)
+            for value in data:
+                self.encode(node.inner_schema, value, buf)
+        elif isinstance(node, FixedList) and isinstance(data, list) and \
+                len(data) == len(node.inner_schemas):
+            buf.append(self.FIXED_LIST)
+            for inner_schema, value in zip(node.inner_schemas, data):
+                self.encode(inner_schema, value, buf)
+        elif isinstance(node, Enum):
+            try:
+                idx = self.enum_index(node).get((type(data), data))
+            except TypeError:
+                idx = None
+            if idx is None:
+                self.encode_value(data, buf)
+            else:
+                buf.append(self.ENUM)
+                self.encode_uint(idx, buf)
+        else:
+            self.encode_value(data, buf)
+
+    def encode_value(self, data, buf):
+        if data is None:
+            buf.append(self.NONE)
+        elif data is True:
+            buf.append(self.TRUE)
+        elif data is False:
+            buf.append(self.FALSE)
+        elif isinstance(data, int):
+            if -2 ** 63 <= data < 2 ** 63:
+                buf.append(self.INT)
+                buf += self.INT64.pack(data)
+            else:
+                buf.append(self.BIG_INT)
+                self.encode_bytes(str(data).encode('ascii'), buf)
+        elif isinstance(data, float):
+            buf.append(self.FLOAT)
+            buf += self.FLOAT64.pack(data)
+        elif isinstance(data, decimal.Decimal):
+            buf.append(self.DECIMAL)
+            self.encode_bytes(str(data).encode('ascii'), buf)
+        elif isinstance(data, datetime) and data.tzinfo is None:
+            buf.append(self.DATETIME)
+            buf += self.DATETIME64.pack(data.year, data.month, data.day,
+                                        data.hour, data.minute, data.second,
+                                        data.microsecond)
+        elif isinstance(data, bytes) and not isinstance(data, strtype):
+            buf.append(self.BYTES)
+            self.encode_bytes(data, buf)
+        elif isinstance(data, strtype):
+            buf.append(self.TEXT)
+            self.encode_bytes(data.encode('utf-8'), buf)
+        elif isinstance(data, (list, tuple)):
+            buf.append(self.LIST)
+            self.encode_uint(len(data), buf)
+            for value in data:
+                self.encode_value(value, buf)
+        elif isinstance(data, dict):
+            buf.append(self.MAP)
+            self.encode_uint(len(data), buf)
+            for key, value in iteritems(data):
+                self.encode_value(key, buf)
+                self.encode_value(value, buf)
+        else:
+            raise TypeError('%r cannot be packed' % (data,))
+
+    def encode_uint(self, value, buf):
+        while value > 0x7f:
+            buf.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buf.append(value)
+
+    def encode_bytes(self, value, buf):
+        self.encode_uint(len(value), buf)
+        buf += value
+
+    def unpack(self, data):
+        data = bytearray(data)
+        if data[:len(self.header)] != self.header:
+            if data[:len(self.MAGIC)] == self.MAGIC:
+                raise ValueError('data was packed with another schema')
+            raise ValueError('not a packed data')
+        try:
+            value, pos = self.decode(self.node, data, len(self.header))
+        except (IndexError, OverflowError, ValueError, struct.error,
+                decimal.InvalidOperation, _RecursionError):
+            # Data is truncated, has wrong values or is nested too deeply
+            raise ValueError('packed data is corrupted')
+        if pos != len(data):
+            raise ValueError('packed data is corrupted')
+        return value
+
+    def decode(self, node, data, pos):
+        tag = data[pos]
+        # Schema tags of corrupted data may not match schema nodes
+        if tag in self.node_types and \
+                not isinstance(node, self.node_types[tag]):
+            raise ValueError('packed data is corrupted')
+        if tag == self.DICT:
+            markers = self.sorted_markers(node)
+            bitmap, pos = self.decode_uint(data, pos + 1)
+            result = {}
+            for idx, marker in enumerate(markers):
+                if bitmap & (1 << idx):
+                    result[marker.rename_to], pos = self.decode(
+                        node.inner_schema[marker], data, pos)
+            count, pos = self.decode_uint(data, pos)
+            for _ in range(count):
+                key, pos = self.decode_key(data, pos)
+                result[key], pos = self.decode_value(data, pos)
+            return result, pos
+        elif tag == self.SCHEMA_LIST:
+            count, pos = self.decode_uint(data, pos + 1)
+            result = []
+            for _ in range(count):
+                value, pos = self.decode(node.inner_schema, data, pos)
+                result.append(value)
+            return result, pos
+        elif tag == self.FIXED_LIST:
+            pos += 1
+            result = []
+            for inner_schema in node.inner_schemas:
+                value, pos = self.decode(inner_schema, data, pos)
+                result.append(value)
+            return result, pos
+        elif tag == self.ENUM:
+            idx, pos = self.decode_uint(data, pos + 1)
+            self.enum_index(node)
+            return self.enum_values[id(node)][idx], pos
+        return self.decode_value(data, pos)
+
+    def decode_value(self, data, pos):
+        tag = data[pos]
+        pos += 1
+        if tag == self.NONE:
+            return None, pos
+        elif tag == self.TRUE:
+            return True, pos
+        elif tag == self.FALSE:
+            return False, pos
+        elif tag == self.INT:
+            return self.INT64.unpack_from(data, pos)[0], pos + 8
+        elif tag == self.FLOAT:
+            return self.FLOAT64.unpack_from(data, pos)[0], pos + 8
+        elif tag == self.TEXT:
+            value, pos = self.decode_bytes(data, pos)
+            return value.decode('utf-8'), pos
+        elif tag == self.BYTES:
+            value, pos = self.decode_bytes(data, pos)
+            return bytes(value), pos
+        elif tag == self.BIG_INT:
+            value, pos = self.decode_bytes(data, pos)
+            return int(value.decode('ascii')), pos
+        elif tag == self.DECIMAL:
+            value, pos = self.decode_bytes(data, pos)
+            return decimal.Decimal(value.decode('ascii')), pos
+        elif tag == self.LIST:
+            count, pos = self.decode_uint(data, pos)
+            result = []
+            for _ in range(count):
+                value, pos = self.decode_value(data, pos)
+                result.append(value)
+            return result, pos
+        elif tag == self.MAP:
+            count, pos = self.decode_uint(data, pos)
+            result = {}
+            for _ in range(count):
+                key, pos = self.decode_key(data, pos)
+                result[key], pos = self.decode_value(data, pos)
+            return result, pos
+        elif tag == self.DATETIME:
+            return datetime(*self.DATETIME64.unpack_from(data, pos)), \
+                pos + self.DATETIME64.size
+        raise ValueError('packed data is corrupted')
+
+    def decode_key(self, data, pos):
+        key, pos = self.decode_value(data, pos)
+        try:
+            hash(key)
+        except TypeError:
+            raise ValueError('packed data is corrupted')
+        return key, pos
+
+    def decode_uint(self, data, pos):
+        value = 0
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, pos
+            shift += 7
+
+    def decode_bytes(self, data, pos):
+        length, pos = self.decode_uint(data, pos)
+        if pos + length > len(data):
+            raise IndexError()
+        return data[pos:pos + length], pos + length
+
+
+def _schema_compiler(extras, definitions=None):
+    return _Compiler(extras, substitutions={
+        tuple: Chain.from_iterable,
+        dict: Dict,
+        list: FixedList.from_iterable,
+        set: Enum.from_iterable,
+        PRIMITIVE_TYPES: Literal
+    }, definitions=definitions)
+
+
+class Schema(object):
+    """
+    PyDTO main object.
+    """
+    PRIMITIVE_TYPES = (strtype, int, decimal.Decimal, float,
+                       complex, bool)
+    # Projected schemas are compiled for this many recently used sets of
+    # paths, so arbitrary only arguments don't grow memory unboundedly
+    MAX_PROJECTIONS = 128
+
+    def __init__(self, schema, extras=Extras.PREVENT, limits=None,
+                 iterative=False, definitions=None, adaptive=None,
+                 inplace=False, cache=None, executor=None):
+        """
+        :param schema: a schema definition
+        :param extras: a strategy to deal with extra fields. One of Extras
+        values, except Extras.INHERIT.
+        :param limits: Limits of incoming data
+        :param iterative: walk dictionaries and lists (also inside of
+        Nullable, NotNone and Chain) with an explicit stack instead of
+        recursive calls. Results and errors are the same, but data of any
+        depth can be validated and deeply nested data is validated faster:
+
+        >>> inner = {Required('value'): int}
+        >>> schema = Schema({Required('children'): List(inner)},
+        ...                 iterative=True)
+        >>> assert {'children': [{'value': 1}]} == schema(
+        ...     {'children': [{'value': '1'}]})
+
+        :param definitions: a dictionary of named schemas or an instance of
+        Definitions. Named schemas are referenced with Ref.
+        :param adaptive: a number of values, after which fields specialise
+        to the type of values, that they have received most often. See
+        adaptive_stats.
+        :param inplace: convert values inside of incoming dictionaries and
+        lists instead of building new ones. Fields are renamed and extras
+        are removed in place too, and the incoming object is returned.
+        Dictionaries and lists are walked without recursion, as with
+        iterative. If data is invalid, it is left partially converted:
+        valid fields are converted and renamed, invalid fields keep their
+        values, unless other fields are renamed to their names. Elements
+        of columnar and sampled lists are replaced with new objects, and
+        such lists are left intact, if they are invalid.
+
+        >>> schema = Schema({Required('n', rename_to='count'): int},
+        ...                 inplace=True)
+        >>> data = {'n': '1'}
+        >>> assert schema(data) is data
+        >>> assert {'count': 1} == data
+
+        :param cache: a Cache of results. It can't be used with inplace or
+        shared with other schemas.
+        :param executor: an executor (e.g. ThreadPoolExecutor), that runs
+        Blocking converters concurrently in schema calls (loads and
+        iter_json don't use it). It isn't pickled.
+        """
+        if extras == Extras.INHERIT:
+            raise SchemaError('top Schema level extras cannot be inherited')
+        if limits is not None and not isinstance(limits, Limits):
+            raise SchemaError('limits should be an instance of Limits')
+        if cache is not None and not isinstance(cache, Cache):
+            raise SchemaError('cache should be an instance of Cache')
+        if cache is not None and inplace:
+            raise SchemaError('cache cannot be used with inplace')
+        if cache is not None and cache._attached:
+            raise SchemaError('cache is already used by another schema')
+        if executor is not None and not callable(
+                getattr(executor, 'submit', None)):
+            raise SchemaError('executor should have a submit method')
+        if isinstance(definitions, dict):
+            definitions = Definitions(definitions, extras)
+        elif definitions is not None and \
+                not isinstance(definitions, Definitions):
+            raise SchemaError('definitions should be a dictionary or '
+                              'an instance of Definitions')
+        self.limits = limits
+        self.iterative = iterative
+        self.inplace = inplace
+        self.cache = cache
+        self.executor = executor
+        schema = _schema_compiler(extras, definitions).compile(schema)
+        self._unoptimized = _format_schema(schema)
+        # Named schemas are optimised once by their registry
+        self.schema = _Optimizer(
+            None if definitions is None else definitions._optimizer
+        ).optimize(schema)
+        if adaptive is not None:
+            if not isinstance(adaptive, int) or adaptive < 1:
+                raise SchemaError('adaptive should be a positive integer')
+            if definitions is not None:
+                # Adaptive fields are installed in place, while nodes of
+                # named schemas are shared with other schemas
+                self.schema = _copy_schema(self.schema)
+            self._adaptive = _Adaptive.install(self.schema, adaptive)
+        else:
+            self._adaptive = []
+        self._codec = None
+        self._projector = None
+        self._projections = OrderedDict()
+        self._row_builders = None
+        # Elements of sampled lists, that can't be projected, are found
+        # before any data is validated
+        for node in _iter_nodes(self.schema):
+            if type(node) is List and node.sample is not None:
+                node.prepare_sampling()
+        if cache is not None:
+            cache._attached = True
+
+    def __getstate__(self):
+        # The codec caches its tables by node ids, that are only valid
+        # in the current process, the projector consists of closures,
+        # executors can't be shared between processes
+        state = self.__dict__.copy()
+        state['executor'] = None
+        state['_codec'] = None
+        state['_projector'] = None
+        state['_row_builders'] = None
+        return state
+
+    def __call__(self, data, only=None):
+        """
+        Validates and converts data. A list of dotted paths of result
+        fields can be passed as only argument. Other fields are checked for
+        presence, but are neither converted nor included into the result.
+        Elements of lists are selected with *:
+
+        >>> schema = Schema({
+        ...     Required('id'): int,
+        ...     Required('name'): str,
+        ...     Required('items', rename_to='lines'): List({
+        ...         Required('price'): parse_decimal,
+        ...         Optional('note'): str
+        ...     })
+        ... })
+        >>> data = {'id': '1', 'name': 'x',
+        ...         'items': [{'price': '1.5', 'note': 'y'}]}
+        >>> assert {'id': 1, 'lines': [{'price': decimal.Decimal('1.5')}]} \\
+        ...     == schema(data, only=['id', 'lines.*.price'])
+        >>> try:
+        ...     schema({'id': '1'}, only=['id'])
+        ...     assert False, "an exception should've been raised"
+        ... except MultipleInvalid as e:
+        ...     assert [['items'], ['name']] == sorted(
+        ...         e.path for e in e.errors)
+        """
+        if only is not None:
+            schema = self._get_projection(only)
+        else:
+            schema = self.schema
+        if self.cache is not None:
+            # Oversized data is rejected before it is hashed
+            if self.limits is not None:
+                self._check_limits(data)
+            return self.cache.call(
+                ('data', None if only is None else frozenset(only)), data,
+                lambda data: self._validate(schema, data, False))
+        return self._validate(schema, data)
+
+    def _get_projection(self, only):
+        key = frozenset(only)
+        projections = self._projections
+        schema = projections.pop(key, None)
+        if schema is None:
+            schema = _project(self.schema, _parse_projection(only))
+        projections[key] = schema
+        while len(projections) > self.MAX_PROJECTIONS:
+            projections.popitem(last=False)
+        return schema
+
+    def _check_limits(self, data):
+        try:
+            self.limits.check(data)
+        except Invalid as e:
+            raise MultipleInvalid([e])
+
+    def _validate(self, schema, data, check_limits=True):
+        try:
+            if check_limits and self.limits is not None:
+                self.limits.check(data)
+            if self.executor is not None:
+                return self._run_prefetched(schema, data)
+            return self._run(schema, data)
+        except MultipleInvalid:
+            raise
+        except Invalid as e:
+            raise MultipleInvalid([e])
+        except Exception as e:
+            raise MultipleInvalid([Invalid(str(e))])
+
+    def _run(self, schema, data):
+        if self.inplace:
+            return _walk(schema, data, _INPLACE_WALKERS)
+        if self.iterative:
+            return _walk(schema, data)
+        return schema(data)
+
+    def _run_prefetched(self, schema, data):
+        table = _prefetch(schema, data, self.executor)
+        if not table:
+            return self._run(schema, data)
+        previous = getattr(_prefetched, 'table', None)
+        _prefetched.table = table
+        try:
+            return self._run(schema, data)
+        finally:
+            _prefetched.table = previous
+            for value, future in table.values():
+                future.cancel()
+
+    def _get_row_builders(self):
+        if self._row_builders is None:
+            node = self.schema
+            if type(node) is List:
+                node = node.inner_schema
+            if getattr(node, 'table', None) is None:
+                raise SchemaError('rows can be built only by Dict or List '
+                                  'of Dict schemas with tables')
+            builders = []
+            _RowBuilder(node, None, builders)
+            self._row_builders = builders
+        return self._row_builders
+
+    def tables(self):
+        """
+        Returns an ordered dictionary, that maps names of tables to tuples
+        of their columns. Parent tables go before their children. Columns
+        are generated key and parent key columns (if any), followed by
+        fields in the order of their result names.
+        """
+        return OrderedDict((builder.table.name, builder.columns)
+                           for builder in self._get_row_builders())
+
+    def to_rows(self, data, batch_size=None, keys=None):
+        """
+        Validates data and converts it into rows of tables, that are given
+        to Dicts of the schema. Rows are built directly, without building
+        result dictionaries. Returns a generator of batches: dictionaries,
+        that map names of tables to lists of row tuples (see tables for
+        their columns):
+
+        >>> schema = Schema(List(Dict({
+        ...     Required('id'): int,
+        ...     Required('items'): List(Dict({
+        ...         Required('sku'): str,
+        ...         Required('qty'): int,
+        ...     }, table=Table('items', key='id', parent_key='order_id')))
+        ... }, table=Table('orders', key='id'))))
+        >>> assert {'orders': ('id',),
+        ...         'items': ('id', 'order_id', 'qty', 'sku')} == dict(
+        ...     (name, columns) for name, columns in schema.tables().items())
+        >>> batches = list(schema.to_rows([
+        ...     {'id': '7', 'items': [{'sku': 'a', 'qty': '1'},
+        ...                           {'sku': 'b', 'qty': '2'}]}]))
+        >>> assert [{'orders': [(7,)],
+        ...          'items': [(1, 7, 1, 'a'), (2, 7, 2, 'b')]}] == batches
+
+        Fields, that contain nested tables, are not columns. Other nested
+        dictionaries and lists are column values. If the schema is a List,
+        data can be any iterable of dictionaries, and batches are yielded
+        as soon as they have at least batch_size rows. A batch contains
+        either all rows of a dictionary or none of them, so parents and
+        their children are always in the same batch. The first invalid
+        dictionary raises MultipleInvalid with its index at the beginning of
+        error paths; batches of previous dictionaries have been yielded by
+        then.
+
+        :param data: a dictionary or an iterable of dictionaries
+        :param batch_size: a minimal number of rows in batches. All rows
+        are yielded in one batch, if it is None.
+        :param keys: a dictionary, that maps names of tables to the first
+        generated keys. Generated keys start with 1 by default.
+        """
+        builders = self._get_row_builders()
+        builder = builders[0]
+        keys = keys or {}
+        counters = dict((b.table.name, itertools.count(keys.get(b.table.name,
+                                                                1)))
+                        for b in builders if b.generated)
+        many = type(self.schema) is List
+        if many:
+            if isinstance(data, dict):
+                raise MultipleInvalid([ListInvalid(
+                    'expected a list, got %r instead' % type(data))])
+            documents = data
+        else:
+            documents = [data]
+        batch = OrderedDict((b.table.name, []) for b in builders)
+        size = 0
+        for idx, document in enumerate(documents):
+            path = [idx] if many else []
+            rows = defaultdict(list)
+            try:
+                if self.limits is not None:
+                    self.limits.check(document)
+                builder.build(document, None, rows, counters)
+            except Exception as e:
+                raise MultipleInvalid(collect_invalids(e, path))
+            for name, table_rows in iteritems(rows):
+                batch[name].extend(table_rows)
+                size += len(table_rows)
+            if batch_size is not None and size >= batch_size:
+                yield batch
+                batch = OrderedDict((b.table.name, []) for b in builders)
+                size = 0
+        if size or batch_size is None:
+            yield batch
+
+    def generate(self, n=None, seed=None, invalid_ratio=0.0, generators=None,
+                 max_list_len=5, max_depth=5):
+        """
+        Returns a generator of synthetic data for the schema. A share of
+        records, that is given by invalid_ratio, is made invalid by
+        removing required fields, adding unknown fields or replacing
+        values with ones, that converters reject:
+
+        >>> schema = Schema({
+        ...     Required('id'): Chain(int, Range(min=1, max=100)),
+        ...     Required('kind'): Enum('a', 'b'),
+        ...     Optional('tags'): List(Chain(str, Length(min=1, max=3))),
+        ...     Required('at'): ParseDateTime('%Y-%m-%d'),
+        ... })
+        >>> records = list(schema.generate(1000, seed=1, invalid_ratio=0.2))
+        >>> results = []
+        >>> for record in records:
+        ...     try:
+        ...         results.append(schema(record))
+        ...     except MultipleInvalid:
+        ...         pass
+        >>> assert 750 < len(results) < 850
+        >>> assert records == list(schema.generate(1000, seed=1,
+        ...                                        invalid_ratio=0.2))
+
+        Builtin types, Range and Length (and chains of them), Enum,
+        Literal, ParseDateTime, FormatDateTime, StrictBoolean, Nullable,
+        NotNone and nested schemas are supported. Values of other
+        converters are generated by functions, that receive a random.Random
+        instance and are passed in generators. An invalid record is valid,
+        if no mutation makes it invalid (e.g. if all converters are str).
+
+        :param n: a number of records. Records are generated endlessly, if
+        it is None.
+        :param seed: a seed or a random.Random instance
+        :param invalid_ratio: a share of invalid records
+        :param generators: a dictionary, that maps converters to functions,
+        that generate their values
+        :param max_list_len: a maximal length of generated lists
+        :param max_depth: a nesting level, after which optional fields are
+        omitted and lists are empty
+        """
+        if not 0 <= invalid_ratio <= 1:
+            raise SchemaError('invalid_ratio should be between 0 and 1')
+        rng = seed if isinstance(seed, random.Random) else random.Random(seed)
+        generator = _Generator(rng, generators or {}, max_list_len,
+                               max_depth)
+        return generator.records(self.schema, n, invalid_ratio)
+
+    def loads(self, s):
+        """
+        Decodes JSON document from a string (or UTF-8 encoded bytes) and
+        validates it in a single pass. Converters are applied as soon as
+        values are decoded, and fields removed by Extras.REMOVE are dropped
+        as soon as they are scanned:
+
+        >>> schema = Schema(Dict({
+        ...     Required('id'): int,
+        ...     Required('tags'): List(str)
+        ... }, Extras.REMOVE))
+        >>> res = schema.loads('{"id": "5", "tags": ["a"], "big": [1, 2]}')
+        >>> assert res == {'id': 5, 'tags': ['a']}
+        >>> try:
+        ...     schema.loads('{"tags": ["a", 1]}')
+        ...     assert False, "an exception should've been raised"
+        ... except MultipleInvalid as e:
+        ...     assert ['id'] == e.path
+
+        Malformed JSON raises ValueError, just like json.loads does. Limits
+        are checked while decoding, so a document, that exceeds them, is
+        rejected as soon as a violation is scanned.
+        """
+        if self.cache is not None:
+            return self.cache.call(('json',), s, self._loads)
+        return self._loads(s)
+
+    def _loads(self, s):
+        return _JsonDecoder(self.limits).loads(self.schema, s)
+
+    def load(self, fp):
+        """
+        Same as loads, but reads JSON document from a file-like object.
+        """
+        return self.loads(fp.read())
+
+    def iter_json(self, fp, chunk_size=65536):
+        """
+        Validates a top-level JSON array from a file-like object element by
+        element, without loading the whole document into memory. Schema
+        should be a List. Returns a generator, that yields results for valid
+        elements and MultipleInvalid exceptions (not raised) for invalid ones,
+        with element indexes at the beginning of error paths:
+
+        >>> from io import StringIO
+        >>> schema = Schema(List(int))
+        >>> res = list(schema.iter_json(StringIO('[1, "2", "x", 4]')))
+        >>> assert res[:2] == [1, 2] and res[3] == 4
+        >>> assert isinstance(res[2], MultipleInvalid)
+        >>> assert [2] == res[2].path
+
+        Malformed JSON raises ValueError.
+        """
+        if not isinstance(self.schema, List):
+            raise SchemaError('iter_json is applicable only to List schemas')
+        return _JsonDecoder(self.limits).iterdecode(self.schema, fp,
+                                                    chunk_size)
+
+    def adaptive_stats(self):
+        """
+        Returns statistics of adaptive fields: a dictionary, that maps paths
+        of fields to dictionaries with counts of value types seen during
+        warm-up ('types'), a type of values, that are converted by a fast
+        path ('guard', None if there is no fast path), and numbers of values,
+        that took the fast path ('hits') and the generic path after warm-up
+        ('misses'):
+
+        >>> schema = Schema({Required('id'): Nullable(int),
+        ...                  Optional('tags'): List(Enum('a', 'b'))},
+        ...                 adaptive=2)
+        >>> for data in [{'id': 1}, {'id': 2, 'tags': ['a', 'b']},
+        ...              {'id': 3}, {'id': '4', 'tags': ['b']}]:
+        ...     res = schema(data)
+        >>> assert {'types': {int: 2}, 'guard': int, 'hits': 1,
+        ...         'misses': 1} == schema.adaptive_stats()[('id',)]
+        >>> assert {'types': {str: 2}, 'guard': str, 'hits': 1,
+        ...         'misses': 0} == schema.adaptive_stats()[('tags', '*')]
+
+        Only fields with converters, that have fast paths, are adaptive:
+        chains and wrappers, that start with a builtin type conversion,
+        literals and enums of one type. Paths of fields inside of Union
+        variants include tags of variants (None for the fallback), fields
+        of dictionaries inside of chains and wrappers have paths of the
+        dictionaries.
+        """
+        return dict((path, node.stats()) for path, node in self._adaptive)
+
+    def explain(self):
+        """
+        Returns a description of the compiled schema before and after
+        optimisation. Optimisation flattens nested chains, removes
+        conversions, that cannot change already converted values, and
+        merges adjacent wrappers and length checks:
+
+        >>> schema = Schema({
+        ...     Required('a'): (int, Chain(int, Range(min=1)), int),
+        ...     Required('b'): Nullable(NotNone(str))
+        ... })
+        >>> print(schema.explain())
+        before:
+        Dict(prevent)
+          Required('a'): Chain
+            int
+            Chain
+              int
+              Range(min=1)
+            int
+          Required('b'): Nullable
+            NotNone
+              str
+        after:
+        Dict(prevent)
+          Required('a'): Chain
+            int
+            Range(min=1)
+          Required('b'): Nullable
+            str
+        """
+        return '\n'.join(['before:'] + self._unoptimized +
+                         ['after:'] + _format_schema(self.schema))
+
+    def project(self, data):
+        """
+        Applies only structural transformations of the schema to trusted
+        data: renames fields, removes extras (unless they are allowed),
+        builds objects of MakeObject, reads fields of FromObject and walks
+        nested dictionaries and lists. Values are neither converted nor
+        checked:
+
+        >>> schema = Schema({
+        ...     Required('userId', rename_to='user_id'): int,
+        ...     Required('orderLines', rename_to='order_lines'): List({
+        ...         Required('unitPrice', rename_to='unit_price'):
+        ...             parse_decimal
+        ...     })
+        ... })
+        >>> res = schema.project({'userId': '1', 'debug': True,
+        ...                       'orderLines': [{'unitPrice': '1.5'}]})
+        >>> assert {'user_id': '1', 'order_lines': [{'unit_price': '1.5'}]} \\
+        ...     == res
+        """
+        if self._projector is None:
+            self._projector = _projector(self.schema, {}) or _identity
+        return self._projector(data)
+
+    def view(self, data):
+        """
+        Returns a lazy read-only view of a dictionary or a list for Dict and
+        List schemas. Only the structure is checked right away: presence of
+        required fields, mutually inclusive and exclusive fields and unknown
+        fields. Every value is converted on the first access and then
+        cached, so fields, that are never read, are never converted:
+
+        >>> schema = Schema({
+        ...     Required('id'): int,
+        ...     Required('items'): List({Required('price'): parse_decimal})
+        ... })
+        >>> view = schema.view({'id': '1', 'items': [{'price': '1.5'},
+        ...                                          {'price': 'bad'}]})
+        >>> assert 1 == view['id']
+        >>> assert decimal.Decimal('1.5') == view['items'][0]['price']
+        >>> try:
+        ...     view['items'][1]['price']
+        ...     assert False, "an exception should've been raised"
+        ... except MultipleInvalid as e:
+        ...     assert ['items', 1, 'price'] == e.path
+        >>> try:
+        ...     schema.view({'items': []})
+        ...     assert False, "an exception should've been raised"
+        ... except MultipleInvalid as e:
+        ...     assert ['id'] == e.path
+
+        Views are read-only mappings and sequences. The materialize method
+        validates the whole data and returns the same result, as the schema
+        call does:
+
+        >>> view = schema.view({'id': '1', 'items': [{'price': '1.5'}]})
+        >>> assert {'id': 1, 'items': [{'price': decimal.Decimal('1.5')}]} \\
+        ...     == view.materialize()
+        """
+        if type(self.schema) is not Dict and type(self.schema) is not List:
+            raise SchemaError('view is applicable only to Dict '
+                              'and List schemas')
+        if self.limits is not None:
+            try:
+                self.limits.check(data)
+            except LimitInvalid as e:
+                raise MultipleInvalid([e])
+        return _view(self.schema, data, [])
+
+    def dumps(self, data):
+        """
+        Validates and converts data and encodes the result into JSON text,
+        the same as json.dumps(schema(data)) does. Results of FromObject
+        nodes (and lists of them) are written directly, without building
+        intermediate dictionaries:
+
+        >>> class Point(object):
+        ...     def __init__(self, x, y):
+        ...         self.x = x
+        ...         self.y = y
+        >>> schema = Schema(List(FromObject(Point, {
+        ...     Required('x', 'X'): int,
+        ...     Optional('y', 'Y'): str
+        ... })))
+        >>> assert '[{"X": 1, "Y": "2"}]' == schema.dumps([Point(1, 2)])
+        """
+        parts = []
+        _JsonEncoder(parts.append).dump(self.schema, data)
+        return ''.join(parts)
+
+    def dump(self, data, fp):
+        """
+        Same as dumps, but writes JSON text to a file-like object as it is
+        encoded. If data is invalid, the text, that was already written,
+        is left in the file.
+        """
+        _JsonEncoder(fp.write).dump(self.schema, data)
 
-    def __init__(self, schema, extras=Extras.PREVENT):
-        if extras == Extras.INHERIT:
-            raise SchemaError('top Schema level extras cannot be inherited')
-        compiler = _Compiler(extras, substitutions={
-            tuple: Chain.from_iterable,
-            dict: Dict,
-            list: FixedList.from_iterable,
-            set: Enum.from_iterable,
-            PRIMITIVE_TYPES: Literal
-        })
-        self.schema = compiler.compile(schema)
+    def pack(self, data):
+        """
+        Packs a result of the schema (e.g. a validated DTO, that is passed to
+        another service, that has the same schema) into a compact binary
+        form. Dictionaries, that are described in the schema, are packed
+        without key names, Enum values are packed as indexes. Values should
+        be builtin scalars, naive datetimes, dictionaries and lists. Data is
+        not validated while being packed:
+
+        >>> schema = Schema({
+        ...     Required('firstName', 'first_name'): str,
+        ...     Required('age'): int,
+        ...     Required('role'): Enum('admin', 'user')
+        ... })
+        >>> dto = schema({'firstName': 'John', 'age': '35', 'role': 'user'})
+        >>> packed = schema.pack(dto)
+        >>> assert len(packed) < len('{"first_name": "John", "age": 35, '
+        ...                          '"role": "user"}')
+        >>> assert dto == schema.unpack(packed)
+        """
+        if self._codec is None:
+            self._codec = _BinaryCodec(self.schema)
+        return self._codec.pack(data)
 
-    def __call__(self, data):
-        try:
-            return self.schema(data)
-        except MultipleInvalid:
-            raise
-        except Invalid as e:
-            raise MultipleInvalid([e])
-        except Exception as e:
-            raise MultipleInvalid([Invalid(str(e))])
+    def unpack(self, data):
+        """
+        Unpacks a result, packed by pack method. It isn't validated again.
+        Data, packed with another schema, or corrupted data raises
+        ValueError.
+        """
+        if self._codec is None:
+            self._codec = _BinaryCodec(self.schema)
+        return self._codec.unpack(data)
+
+    def iter_csv(self, fp, header=True, chunk_size=1024, **fmtparams):
+        """
+        Validates CSV rows from a file-like object. Schema should be either
+        a Dict, in which case rows are mapped to dictionaries by column names,
+        or a FixedList, in which case rows are validated by position.
+        Returns a generator, that yields results for valid rows and
+        MultipleInvalid exceptions (not raised) for invalid ones, with
+        a row index (not counting the header) and a column name or position
+        in error paths:
+
+        >>> from io import StringIO
+        >>> schema = Schema(Dict({
+        ...     Required('id'): int,
+        ...     Required('name'): str
+        ... }, Extras.REMOVE))
+        >>> res = list(schema.iter_csv(StringIO(
+        ...     'id,name,comment\\n1,John,hi\\nx,Jane,\\n')))
+        >>> assert {'id': 1, 'name': 'John'} == res[0]
+        >>> assert [1, 'id'] == res[1].path
+
+        >>> schema = Schema([int, str])
+        >>> res = list(schema.iter_csv(StringIO('1,John\\nx,Jane\\n'),
+        ...                            header=False))
+        >>> assert [1, 'John'] == res[0]
+        >>> assert [1, 0] == res[1].path
+
+        Rows are validated by chunks of chunk_size rows. Dictionaries are
+        validated column by column (see List columnar mode). Blank rows are
+        skipped, but they are counted in row indexes of error paths.
+
+        :param fp: a file-like object, opened in text mode
+        :param header: True if the first row contains column names,
+        False if there is no header row or a list of column names
+        :param chunk_size: a number of rows, validated at once
+        :param fmtparams: csv.reader formatting parameters
+        """
+        if isinstance(self.schema, Dict):
+            if header is False:
+                raise SchemaError('column names are required to '
+                                  'validate CSV rows as dictionaries')
+        elif not isinstance(self.schema, FixedList):
+            raise SchemaError('iter_csv is applicable only to Dict '
+                              'and FixedList schemas')
+        return self._iter_csv(csv.reader(fp, **fmtparams), header,
+                              chunk_size)
+
+    def _iter_csv(self, rows, header, chunk_size):
+        rows = iter(rows)
+        if header is True:
+            header = next((row for row in rows if row), None)
+            if header is None:
+                return
+        if isinstance(self.schema, Dict):
+            validate_chunk = _CsvDictValidator(self.schema, header,
+                                               self.limits)
+        else:
+            validate_chunk = self._validate_csv_chunk
+        # Blank rows are skipped, but counted in row indexes
+        rows = ((index, row) for index, row in enumerate(rows) if row)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            results, errors = validate_chunk([row for _, row in chunk])
+            for pos, result in enumerate(results):
+                if pos in errors:
+                    yield MultipleInvalid(collect_invalids(errors[pos],
+                                                           [chunk[pos][0]]))
+                else:
+                    yield result
+
+    def _validate_csv_chunk(self, chunk):
+        results = []
+        errors = {}
+        for pos, row in enumerate(chunk):
+            try:
+                results.append(self(row))
+            except MultipleInvalid as e:
+                results.append(None)
+                errors[pos] = e
+        return results, errors
 
 
 class Marker(object):
     def __init__(self, name, rename_to=None):
-        self.name = name
-        self._rename_to = rename_to
+        # Result dictionaries of all schemas share key objects
+        self.name = _intern_key(name)
+        self._rename_to = _intern_key(rename_to)
 
     @property
     def rename_to(self):
         return self._rename_to or self.name
 
 
+def _intern_key(name):
+    if type(name) is str:
+        return intern(name)
+    return name
+
+
+# A default size of intern tables
+INTERN_TABLE_SIZE = 10000
+
+
+def _intern_value(table, max_size, value):
+    """
+    Returns a string from the table, that is equal to value, adding value
+    to the table, unless the table is full. Other values are returned
+    intact.
+    """
+    if type(value) not in STRING_TYPES:
+        return value
+    try:
+        return table[value]
+    except KeyError:
+        if len(table) < max_size:
+            table[value] = value
+        return value
+
+
 class Required(Marker):
     pass
 
@@ -583,10 +2834,20 @@ class Literal(_Compilable):
     def __call__(self, data):
         converted_data = self.converter(data)
         if self.value != converted_data:
-            raise LiteralInvalid('value %r is not equal to %r'
-                                 % (converted_data, self.value))
+            raise self._invalid(converted_data)
         return converted_data
 
+    def _invalid(self, converted_data):
+        return LiteralInvalid('value %r is not equal to %r'
+                              % (converted_data, self.value))
+
+    def _convert_column(self, values):
+        results, failures = _convert_column(self.converter, values)
+        for pos, converted_data in enumerate(results):
+            if pos not in failures and self.value != converted_data:
+                failures[pos] = self._invalid(converted_data)
+        return results, failures
+
     def _compile(self, compiler):
         return self
 
@@ -650,11 +2911,37 @@ class Dict(_Mapping):
 
     """
 
-    def __init__(self, inner_schema, extras=Extras.INHERIT):
+    def __init__(self, inner_schema, extras=Extras.INHERIT, intern=False,
+                 table=None):
+        """
+        :param inner_schema: a dictionary with inner schema
+        :param extras: a strategy to deal with extra fields. See Schema
+         __init__ extras param for reference.
+        :param intern: equal string values of fields are returned as the
+        same objects. Up to INTERN_TABLE_SIZE strings are kept per field,
+        so fields with many distinct values don't crowd out others. Values
+        of extra fields are not interned.
+        :param table: a name of a table or a Table, that rows of
+        dictionaries go to. See Schema.to_rows.
+        """
         if not isinstance(inner_schema, dict):
             raise SchemaError('expected a dictionary, got %r instead'
                               % inner_schema)
+        if isinstance(table, strtype):
+            table = Table(table)
+        elif table is not None and not isinstance(table, Table):
+            raise SchemaError('table should be a string or an instance '
+                              'of Table')
         super(Dict, self).__init__(inner_schema, extras)
+        self.intern = intern
+        self.table = table
+        # Tables of interned strings by result names of fields
+        self._interned = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_interned'] = {}
+        return state
 
     def prepare_data(self, data):
         if not isinstance(data, dict):
@@ -671,8 +2958,20 @@ class Dict(_Mapping):
         return data.pop(key)
 
     def prepare_result(self, result):
+        if self.intern:
+            for marker in self.inner_schema:
+                key = marker.rename_to
+                if key in result:
+                    result[key] = _intern_value(self._interned_table(key),
+                                                INTERN_TABLE_SIZE, result[key])
         return result
 
+    def _interned_table(self, key):
+        try:
+            return self._interned[key]
+        except KeyError:
+            return self._interned.setdefault(key, {})
+
     def check_extras(self, data, result):
         errors = []
         if data:
@@ -687,6 +2986,269 @@ class Dict(_Mapping):
             raise MultipleInvalid(errors)
 
 
+class Table(object):
+    """
+    Describes a table, that rows of dictionaries go to (see Schema.to_rows).
+    A key column is taken from a field with the same result name or, if
+    there is no such field, it is generated. Rows of nested tables refer
+    to keys of their parents with a parent key column.
+    """
+
+    def __init__(self, name, key=None, parent_key=None):
+        """
+        :param name: a name of the table
+        :param key: a name of a key column
+        :param parent_key: a name of a column with parent keys
+        """
+        for param, value in (('name', name), ('key', key),
+                             ('parent_key', parent_key)):
+            if value is not None and not isinstance(value, strtype):
+                raise SchemaError('%s should be a string' % param)
+        self.name = name
+        self.key = key
+        self.parent_key = parent_key
+
+
+def _table_child(converter):
+    """
+    Returns a Dict with a table, that is either a converter itself or
+    elements of a list converter, and whether it's a list.
+    """
+    if getattr(converter, 'table', None) is not None:
+        return converter, False
+    if type(converter) is List and \
+            getattr(converter.inner_schema, 'table', None) is not None:
+        return converter.inner_schema, True
+    return None, False
+
+
+class _RowBuilder(object):
+    """
+    Validates dictionaries of a Dict with a table and builds rows of the
+    table directly, without building result dictionaries. Rows of nested
+    tables are built by builders of their Dicts.
+    """
+
+    def __init__(self, node, parent, builders):
+        table = node.table
+        if table.parent_key is not None and (parent is None or
+                                             parent.table.key is None):
+            raise SchemaError('parent key requires a parent table with '
+                              'a key', [table.name])
+        if any(builder.table.name == table.name for builder in builders):
+            raise SchemaError('duplicate table', [table.name])
+        builders.append(self)
+        self.node = node
+        self.table = table
+        self.fields = []
+        columns = []
+        for marker in sorted(node.inner_schema,
+                             key=lambda m: m.rename_to or m.name):
+            converter = node.inner_schema[marker]
+            child, many = _table_child(converter)
+            if child is None:
+                columns.append(marker.rename_to or marker.name)
+                self.fields.append([marker, converter, None, many])
+            else:
+                self.fields.append([marker, None, child, many])
+        self.generated = table.key is not None and table.key not in columns
+        prefix = [table.key] if self.generated else []
+        if table.parent_key is not None:
+            prefix.append(table.parent_key)
+        self.columns = tuple(prefix + columns)
+        positions = iter(range(len(prefix), len(self.columns)))
+        for field in self.fields:
+            if field[2] is None:
+                field[2] = next(positions)
+        self.key_position = None if table.key is None else \
+            self.columns.index(table.key)
+        self.key_field = None
+        for marker in node.inner_schema:
+            if (marker.rename_to or marker.name) == table.key:
+                self.key_field = marker.name
+        self.parent_position = None if table.parent_key is None else \
+            self.columns.index(table.parent_key)
+        for field in self.fields:
+            if field[1] is None:
+                # Builders of recursive tables are shared
+                built = [builder for builder in builders
+                         if builder.node is field[2]]
+                field[2] = built[0] if built else \
+                    _RowBuilder(field[2], self, builders)
+
+    def build(self, data, parent_key, rows, keys):
+        """
+        Validates a dictionary and appends its row and rows of nested
+        tables to rows (a dictionary of lists by table names).
+
+        :param keys: a dictionary of iterators of generated keys by table
+        names
+        """
+        node = self.node
+        if not isinstance(data, dict):
+            raise DictInvalid('expected a dictionary, got %r instead'
+                              % data)
+        row = [None] * len(self.columns)
+        inclusive = defaultdict(set)
+        exclusive = defaultdict(set)
+        errors = []
+        children = []
+        matched = 0
+        for marker, converter, target, many in self.fields:
+            key = marker.name
+            if key in data:
+                matched += 1
+                value = data[key]
+                if isinstance(marker, Inclusive):
+                    inclusive[marker._monitor].add(key)
+                if isinstance(marker, Exclusive):
+                    exclusive[marker._monitor].add(key)
+                if converter is None:
+                    children.append((key, target, many, value))
+                    continue
+                try:
+                    value = converter(value)
+                except Exception as e:
+                    errors.extend(collect_invalids(e, [key]))
+                    continue
+                if node.intern:
+                    value = _intern_value(
+                        node._interned_table(marker.rename_to),
+                        INTERN_TABLE_SIZE, value)
+                row[target] = value
+            elif isinstance(marker, Required):
+                errors.append(RequiredInvalid('required field is missing',
+                                              [key]))
+        node._check_monitors(inclusive, exclusive, errors)
+        if node.extras == Extras.PREVENT and len(data) > matched:
+            markers = node._markers_by_name
+            for unknown_field in data:
+                if unknown_field not in markers:
+                    errors.append(UnknownInvalid('unknown field',
+                                                 [unknown_field]))
+        if self.generated:
+            row[0] = next(keys[self.table.name])
+        if self.parent_position is not None:
+            row[self.parent_position] = parent_key
+        # Parents go before their children, even in recursive tables
+        rows[self.table.name].append(tuple(row))
+        row_key = None if self.key_position is None else \
+            row[self.key_position]
+        missing_key = None
+        for key, builder, many, value in children:
+            if row_key is None and builder.table.parent_key is not None:
+                # Rows of nested tables can't refer to a missing key
+                if missing_key is None:
+                    missing_key = RequiredInvalid(
+                        'key field is required for rows of nested tables',
+                        [self.key_field])
+                    errors.append(missing_key)
+                continue
+            if not many:
+                with aggregate_invalids(errors, [key]):
+                    builder.build(value, row_key, rows, keys)
+            elif not isinstance(value, list):
+                errors.append(ListInvalid('expected a list, got %r instead'
+                                          % type(value), [key]))
+            else:
+                for idx, item in enumerate(value):
+                    with aggregate_invalids(errors, [key, idx]):
+                        builder.build(item, row_key, rows, keys)
+        if errors:
+            raise MultipleInvalid(errors)
+
+
+class _ProjectedDict(Dict):
+    """
+    A copy of a compiled Dict, that converts only selected fields. Other
+    fields are still checked for presence, but are neither converted nor
+    included into results. Their converters are None.
+    """
+
+    def __init__(self, node, inner_schema):
+        # Everything but converters is shared with the node, including
+        # tables of interned strings
+        self.__dict__.update(node.__dict__)
+        self.inner_schema = inner_schema
+
+    def __call__(self, data):
+        data = self.prepare_data(data)
+        result = {}
+        inclusive = defaultdict(set)
+        exclusive = defaultdict(set)
+        errors = []
+        for marker, converter in iteritems(self.inner_schema):
+            key = marker.name
+            if key in data:
+                value = data.pop(key)
+                if isinstance(marker, Inclusive):
+                    inclusive[marker._monitor].add(key)
+                if isinstance(marker, Exclusive):
+                    exclusive[marker._monitor].add(key)
+                if converter is None:
+                    continue
+                try:
+                    result[marker.rename_to or key] = converter(value)
+                except Exception as e:
+                    errors.extend(collect_invalids(e, [key]))
+            elif isinstance(marker, Required):
+                errors.append(RequiredInvalid('required field is missing',
+                                              [key]))
+        return self._finish(data, result, inclusive, exclusive, errors)
+
+
+def _parse_projection(only):
+    """
+    Turns dotted paths into a tree of dictionaries. None marks a subtree,
+    that is selected as a whole.
+    """
+    tree = {}
+    for path in only:
+        if not isinstance(path, strtype) or not path:
+            raise SchemaError('expected a dotted path, got %r instead'
+                              % path)
+        subtree = tree
+        names = path.split('.')
+        for name in names[:-1]:
+            if name in subtree and subtree[name] is None:
+                break
+            subtree = subtree.setdefault(name, {})
+        else:
+            subtree[names[-1]] = None
+    return tree
+
+
+def _project(node, tree, path=None):
+    path = path or []
+    if tree is None:
+        return node
+    if type(node) is List:
+        if list(tree) != ['*']:
+            raise SchemaError('list elements should be selected with *',
+                              path)
+        return List(_project(node.inner_schema, tree['*'], path + ['*']),
+                    node.columnar, node.sample)
+    if type(node) is not Dict:
+        raise SchemaError('only fields of dictionaries and elements of '
+                          'lists can be selected', path)
+    by_output_name = dict((marker.rename_to or marker.name, marker)
+                          for marker in node.inner_schema)
+    errors = []
+    for name in tree:
+        if name not in by_output_name:
+            errors.append(SchemaError('unknown field', path + [name]))
+    if errors:
+        raise MultipleSchemaError(errors)
+    inner_schema = {}
+    for name, marker in iteritems(by_output_name):
+        if name in tree:
+            inner_schema[marker] = _project(node.inner_schema[marker],
+                                            tree[name], path + [name])
+        else:
+            inner_schema[marker] = None
+    return _ProjectedDict(node, inner_schema)
+
+
 class List(_Compilable):
     """
     Marks a field in a schema as a list field, containing objects, that
@@ -696,16 +3258,57 @@ class List(_Compilable):
     >>> res = schema([1, '2.5', 3])
     >>> assert res == [decimal.Decimal(1), decimal.Decimal('2.5'),
     ...                decimal.Decimal(3)]
+
+    A list of dictionaries (e.g. CSV-like records) can be validated
+    column by column instead of row by row. Every field converter receives
+    a whole column at once, which lets built-in converters (int, float, str,
+    Literal, Enum, Range, Length, StrictBoolean, Chain, Nullable and NotNone)
+    check all values in bulk (using NumPy if it is installed). Other
+    converters are applied element by element. Results and errors are the
+    same as for the row by row validation:
+
+    >>> schema = Schema(List({
+    ...     Required('id'): int,
+    ...     Required('score'): (float, Range(max=10, max_inclusive=True)),
+    ... }, columnar=True))
+    >>> res = schema([{'id': '1', 'score': '2.5'}, {'id': 2, 'score': 10}])
+    >>> assert res == [{'id': 1, 'score': 2.5}, {'id': 2, 'score': 10.0}]
+    >>> try:
+    ...     schema([{'id': '1', 'score': 1}, {'id': 'x', 'score': 1}])
+    ...     assert False, "an exception should've been raised"
+    ... except MultipleInvalid as e:
+    ...     assert [1, 'id'] == e.path
     """
 
-    def __init__(self, inner_schema):
+    def __init__(self, inner_schema, columnar=False, sample=None):
+        """
+        :param inner_schema: a schema of list elements
+        :param columnar: validate elements column by column. Inner schema
+        must be a Dict in this case.
+        :param sample: a Sample of elements to validate. Other elements
+        are only projected (see Schema.project).
+        """
+        if sample is not None and not isinstance(sample, Sample):
+            raise SchemaError('sample should be an instance of Sample')
         self.inner_schema = inner_schema
+        self.columnar = columnar
+        self.sample = sample
+        self._project_element = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_project_element'] = None
+        return state
 
     def __call__(self, data):
         if not isinstance(data, list):
             if not isinstance(data, list):
                 raise ListInvalid('expected a list, got %r instead'
                                   % type(data))
+        if self.sample is not None:
+            return self._call_sampled(data)
+        if self.columnar:
+            return self._call_columnar(data)
         result = []
         errors = []
         for idx, d in enumerate(data):
@@ -725,8 +3328,122 @@ class List(_Compilable):
             raise MultipleInvalid(errors)
         return result
 
+    def prepare_sampling(self):
+        """
+        Builds and returns a function, that projects unsampled elements.
+        """
+        if self._project_element is None:
+            self._project_element = _projector(self.inner_schema,
+                                               {}) or _identity
+        return self._project_element
+
+    def _call_sampled(self, data):
+        positions = self.sample.positions(len(data))
+        sampled = [data[idx] for idx in positions]
+        if self.columnar:
+            results, element_errors = self._validate_columns(sampled)
+        else:
+            results = [None] * len(sampled)
+            element_errors = {}
+            for pos, value in enumerate(sampled):
+                try:
+                    results[pos] = self.inner_schema(value)
+                except Exception as e:
+                    element_errors[pos] = e
+        errors = []
+        for pos in sorted(element_errors):
+            errors.extend(collect_invalids(element_errors[pos],
+                                           [positions[pos]]))
+        self.sample.check(len(data), len(positions), len(element_errors),
+                          errors)
+        project = self.prepare_sampling()
+        result = [project(value) for value in data]
+        for pos, idx in enumerate(positions):
+            if pos not in element_errors:
+                result[idx] = results[pos]
+        return result
+
+    def _call_columnar(self, data):
+        results, row_errors = self._validate_columns(data)
+        errors = []
+        for idx in sorted(row_errors):
+            errors.extend(collect_invalids(row_errors[idx], [idx]))
+        if errors:
+            raise MultipleInvalid(errors)
+        return results
+
+    def _validate_columns(self, data):
+        """
+        Validates a list of dictionaries column by column. Returns a list of
+        results and a dictionary, mapping indexes of invalid elements to
+        MultipleInvalid exceptions.
+        """
+        schema = self.inner_schema
+        rows = [None] * len(data)
+        results = [None] * len(data)
+        row_errors = [[] for _ in data]
+        for idx, d in enumerate(data):
+            with aggregate_invalids(row_errors[idx]):
+                rows[idx] = schema.prepare_data(d)
+                results[idx] = {}
+        present = {}
+        for marker, converter in iteritems(schema.inner_schema):
+            key = marker.name
+            substitution_key = marker.rename_to or key
+            positions = []
+            column = []
+            for idx, row in enumerate(rows):
+                if row is None:
+                    continue
+                if schema.is_key_in_data(key, row):
+                    positions.append(idx)
+                    column.append(schema.get_value(key, row))
+                elif isinstance(marker, Required):
+                    row_errors[idx].append(
+                        RequiredInvalid('required field is missing',
+                                        [key]))
+            if isinstance(marker, (Inclusive, Exclusive)):
+                present[key] = set(positions)
+            if converter is None:
+                # A field, that is left out by a projection
+                continue
+            converted, failures = _convert_column(converter, column)
+            for pos, idx in enumerate(positions):
+                if pos in failures:
+                    row_errors[idx].extend(
+                        collect_invalids(failures[pos], [key]))
+                else:
+                    results[idx][substitution_key] = converted[pos]
+        errors = {}
+        for idx, row in enumerate(rows):
+            if row is not None:
+                inclusive = self._present_monitors(
+                    schema.inclusive_monitors, present, idx)
+                exclusive = self._present_monitors(
+                    schema.exclusive_monitors, present, idx)
+                try:
+                    results[idx] = schema._finish(row, results[idx],
+                                                  inclusive, exclusive,
+                                                  row_errors[idx])
+                except MultipleInvalid as e:
+                    errors[idx] = e
+            else:
+                errors[idx] = MultipleInvalid(row_errors[idx])
+        return results, errors
+
+    @staticmethod
+    def _present_monitors(monitors, present, idx):
+        result = {}
+        for monitor, names in iteritems(monitors):
+            values = set(name for name in names if idx in present[name])
+            if values:
+                result[monitor] = values
+        return result
+
     def _compile(self, compiler):
         self.inner_schema = compiler.compile(self.inner_schema)
+        if self.columnar and not isinstance(self.inner_schema, Dict):
+            raise SchemaError('columnar lists can contain only dictionaries')
         return self
 
 
@@ -748,9 +3465,23 @@ class Enum(_Compilable):
 
     >>> schema = Schema(set(('June', 6, 'VI')))
     >>> assert 'VI' == schema('VI')
+
+    Enum can return values from the schema itself instead of converted
+    values, so equal results are the same objects:
+
+    >>> schema = Schema(Enum('June', 'July', intern=True))
+    >>> assert schema(''.join(['Ju', 'ne'])) is schema('June')
     """
 
-    def __init__(self, *values):
+    def __init__(self, *values, **kwargs):
+        """
+        :param values: allowed values
+        :param intern: return allowed values themselves instead of
+        converted values, when they are of the same type
+        """
+        self.intern = kwargs.pop('intern', False)
+        if kwargs:
+            raise SchemaError('unexpected arguments %r' % list(kwargs))
         self.values = set(values)
 
     @classmethod
@@ -776,11 +3507,35 @@ class Enum(_Compilable):
     def __call__(self, data):
         for v in self.values:
             try:
-                return v(data)
+                converted_data = v(data)
             except:
-                pass
+                continue
+            if self.intern and type(converted_data) is type(v.value):
+                return v.value
+            return converted_data
         raise EnumInvalid('none of enum values matches %r' % data)
 
+    def _convert_column(self, values):
+        # Values, that are exactly of the same type as one of literals,
+        # are looked up directly, others are converted one by one
+        exact_values = dict(((type(v.value), v.value), v.value)
+                            for v in self.values
+                            if isinstance(v, Literal) and
+                            v.converter is type(v.value))
+        results = list(values)
+        failures = {}
+        positions = []
+        for pos, value in enumerate(values):
+            try:
+                canonical = exact_values[type(value), value]
+            except (KeyError, TypeError):
+                positions.append(pos)
+            else:
+                if self.intern:
+                    results[pos] = canonical
+        _convert_positions(self, results, positions, failures)
+        return results, failures
+
 
 class MakeObject(Dict):
     """
@@ -807,10 +3562,31 @@ class MakeObject(Dict):
     >>> assert 'John' == user.first_name
     >>> assert 'Smith' == user.last_name
     >>> assert user.birth_date.date() == datetime(1977, 8, 5).date()
+
+    By default objects are created by passing fields as keyword arguments to
+    the constructor. For simple data classes, cheaper construction strategies
+    can be chosen: Construction.POSITIONAL passes fields as positional
+    arguments in the order of constructor parameters (keyword arguments are
+    still used if some parameters are missing), Construction.ATTRIBUTES does
+    not call the constructor at all and sets fields as object attributes:
+
+    >>> schema = Schema(MakeObject(User, {
+    ...     Required('first_name'): str,
+    ...     Required('last_name'): str,
+    ...     Required('birth_date'): ParseDateTime('%Y-%m-%d')
+    ... }, construction=Construction.ATTRIBUTES))
+    >>> user = schema({
+    ...     'first_name': 'John',
+    ...     'last_name': 'Smith',
+    ...     'birth_date': '1977-08-5'
+    ... })
+    >>> assert isinstance(user, User)
+    >>> assert 'John' == user.first_name
     """
 
     def __init__(self, object_class, inner_schema,
-                 object_initializator='__init__', extras=Extras.INHERIT):
+                 object_initializator='__init__', extras=Extras.INHERIT,
+                 construction=Construction.INIT):
         """
         :param object_class: an object class
         :param inner_schema: a dictionary with inner object schema
@@ -820,6 +3596,10 @@ class MakeObject(Dict):
         If none supplied, object's constructor will be used.
         :param extras: a strategy to deal with extra fields. See Schema
          __init__ extras param for reference.
+        :param construction: a strategy of object construction. One of
+        Construction values. Construction.ATTRIBUTES should only be used
+        for classes, which constructors do nothing but assign arguments
+        to attributes with the same names.
         """
         if not isinstance(object_class, type):
             raise SchemaError('expected a class')
@@ -845,10 +3625,49 @@ class MakeObject(Dict):
             raise SchemaError('expected a %s method or method name'
                               % object_class)
 
+        if construction not in Construction.values:
+            raise SchemaError('construction should be one of %r'
+                              % Construction.values)
+        if construction != Construction.INIT and \
+                self.object_constructor is not None:
+            raise SchemaError('construction strategy can only be used '
+                              'with the object constructor')
         self.object_class = object_class
+        self.construction = construction
+        if construction == Construction.POSITIONAL:
+            self._parameters = _init_parameters(object_class)
+            self._get_arguments = _tuple_getter(operator.itemgetter,
+                                                self._parameters)
         super(MakeObject, self).__init__(inner_schema, extras)
 
+    def _compile(self, compiler):
+        super(MakeObject, self)._compile(compiler)
+        # An instance dictionary can be replaced by the result, unless
+        # there is no instance dictionary or some fields are slots or
+        # properties
+        self._replace_dict = bool(
+            getattr(self.object_class, '__dictoffset__', 0)) and not any(
+            _is_data_descriptor(self.object_class, marker.rename_to)
+            for marker in self.inner_schema)
+        return self
+
     def prepare_result(self, result):
+        if self.construction == Construction.ATTRIBUTES:
+            o = self.object_class.__new__(self.object_class)
+            if self._replace_dict and self.extras != Extras.ALLOW:
+                o.__dict__ = result
+            else:
+                for name, value in iteritems(result):
+                    setattr(o, name, value)
+            return o
+        elif self.construction == Construction.POSITIONAL and \
+                len(result) == len(self._parameters):
+            try:
+                arguments = self._get_arguments(result)
+            except KeyError:
+                pass
+            else:
+                return self.object_class(*arguments)
         if self.object_constructor is None:
             return self.object_class(**result)
         else:
@@ -882,26 +3701,163 @@ class FromObject(_Mapping):
     >>> assert 'John' == user['first_name']
     >>> assert 'Smith' == user['last_name']
     >>> assert '1977-08-05' == user['birth_date']
+
+    Compiled FromObject can write JSON text directly, without building
+    an intermediate dictionary:
+
+    >>> assert json.loads(schema.dumps(User('John', 'Smith',
+    ...                                     datetime(1977, 8, 5)))) == user
+
+    Every field is looked up once. If objects are known to always have all
+    fields, strict mode reads all of them at once without checking
+    presence of each field:
+
+    >>> schema = Schema(FromObject(User, {
+    ...     Required('first_name'): str,
+    ...     Required('last_name'): str
+    ... }, strict=True))
+    >>> user = schema(User('John', 'Smith', None))
+    >>> assert {'first_name': 'John', 'last_name': 'Smith'} == user
     """
 
-    def __init__(self, object_class, inner_schema):
+    def __init__(self, object_class, inner_schema, strict=False):
+        """
+        :param object_class: an object class
+        :param inner_schema: a dictionary with inner object schema
+        :param strict: objects are expected to have all fields. If some
+        of them are missing anyway, fields are looked up one by one.
+        """
         super(FromObject, self).__init__(inner_schema)
         self.object_class = object_class
+        self.strict = strict
+        self._extractors = {}
+
+    def _compile(self, compiler):
+        super(FromObject, self)._compile(compiler)
+        self._prepare_fields()
+        return self
+
+    def _prepare_fields(self):
+        self._fields = [(marker, marker.name, marker.rename_to, converter)
+                        for marker, converter in iteritems(self.inner_schema)]
+        self._field_names = [marker.name for marker in self.inner_schema]
+        self._get_fields = _tuple_getter(operator.attrgetter,
+                                         self._field_names)
+        # Fields with JSON-encoded keys, that are used by dumps
+        self._encoding_plan = []
+        for marker, converter in iteritems(self.inner_schema):
+            encoded_key = json.dumps({marker.rename_to: None})[1:-5]
+            self._encoding_plan.append((
+                marker, marker.name, (', ' + encoded_key, '{' + encoded_key),
+                converter, _JsonEncoder.is_leaf(converter)))
+
+    def dumps(self, data):
+        """
+        Converts an object and encodes the result into JSON text. Should
+        only be used after the schema is compiled.
+        """
+        parts = []
+        _JsonEncoder(parts.append).dump(self, data)
+        return ''.join(parts)
+
+    def __call__(self, data):
+        fields = self.prepare_data(data)
+        result = {}
+        errors = []
+        for marker, name, rename_to, converter in self._fields:
+            if name in fields:
+                try:
+                    result[rename_to] = converter(fields[name])
+                except Exception as e:
+                    errors.extend(collect_invalids(e, [name]))
+            elif isinstance(marker, Required):
+                errors.append(RequiredInvalid('required field is missing',
+                                              [name]))
+        if not errors and not self.inclusive_monitors and \
+                not self.exclusive_monitors:
+            return self.prepare_result(result)
+        inclusive = defaultdict(set)
+        exclusive = defaultdict(set)
+        for marker, name, _, _ in self._fields:
+            if name in fields:
+                if isinstance(marker, Inclusive):
+                    inclusive[marker._monitor].add(name)
+                if isinstance(marker, Exclusive):
+                    exclusive[marker._monitor].add(name)
+        return self._finish(fields, result, inclusive, exclusive, errors)
+
+    def __getstate__(self):
+        # Extractors are closures, they are made again after unpickling
+        state = self.__dict__.copy()
+        state['_extractors'] = {}
+        return state
 
     def check_extras(self, data, result):
         pass
 
     def is_key_in_data(self, key, data):
-        return hasattr(data, key)
+        return key in data
 
     def prepare_result(self, result):
         return result
 
     def get_value(self, key, data):
-        return getattr(data, key)
+        return data[key]
 
     def prepare_data(self, data):
-        return data
+        # Fields of an object are extracted into a dictionary with
+        # an extractor, that is chosen once per object class
+        try:
+            extract = self._extractors[type(data)]
+        except KeyError:
+            extract = self._extractors[type(data)] = \
+                self._make_extractor(type(data))
+        return extract(data)
+
+    def _make_extractor(self, object_class):
+        names = self._field_names
+        get_fields = self._get_fields
+
+        def extract_one_by_one(data):
+            fields = {}
+            for name in names:
+                value = getattr(data, name, UNDEFINED)
+                if value is not UNDEFINED:
+                    fields[name] = value
+            return fields
+
+        def extract_all(data):
+            try:
+                return dict(zip(names, get_fields(data)))
+            except AttributeError:
+                return extract_one_by_one(data)
+
+        def extract_from_instance_dict(data):
+            instance_dict = data.__dict__
+            fields = {}
+            for name in names:
+                value = instance_dict.get(name, UNDEFINED)
+                if value is UNDEFINED:
+                    value = getattr(data, name, UNDEFINED)
+                    if value is UNDEFINED:
+                        continue
+                fields[name] = value
+            return fields
+
+        if self.strict:
+            return extract_all
+        if object_class.__getattribute__ is not object.__getattribute__ or \
+                not getattr(object_class, '__dictoffset__', 0):
+            # Custom attribute access or no instance dictionary (e.g.
+            # __slots__): all fields are read at once and one by one only
+            # if some of them are missing
+            return extract_all
+        for name in names:
+            if _is_data_descriptor(object_class, name):
+                # Properties and slots take precedence over
+                # an instance dictionary
+                return extract_one_by_one
+        return extract_from_instance_dict
 
 
 class FixedList(_Compilable):
@@ -961,7 +3917,238 @@ class FixedList(_Compilable):
             raise FixedListLengthInvalid(
                 'the length of %r must be equal to %d'
                 % (data, len(self.inner_schemas)))
-        return [c(v) for c, v in zip(self.inner_schemas, data)]
+        result = []
+        errors = []
+        for idx, (c, v) in enumerate(zip(self.inner_schemas, data)):
+            with aggregate_invalids(errors, [idx]):
+                result.append(c(v))
+        if errors:
+            raise MultipleInvalid(errors)
+        return result
+
+
+class Union(_Compilable):
+    """
+    Marks a field in a schema as a dictionary, that conforms to one of
+    several schemas. A variant is chosen by the value of the discriminator
+    field, so only one variant is validated. Variants should declare the
+    discriminator field themselves:
+
+    >>> schema = Schema(List(Union('type', {
+    ...     'click': {Required('type'): str, Required('x'): int},
+    ...     'purchase': {Required('type'): str,
+    ...                  Required('amount'): parse_decimal}
+    ... })))
+    >>> res = schema([{'type': 'click', 'x': '1'},
+    ...               {'type': 'purchase', 'amount': '9.99'}])
+    >>> assert [{'type': 'click', 'x': 1},
+    ...         {'type': 'purchase', 'amount': decimal.Decimal('9.99')}] \\
+    ...     == res
+    >>> try:
+    ...     schema([{'type': 'purchase', 'x': 1}])
+    ...     assert False, "an exception should've been raised"
+    ... except MultipleInvalid as e:
+    ...     assert [[0, 'amount'], [0, 'x']] == sorted(
+    ...         e.path for e in e.errors)
+
+    Dictionaries with unknown or missing discriminator values are validated
+    with a fallback schema, if there is one:
+
+    >>> schema = Schema(Union('type', {
+    ...     'click': {Required('type'): str, Required('x'): int},
+    ... }, fallback=UnvalidatedDict()))
+    >>> assert {'type': 'scroll'} == schema({'type': 'scroll'})
+    """
+
+    def __init__(self, discriminator, variants, fallback=None):
+        """
+        :param discriminator: a name of the field, that selects a variant
+        :param variants: a dictionary, that maps discriminator values
+        to schemas
+        :param fallback: a schema for dictionaries with unknown or missing
+        discriminator values
+        """
+        if not isinstance(variants, dict):
+            raise SchemaError('expected a dictionary of variants, got %r '
+                              'instead' % variants)
+        self.discriminator = discriminator
+        self.variants = variants
+        self.fallback = fallback
+
+    def _compile(self, compiler):
+        compiled_variants = {}
+        errors = []
+        for tag, variant in iteritems(self.variants):
+            with aggregate_schema_errors(errors, [tag]):
+                compiled_variants[tag] = compiler.compile(variant)
+        if self.fallback is not None:
+            with aggregate_schema_errors(errors):
+                self.fallback = compiler.compile(self.fallback)
+        if errors:
+            raise MultipleSchemaError(errors)
+        self.variants = compiled_variants
+        return self
+
+    def __call__(self, data):
+        return self.select(data)(data)
+
+    def select(self, data):
+        """
+        Returns a variant schema for data.
+        """
+        if not isinstance(data, dict):
+            raise DictInvalid('expected a dictionary, got %r instead'
+                              % data)
+        tag = data.get(self.discriminator, UNDEFINED)
+        try:
+            variant = self.variants.get(tag)
+        except TypeError:
+            variant = None
+        if variant is not None:
+            return variant
+        if self.fallback is not None:
+            return self.fallback
+        if tag is UNDEFINED:
+            raise RequiredInvalid('required field is missing',
+                                  [self.discriminator])
+        raise VariantInvalid('unknown variant %r' % (tag,),
+                             [self.discriminator])
+
+
+class Interned(object):
+    """
+    Converts a value with a wrapped function and returns equal strings as
+    the same objects. Up to max_size distinct strings are kept, other
+    strings are returned intact:
+
+    >>> schema = Schema(List(Interned(str)))
+    >>> a, b = schema([''.join(['c', 'a', 't']), ''.join(['c', 'a', 't'])])
+    >>> assert a is b
+    """
+
+    def __init__(self, f=str, max_size=INTERN_TABLE_SIZE):
+        if not callable(f):
+            raise SchemaError('Interned is applicable only to callables')
+        self._f = f
+        self.max_size = max_size
+        self._table = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_table'] = {}
+        return state
+
+    def __call__(self, value):
+        return _intern_value(self._table, self.max_size, self._f(value))
+
+
+class Ref(_Compilable):
+    """
+    Marks a field in a schema as a reference to a named schema. References
+    are replaced with compiled named schemas during compilation, so named
+    schemas can refer to themselves:
+
+    >>> schema = Schema(Ref('category'), definitions={
+    ...     'category': {
+    ...         Required('name'): str,
+    ...         Optional('children'): List(Ref('category'))
+    ...     }
+    ... })
+    >>> res = schema({'name': 'a', 'children': [{'name': 'b'}]})
+    >>> assert {'name': 'a', 'children': [{'name': 'b'}]} == res
+    >>> try:
+    ...     schema({'name': 'a', 'children': [{'title': 'b'}]})
+    ...     assert False, "an exception should've been raised"
+    ... except MultipleInvalid as e:
+    ...     assert [['children', 0, 'name'], ['children', 0, 'title']] == \\
+    ...         sorted(e.path for e in e.errors)
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def _compile(self, compiler):
+        if compiler.definitions is None:
+            raise SchemaError('%r is referenced, but there are no '
+                              'definitions' % self.name)
+        return compiler.definitions.resolve(self.name)
+
+
+class Definitions(object):
+    """
+    A registry of named schemas. Every named schema is compiled and
+    optimised once, when it is referenced for the first time, and its nodes
+    are shared by all schemas, that use the registry (schemas with adaptive
+    fields use their own copies):
+
+    >>> definitions = Definitions({'money': parse_decimal,
+    ...                            'item': {Required('price'): Ref('money')}})
+    >>> order = Schema({Required('items'): List(Ref('item'))},
+    ...                definitions=definitions)
+    >>> item = Schema(Ref('item'), definitions=definitions)
+    >>> items, = order.schema.inner_schema.values()
+    >>> assert item.schema is items.inner_schema
+    """
+
+    def __init__(self, definitions, extras=Extras.PREVENT):
+        """
+        :param definitions: a dictionary, that maps names to schemas
+        :param extras: a strategy to deal with extra fields in named
+        schemas. See Schema __init__ extras param for reference.
+        """
+        if not isinstance(definitions, dict):
+            raise SchemaError('expected a dictionary, got %r instead'
+                              % definitions)
+        if extras == Extras.INHERIT:
+            raise SchemaError('extras of definitions cannot be inherited')
+        self.definitions = dict(definitions)
+        self.extras = extras
+        self._nodes = {}
+        self._resolving = set()
+        # Names, that are compiled, but not optimised yet
+        self._compiled = []
+        self._optimizer = _Optimizer()
+
+    def resolve(self, name):
+        """
+        Returns a compiled named schema.
+        """
+        try:
+            return self._nodes[name]
+        except KeyError:
+            pass
+        if name not in self.definitions:
+            raise SchemaError('%r is not defined' % name)
+        if name in self._resolving:
+            raise SchemaError('%r refers to itself' % name)
+        compiler = _schema_compiler(self.extras, self)
+        schema = self.definitions[name]
+        for type, substitution_type in iteritems(compiler.substitutions):
+            if isinstance(schema, type):
+                schema = substitution_type(schema)
+                break
+        if isinstance(schema, _Compilable) and not isinstance(schema, Ref):
+            # Compilation mutates the node and returns it, so references
+            # inside of it can link to the node before it is compiled
+            self._nodes[name] = schema
+        self._resolving.add(name)
+        try:
+            self._nodes[name] = compiler.compile(schema)
+            self._compiled.append(name)
+        except Exception:
+            self._nodes.pop(name, None)
+            raise
+        finally:
+            self._resolving.discard(name)
+            if not self._resolving:
+                # Schemas are optimised, when all schemas, that they refer
+                # to, are compiled
+                compiled, self._compiled = self._compiled, []
+                for compiled_name in compiled:
+                    if compiled_name in self._nodes:
+                        self._nodes[compiled_name] = self._optimizer.optimize(
+                            self._nodes[compiled_name])
+        return self._nodes[name]
 
 
 def not_none(value):
@@ -983,7 +4170,7 @@ def not_none(value):
         return value
 
 
-class NotNone(object):
+class NotNone(_Compilable):
     """
     A convenience decorator alternative to not_none function:
 
@@ -1002,11 +4189,27 @@ class NotNone(object):
             raise SchemaError('NotNone is applicable only to callables')
         self._f = f
 
+    def _compile(self, compiler):
+        self._f = compiler.compile(self._f)
+        return self
+
     def __call__(self, value):
         return self._f(not_none(value))
 
+    def _convert_column(self, values):
+        results = list(values)
+        failures = {}
+        positions = []
+        for pos, value in enumerate(values):
+            if value is None:
+                failures[pos] = NoneInvalid('value is None')
+            else:
+                positions.append(pos)
+        _convert_column_subset(self._f, results, positions, failures)
+        return results, failures
+
 
-class Nullable(object):
+class Nullable(_Compilable):
     """
     This decorator returns None for None values otherwise the value is intact
 
@@ -1027,11 +4230,82 @@ class Nullable(object):
             raise SchemaError('Nullable is applicable only to callables')
         self._f = f
 
+    def _compile(self, compiler):
+        self._f = compiler.compile(self._f)
+        return self
+
     def __call__(self, value):
         if value is None:
             return None
         return self._f(value)
 
+    def _convert_column(self, values):
+        results = list(values)
+        failures = {}
+        _convert_column_subset(self._f, results,
+                               [pos for pos, value in enumerate(values)
+                                if value is not None],
+                               failures)
+        return results, failures
+
+
+class Blocking(object):
+    """
+    Marks a converter, that blocks on I/O (e.g. looks values up in a
+    database). If a schema has an executor, blocking converters of fields,
+    list elements and heads of chains (also wrapped into Nullable, NotNone
+    or Interned) are submitted to it before validation, so lookups of
+    a document run concurrently, and equal strings and integers are looked
+    up once. Validation then takes their results in the usual order, and
+    their errors get the usual paths. An executor is an object with
+    a submit method, that returns futures with result and cancel methods,
+    e.g. ThreadPoolExecutor of concurrent.futures. This one calls
+    converters, when their results are taken:
+
+    >>> class Call(object):
+    ...     def __init__(self, f, value):
+    ...         self.f = f
+    ...         self.value = value
+    ...     def result(self):
+    ...         return self.f(self.value)
+    ...     def cancel(self):
+    ...         pass
+    >>> class Executor(object):
+    ...     def submit(self, f, value):
+    ...         return Call(f, value)
+    >>> names = {1: 'one', 2: 'two'}
+    >>> schema = Schema(List({
+    ...     Required('id', rename_to='name'): Blocking(names.__getitem__)
+    ... }), executor=Executor())
+    >>> assert [{'name': 'one'}, {'name': 'two'}] == schema(
+    ...     [{'id': 1}, {'id': 2}])
+    >>> try:
+    ...     schema([{'id': 1}, {'id': 3}])
+    ...     assert False, "an exception should've been raised"
+    ... except MultipleInvalid as e:
+    ...     assert [1, 'id'] == e.path
+
+    Without an executor, and in positions, where the input of a converter
+    isn't known before validation, the converter is just called. Only
+    schema calls use the executor: loads, load and iter_json decode and
+    convert values in a single pass, so they call converters one by one.
+    """
+
+    def __init__(self, f):
+        if not callable(f):
+            raise SchemaError('Blocking is applicable only to callables')
+        self._f = f
+
+    def __call__(self, value):
+        table = getattr(_prefetched, 'table', None)
+        if table is not None:
+            key = _prefetch_key(self, value)
+            entry = table.get(key)
+            # Values, that are keyed by ids, should be the same objects
+            if entry is not None and (len(key) == 3 or entry[0] is value):
+                return entry[1].result()
+        return self._f(value)
+
 
 class StrictBoolean(object):
     """
@@ -1070,6 +4344,26 @@ class StrictBoolean(object):
                                 'True or one of %r to be considered False'
                                 % (self.true_values, self.false_values))
 
+    def _convert_column(self, values):
+        # Strings are looked up in a table, other values are converted
+        # one by one
+        table = {}
+        for result, allowed_values in ((False, self.false_values),
+                                       (True, self.true_values)):
+            for v in allowed_values:
+                if isinstance(v, str):
+                    table[v] = result
+        results = list(values)
+        failures = {}
+        positions = []
+        for pos, value in enumerate(values):
+            if type(value) is str and value in table:
+                results[pos] = table[value]
+            else:
+                positions.append(pos)
+        _convert_positions(self, results, positions, failures)
+        return results, failures
+
 
 def parse_decimal(value):
     """
@@ -1234,6 +4528,19 @@ class Length(object):
             raise LengthInvalid('data should have a langth at most of %d' % l)
         return data
 
+    def _convert_column(self, values):
+        results = list(values)
+        failures = {}
+        try:
+            lengths = list(map(len, values))
+        except TypeError:
+            positions = range(len(values))
+        else:
+            positions = _positions_out_of_bounds(lengths, self.min, self.max,
+                                                 True, True)
+        _convert_positions(self, results, positions, failures)
+        return results, failures
+
 
 class Range(object):
     """
@@ -1283,6 +4590,20 @@ class Range(object):
                 raise Range('data should be at most %r' % self.max)
         return data
 
+    def _convert_column(self, values):
+        # Only columns of plain integers or plain floats are checked in bulk,
+        # mixed columns are checked one by one to keep comparison semantics
+        results = list(values)
+        failures = {}
+        if set(map(type, values)) in (set([int]), set([float])):
+            positions = _positions_out_of_bounds(
+                values, self.min, self.max,
+                self.min_inclusive, self.max_inclusive)
+        else:
+            positions = range(len(values))
+        _convert_positions(self, results, positions, failures)
+        return results, failures
+
 
 class UnvalidatedDict(object):
     """
@@ -1395,3 +4716,1530 @@ class Chain(_Compilable):
         for f in self.validators:
             data = f(data)
         return data
+
+    def _convert_column(self, values):
+        results = list(values)
+        failures = {}
+        positions = range(len(values))
+        for f in self.validators:
+            positions = _convert_column_subset(f, results, positions,
+                                               failures)
+        return results, failures
+
+
+def _copy_schema(node, copies=None):
+    """
+    Returns a copy of a compiled schema, that shares only leaf converters
+    with the original one.
+    """
+    if copies is None:
+        copies = {}
+    try:
+        return copies[id(node)]
+    except KeyError:
+        pass
+    if not isinstance(node, (_Mapping, List, FixedList, Union, Chain,
+                             Nullable, NotNone)):
+        return node
+    # Copies are made with __getstate__, so caches of nodes are not shared
+    result = copies[id(node)] = copy.copy(node)
+    if isinstance(node, _Mapping):
+        result.inner_schema = dict(
+            (marker, _copy_schema(converter, copies))
+            for marker, converter in iteritems(node.inner_schema))
+        if isinstance(node, FromObject):
+            result._prepare_fields()
+    elif isinstance(node, List):
+        result.inner_schema = _copy_schema(node.inner_schema, copies)
+    elif isinstance(node, FixedList):
+        result.inner_schemas = [_copy_schema(inner_schema, copies)
+                                for inner_schema in node.inner_schemas]
+    elif isinstance(node, Union):
+        result.variants = dict((tag, _copy_schema(variant, copies))
+                               for tag, variant in iteritems(node.variants))
+        if node.fallback is not None:
+            result.fallback = _copy_schema(node.fallback, copies)
+    elif isinstance(node, Chain):
+        result.validators = [_copy_schema(f, copies)
+                             for f in node.validators]
+    else:
+        result._f = _copy_schema(node._f, copies)
+    return result
+
+
+def _iter_nodes(node):
+    """
+    Yields nodes of a compiled schema once each, including node itself.
+    """
+    seen = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        if isinstance(node, _Mapping):
+            stack.extend(converter for converter in node.inner_schema.values()
+                         if converter is not None)
+        elif isinstance(node, List):
+            stack.append(node.inner_schema)
+        elif isinstance(node, FixedList):
+            stack.extend(node.inner_schemas)
+        elif isinstance(node, Union):
+            stack.extend(node.variants.values())
+            if node.fallback is not None:
+                stack.append(node.fallback)
+        elif isinstance(node, Chain):
+            stack.extend(node.validators)
+        elif isinstance(node, _Adaptive):
+            stack.append(node.converter)
+        elif isinstance(node, (Nullable, NotNone)):
+            stack.append(node._f)
+
+
+def _format_schema(node, label='', indent='', lines=None, stack=()):
+    """
+    Returns a list of lines, that describe a compiled schema: one node per
+    line, children are indented.
+    """
+    if lines is None:
+        lines = []
+    if id(node) in stack:
+        lines.append(indent + label + '<recursion>')
+        return lines
+    stack += (id(node),)
+    child_indent = indent + '  '
+    if isinstance(node, _Adaptive):
+        lines.append(indent + label + 'Adaptive')
+        _format_schema(node.converter, '', child_indent, lines, stack)
+    elif isinstance(node, _Mapping):
+        table = getattr(node, 'table', None)
+        lines.append('%s%s%s(%s%s)' % (indent, label, type(node).__name__,
+                                       node.extras,
+                                       '' if table is None else
+                                       ', table=%r' % table.name))
+        for marker in _sorted_markers(node):
+            _format_schema(node.inner_schema[marker],
+                           '%s(%r): ' % (type(marker).__name__, marker.name),
+                           child_indent, lines, stack)
+    elif isinstance(node, List):
+        options = [name for name, enabled in
+                   (('columnar', node.columnar),
+                    ('sample=%r' % getattr(node.sample, 'rate', None),
+                     node.sample is not None)) if enabled]
+        lines.append(indent + label + 'List' +
+                     ('(%s)' % ', '.join(options) if options else ''))
+        _format_schema(node.inner_schema, '', child_indent, lines, stack)
+    elif isinstance(node, FixedList):
+        lines.append(indent + label + 'FixedList')
+        for inner_schema in node.inner_schemas:
+            _format_schema(inner_schema, '', child_indent, lines, stack)
+    elif isinstance(node, Union):
+        lines.append('%s%sUnion(%r)' % (indent, label, node.discriminator))
+        for tag in sorted(node.variants, key=repr):
+            _format_schema(node.variants[tag], '%r: ' % (tag,),
+                           child_indent, lines, stack)
+        if node.fallback is not None:
+            _format_schema(node.fallback, 'fallback: ', child_indent,
+                           lines, stack)
+    elif isinstance(node, Chain):
+        lines.append(indent + label + 'Chain')
+        for f in node.validators:
+            _format_schema(f, '', child_indent, lines, stack)
+    elif isinstance(node, (NotNone, Nullable)):
+        lines.append(indent + label + type(node).__name__)
+        _format_schema(node._f, '', child_indent, lines, stack)
+    elif isinstance(node, Enum):
+        lines.append('%s%sEnum(%s)' % (
+            indent, label, ', '.join(repr(v.value)
+                                     for v in _sorted_enum_values(node))))
+    elif isinstance(node, Literal):
+        lines.append('%s%sLiteral(%r)' % (indent, label, node.value))
+    elif isinstance(node, (Length, Range)):
+        lines.append('%s%s%s(%s)' % (
+            indent, label, type(node).__name__,
+            ', '.join('%s=%r' % (name, getattr(node, name))
+                      for name in ('min', 'max')
+                      if getattr(node, name) is not None)))
+    else:
+        lines.append(indent + label + getattr(node, '__name__',
+                                              type(node).__name__))
+    return lines
+
+
+# Types, that return an equal value of the same type, when they are called
+# with an instance of exactly the same type
+_IDEMPOTENT_TYPES = (str, int, float, complex, bool, decimal.Decimal)
+
+
+class _Optimizer(object):
+    """
+    Rewrites a compiled schema into an equivalent one, that does less work.
+    Containers are changed in place, wrappers are replaced with new nodes.
+    Nodes, that another optimizer has optimised already, are neither
+    optimised again nor changed.
+    """
+
+    def __init__(self, shared=None):
+        # Entries are (node, optimised node), so that ids of nodes are not
+        # reused while an optimizer is alive
+        self.optimized = {}
+        self.shared = {} if shared is None else shared.optimized
+
+    def optimize(self, node):
+        key = id(node)
+        try:
+            return self.shared[key][1]
+        except KeyError:
+            pass
+        try:
+            return self.optimized[key][1]
+        except KeyError:
+            pass
+        # Recursive schemas refer to containers, that are being optimised
+        self.optimized[key] = (node, node)
+        result = self._optimize(node)
+        self.optimized[key] = (node, result)
+        self.optimized.setdefault(id(result), (result, result))
+        return result
+
+    def _optimize(self, node):
+        if isinstance(node, _Mapping):
+            for marker, converter in list(iteritems(node.inner_schema)):
+                node.inner_schema[marker] = self.optimize(converter)
+            if isinstance(node, FromObject):
+                node._prepare_fields()
+        elif isinstance(node, List):
+            node.inner_schema = self.optimize(node.inner_schema)
+        elif isinstance(node, FixedList):
+            node.inner_schemas = [self.optimize(inner_schema)
+                                  for inner_schema in node.inner_schemas]
+        elif isinstance(node, Union):
+            for tag, variant in list(iteritems(node.variants)):
+                node.variants[tag] = self.optimize(variant)
+            if node.fallback is not None:
+                node.fallback = self.optimize(node.fallback)
+        elif isinstance(node, Chain):
+            return self.optimize_chain(node)
+        elif type(node) is NotNone:
+            f = self.optimize(node._f)
+            # Values are never None inside of NotNone
+            while type(f) in (NotNone, Nullable):
+                f = f._f
+            return NotNone(f)
+        elif type(node) is Nullable:
+            f = self.optimize(node._f)
+            # None values never reach the wrapped function
+            while type(f) in (NotNone, Nullable):
+                f = f._f
+            return Nullable(f)
+        return node
+
+    def optimize_chain(self, node):
+        validators = []
+        for f in node.validators:
+            f = self.optimize(f)
+            if type(f) is Chain:
+                validators.extend(f.validators)
+            else:
+                validators.append(f)
+        result = []
+        known_type = None
+        for f in validators:
+            if known_type is not None and (f is known_type or
+                                           f is not_none):
+                continue
+            if type(f) is Length and result and type(result[-1]) is Length:
+                fused = self.fuse_lengths(result[-1], f)
+                if fused is not None:
+                    result[-1] = fused
+                    continue
+            result.append(f)
+            known_type = self.output_type(f, known_type)
+        node.validators = result
+        if len(result) == 1:
+            return result[0]
+        return node
+
+    @staticmethod
+    def fuse_lengths(first, second):
+        # Length checks the minimum first, so checks can be merged unless
+        # the first maximum would be checked before the second minimum
+        if first.max is not None and second.min is not None:
+            return None
+        mins = [l for l in (first.min, second.min) if l is not None]
+        maxes = [l for l in (first.max, second.max) if l is not None]
+        return Length(max(mins) if mins else None,
+                      min(maxes) if maxes else None)
+
+    def output_type(self, f, input_type):
+        """
+        Returns an exact type of values, that f returns, if it is known.
+        """
+        if f in _IDEMPOTENT_TYPES:
+            return f
+        elif f is parse_decimal:
+            return decimal.Decimal
+        elif type(f) is Literal and f.converter in _IDEMPOTENT_TYPES:
+            return f.converter
+        elif type(f) is Enum:
+            types = set(self.output_type(v, None) for v in f.values)
+            if len(types) == 1:
+                return types.pop()
+        elif type(f) is NotNone:
+            return self.output_type(f._f, None)
+        elif type(f) in (Length, Range) or f is not_none:
+            return input_type
+        return None
+
+
+class _Adaptive(object):
+    """
+    Wraps a field converter, that has fast paths for values of some exact
+    types. Types of the first values are counted, then a fast path for
+    the most common type is installed, if there is one. Fast paths return
+    the same results and raise the same errors as the converter.
+    """
+
+    def __init__(self, converter, warmup):
+        self.converter = converter
+        self.warmup = warmup
+        self.fast_paths = self.find_fast_paths(converter)
+        if type(converter) is Enum:
+            self.enum_values = dict((v.value, v.value)
+                                    for v in converter.values)
+        self.reset()
+
+    def reset(self):
+        self.types = defaultdict(int)
+        self.calls = 0
+        self.guard = None
+        self.fast = None
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # Fast paths are bound methods, statistics are per process anyway
+        state = self.__dict__.copy()
+        state.update(types=defaultdict(int), calls=0, guard=None, fast=None,
+                     hits=0, misses=0)
+        return state
+
+    def __call__(self, value):
+        if type(value) is self.guard:
+            self.hits += 1
+            return self.fast(value)
+        if self.calls < self.warmup:
+            self.types[type(value)] += 1
+            self.calls += 1
+            if self.calls == self.warmup:
+                self.specialise()
+        else:
+            self.misses += 1
+        return self.converter(value)
+
+    def _convert_column(self, values):
+        return _convert_column(self.converter, values)
+
+    def specialise(self):
+        common_type = max(self.types, key=self.types.get)
+        if common_type in self.fast_paths:
+            self.guard = common_type
+            self.fast = getattr(self, self.fast_paths[common_type])
+
+    def stats(self):
+        return {'types': dict(self.types), 'guard': self.guard,
+                'hits': self.hits, 'misses': self.misses}
+
+    @staticmethod
+    def find_fast_paths(converter):
+        """
+        Returns a dictionary, that maps types to names of fast path methods.
+        """
+        if converter in _IDEMPOTENT_TYPES:
+            return {converter: 'identity'}
+        elif type(converter) is Literal and \
+                converter.converter in _IDEMPOTENT_TYPES:
+            return {converter.converter: 'literal'}
+        elif type(converter) is Chain and converter.validators and \
+                converter.validators[0] in _IDEMPOTENT_TYPES:
+            return {converter.validators[0]: 'chain_tail'}
+        elif type(converter) is Enum:
+            types = set(v.converter if type(v) is Literal else None
+                        for v in converter.values)
+            if len(types) == 1:
+                value_type = types.pop()
+                # NaN values are never equal to themselves, so they are
+                # not looked up in sets
+                if value_type in _IDEMPOTENT_TYPES and \
+                        value_type not in (float, complex):
+                    return {value_type: 'enum'}
+        elif type(converter) is Nullable and \
+                converter._f in _IDEMPOTENT_TYPES:
+            return {converter._f: 'identity', type(None): 'none'}
+        elif type(converter) is NotNone and \
+                converter._f in _IDEMPOTENT_TYPES:
+            return {converter._f: 'identity'}
+        return {}
+
+    def identity(self, value):
+        return value
+
+    def none(self, value):
+        return None
+
+    def literal(self, value):
+        if self.converter.value != value:
+            raise self.converter._invalid(value)
+        return value
+
+    def chain_tail(self, value):
+        for f in self.converter.validators[1:]:
+            value = f(value)
+        return value
+
+    def enum(self, value):
+        try:
+            canonical = self.enum_values[value]
+        except KeyError:
+            raise EnumInvalid('none of enum values matches %r' % value)
+        if self.converter.intern:
+            return canonical
+        return value
+
+    @classmethod
+    def install(cls, node, warmup):
+        """
+        Wraps converters of fields and list elements, that have fast paths.
+        Returns a list of paths and installed nodes.
+        """
+        installed = []
+        seen = set()
+        stack = [(node, ())]
+        while stack:
+            node, path = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if isinstance(node, _Mapping):
+                for marker, converter in list(iteritems(node.inner_schema)):
+                    node.inner_schema[marker] = cls.wrap(
+                        converter, warmup, path + (marker.name,), installed,
+                        stack)
+                if isinstance(node, FromObject):
+                    node._prepare_fields()
+            elif isinstance(node, List):
+                node.inner_schema = cls.wrap(node.inner_schema, warmup,
+                                             path + ('*',), installed, stack)
+            elif isinstance(node, FixedList):
+                node.inner_schemas = [
+                    cls.wrap(inner_schema, warmup, path + (idx,), installed,
+                             stack)
+                    for idx, inner_schema in enumerate(node.inner_schemas)]
+            elif isinstance(node, Union):
+                # Fields of variants are prefixed with tags of variants,
+                # fields of the fallback are prefixed with None
+                for tag, variant in iteritems(node.variants):
+                    stack.append((variant, path + (tag,)))
+                if node.fallback is not None:
+                    stack.append((node.fallback, path + (None,)))
+            elif isinstance(node, Chain):
+                for f in node.validators:
+                    stack.append((f, path))
+            elif isinstance(node, (Nullable, NotNone)):
+                stack.append((node._f, path))
+        return installed
+
+    @classmethod
+    def wrap(cls, converter, warmup, path, installed, stack):
+        # Builtin types are not wrapped: a conversion of a value of the same
+        # type is a single call already, a fast path would only add a call
+        if converter not in _IDEMPOTENT_TYPES and \
+                cls.find_fast_paths(converter):
+            node = cls(converter, warmup)
+            installed.append((path, node))
+            return node
+        stack.append((converter, path))
+        return converter
+
+
+_NO_VALUE = Undefined()
+
+_LETTERS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+class _Generator(object):
+    """
+    Generates data for a compiled schema. Invalid records are valid
+    records with mutations: required fields are removed, unknown fields
+    are added, values are replaced with values, that their converters
+    reject. Mutations are applied until a record is invalid.
+    """
+    # Records are at most this much deeper than max_depth, when schemas
+    # require deeper data
+    DEPTH_MARGIN = 100
+    # Values of a head of a chain are generated this many times at most,
+    # until one passes the whole chain
+    CHAIN_ATTEMPTS = 100
+    # Values of non-integer numbers are generated with this many digits
+    # after the point
+    PRECISION = 2
+
+    def __init__(self, rng, generators, max_list_len, max_depth):
+        self.rng = rng
+        # Custom generators are looked up by ids, because converters
+        # aren't necessarily hashable
+        self.custom = dict((id(converter), generator) for converter, generator
+                           in iteritems(generators))
+        self.max_list_len = max_list_len
+        self.max_depth = max_depth
+        self.mutations = None
+        self._invalid = {}
+        # Values, that pass chains, that start with Enum or Literal
+        self._valid = {}
+        self.methods = {
+            Dict: self.mapping, MakeObject: self.mapping,
+            List: self.list, FixedList: self.fixed_list,
+            Union: self.union, Enum: self.enum, Literal: self.literal,
+            Chain: self.chain, Range: self.chain, Length: self.chain,
+            ParseDateTime: self.parse_datetime,
+            FormatDateTime: self.format_datetime,
+            StrictBoolean: self.strict_boolean,
+            Nullable: self.nullable, NotNone: self.wrapped,
+            Interned: self.wrapped, Blocking: self.wrapped,
+            _Adaptive: self.adaptive,
+            UnvalidatedDict: lambda node, depth: {},
+            UnvalidatedList: lambda node, depth: [],
+        }
+        numbers = (int, float, complex, decimal.Decimal, parse_decimal)
+        for converter in numbers + (strtype, str):
+            self.methods[converter] = self.chain
+        self.methods[bool] = lambda node, depth: self.rng.random() < 0.5
+
+    def records(self, node, n, invalid_ratio):
+        rng = self.rng
+
+        def validate(record):
+            try:
+                node(record)
+            except Exception:
+                return False
+            return True
+
+        for _ in itertools.count() if n is None else range(n):
+            yield self.record(node, invalid_ratio and
+                              rng.random() < invalid_ratio, validate)
+
+    def record(self, node, invalid, validate):
+        if not invalid:
+            return self.value(node, 0)
+        self.mutations = []
+        try:
+            record = self.value(node, 0)
+            mutations = self.mutations
+        finally:
+            self.mutations = None
+        self.rng.shuffle(mutations)
+        for mutate in mutations:
+            mutate()
+            if not validate(record):
+                return record
+        bad = self.invalid(node)
+        return record if bad is _NO_VALUE else bad
+
+    def value(self, node, depth):
+        if depth > self.max_depth + self.DEPTH_MARGIN:
+            raise SchemaError('schema requires data nested deeper than %d'
+                              % depth)
+        generate = self.custom.get(id(node))
+        if generate is not None:
+            return generate(self.rng)
+        try:
+            method = self.methods.get(node)
+        except TypeError:
+            method = None
+        method = method or self.methods.get(type(node))
+        if method is None:
+            raise SchemaError('cannot generate values for %r, pass a '
+                              'generator for it' % (node,))
+        return method(node, depth)
+
+    def invalid(self, node):
+        """
+        Returns a value, that a converter is likely to reject, or
+        _NO_VALUE.
+        """
+        key = id(node)
+        try:
+            return self._invalid[key]
+        except KeyError:
+            pass
+        node_type = type(node)
+        if node in (int, float, complex, decimal.Decimal, parse_decimal) or \
+                node_type in (ParseDateTime, FormatDateTime, StrictBoolean,
+                              Dict, MakeObject, List, FixedList, Union,
+                              UnvalidatedDict, UnvalidatedList):
+            value = 'x'
+        elif node_type in (Enum, Literal):
+            value = 'invalid\x00'
+        elif node_type is Range:
+            value = node.max + 1 if node.max is not None else \
+                node.min - 1 if node.min is not None else _NO_VALUE
+        elif node_type is Length:
+            value = 'x' * (node.max + 1) if node.max is not None else ''
+        elif node_type is NotNone:
+            value = None
+        elif node_type in (Nullable, Interned, Blocking):
+            value = self.invalid(node._f)
+        elif node_type is _Adaptive:
+            value = self.invalid(node.converter)
+        elif node_type is Chain:
+            value = _NO_VALUE
+            for validator in node.validators:
+                value = self.invalid(validator)
+                if value is not _NO_VALUE:
+                    break
+        else:
+            value = _NO_VALUE
+        self._invalid[key] = value
+        return value
+
+    def _mutate(self, container, key, node):
+        bad = self.invalid(node)
+        if bad is not _NO_VALUE:
+            self.mutations.append(lambda: container.__setitem__(key, bad))
+
+    def mapping(self, node, depth):
+        rng = self.rng
+        deep = depth >= self.max_depth
+        inclusive = dict((monitor, not deep and rng.random() < 0.5)
+                         for monitor in node.inclusive_monitors)
+        exclusive = dict((monitor, None if deep else
+                          rng.choice(sorted(names) + [None]))
+                         for monitor, names in
+                         iteritems(node.exclusive_monitors))
+        result = {}
+        for marker in _sorted_markers(node):
+            if isinstance(marker, Required):
+                include = True
+            elif isinstance(marker, Inclusive):
+                include = inclusive[marker._monitor]
+            elif isinstance(marker, Exclusive):
+                include = exclusive[marker._monitor] == marker.name
+            else:
+                include = not deep and rng.random() < 0.5
+            if not include:
+                continue
+            converter = node.inner_schema[marker]
+            result[marker.name] = self.value(converter, depth + 1)
+            if self.mutations is not None:
+                if isinstance(marker, Required):
+                    self.mutations.append(
+                        lambda name=marker.name: result.pop(name, None))
+                self._mutate(result, marker.name, converter)
+        if self.mutations is not None and node.extras == Extras.PREVENT:
+            self.mutations.append(
+                lambda: result.__setitem__('unknown\x00', None))
+        return result
+
+    def list(self, node, depth, min_len=None, max_len=None):
+        min_len = min_len or 0
+        if max_len is None:
+            max_len = max(min_len, 0 if depth >= self.max_depth
+                          else self.max_list_len)
+        result = [self.value(node.inner_schema, depth + 1)
+                  for _ in range(self.rng.randint(min_len, max_len))]
+        if self.mutations is not None and result:
+            self._mutate(result, self.rng.randrange(len(result)),
+                         node.inner_schema)
+        return result
+
+    def fixed_list(self, node, depth):
+        result = [self.value(inner_schema, depth + 1)
+                  for inner_schema in node.inner_schemas]
+        if self.mutations is not None:
+            for idx, inner_schema in enumerate(node.inner_schemas):
+                self._mutate(result, idx, inner_schema)
+        return result
+
+    def union(self, node, depth):
+        tag = self.rng.choice(sorted(node.variants, key=repr))
+        result = self.value(node.variants[tag], depth)
+        if isinstance(result, dict):
+            result[node.discriminator] = tag
+        return result
+
+    def enum(self, node, depth):
+        return self.rng.choice(_sorted_enum_values(node)).value
+
+    def literal(self, node, depth):
+        return node.value
+
+    def chain(self, node, depth):
+        """
+        Generates values for builtin types, Range and Length, and for
+        chains of them, so that values of chains satisfy ranges and
+        lengths, that follow the first converter. Nullable and NotNone at
+        the head of a chain are looked through. Values of chains, that
+        start with Enum or Literal, are chosen among the ones, that pass
+        the whole chain.
+        """
+        validators = node.validators if type(node) is Chain else [node]
+        if not validators:
+            return self.string(None, None)
+        first = validators[0]
+        while len(validators) > 1 and type(first) in (Nullable, NotNone):
+            # None would be passed to the rest of the chain
+            first = first._f
+        ranges = [v for v in validators if type(v) is Range]
+        lengths = [v for v in validators if type(v) is Length]
+        min_len = max([v.min for v in lengths if v.min is not None] or
+                      [None])
+        max_len = min([v.max for v in lengths if v.max is not None] or
+                      [None])
+        if type(first) is List:
+            return self.list(first, depth, min_len, max_len)
+        if first in (float, complex, decimal.Decimal, parse_decimal):
+            return self.number(first, ranges)
+        if first is int or type(first) is Range:
+            return self.number(int, ranges)
+        if first in (strtype, str) or type(first) is Length:
+            return self.string(min_len, max_len)
+        if len(validators) > 1 and type(first) in (Enum, Literal):
+            return self.chain_choice(node, first)
+        if len(validators) == 1:
+            return self.value(first, depth)
+        # Other converters know nothing of the rest of the chain, so their
+        # values are checked
+        for _ in range(self.CHAIN_ATTEMPTS):
+            value = self.value(first, depth)
+            try:
+                node(value)
+            except Exception:
+                continue
+            return value
+        raise SchemaError('cannot generate values for %r, pass a '
+                          'generator for it' % (node,))
+
+    def chain_choice(self, node, first):
+        try:
+            valid = self._valid[id(node)]
+        except KeyError:
+            if type(first) is Enum:
+                candidates = [v.value for v in _sorted_enum_values(first)]
+            else:
+                candidates = [first.value]
+            valid = self._valid[id(node)] = []
+            for value in candidates:
+                try:
+                    node(value)
+                except Exception:
+                    continue
+                valid.append(value)
+        if not valid:
+            raise SchemaError('%r accepts none of values of %r'
+                              % (node, first))
+        return self.rng.choice(valid)
+
+    def number(self, number_type, ranges):
+        # Bounds are counted in steps of generated values: units for int,
+        # hundredths for other types. Exclusive bounds are moved by a step
+        places = 0 if number_type is int else self.PRECISION
+
+        def steps(bound, rounding):
+            if isinstance(bound, float):
+                bound = repr(bound)
+            return int(decimal.Decimal(bound).scaleb(places)
+                       .to_integral_value(rounding))
+
+        low = None
+        high = None
+        for r in ranges:
+            if r.min is not None:
+                bound = steps(r.min, decimal.ROUND_CEILING) \
+                    if r.min_inclusive else \
+                    steps(r.min, decimal.ROUND_FLOOR) + 1
+                low = bound if low is None else max(low, bound)
+            if r.max is not None:
+                bound = steps(r.max, decimal.ROUND_FLOOR) \
+                    if r.max_inclusive else \
+                    steps(r.max, decimal.ROUND_CEILING) - 1
+                high = bound if high is None else min(high, bound)
+        span = 10000 * 10 ** places
+        if low is None:
+            low = 0 if high is None else min(0, high - span)
+        if high is None:
+            high = low + span
+        if low > high:
+            raise SchemaError('ranges leave no %s values with %d digits '
+                              'after the point' % (number_type.__name__,
+                                                   places))
+        value = self.rng.randint(low, high)
+        if number_type is int:
+            return value
+        value = decimal.Decimal(value).scaleb(-places)
+        if number_type is float:
+            return float(value)
+        if number_type is complex:
+            return complex(float(value), 0)
+        # parse_decimal rejects floats, but accepts strings
+        return str(value)
+
+    def string(self, min_len, max_len):
+        if max_len is None:
+            max_len = max(12, min_len or 0)
+        length = self.rng.randint(min(min_len or 1, max_len), max_len)
+        choice = self.rng.choice
+        return ''.join([choice(_LETTERS) for _ in range(length)])
+
+    def parse_datetime(self, node, depth):
+        return self.datetime().strftime(node.datetime_format)
+
+    def format_datetime(self, node, depth):
+        return self.datetime()
+
+    def datetime(self):
+        return datetime(2000, 1, 1) + timedelta(
+            seconds=self.rng.randrange(30 * 365 * 24 * 3600))
+
+    def strict_boolean(self, node, depth):
+        return self.rng.choice(list(node.true_values) +
+                               list(node.false_values))
+
+    def nullable(self, node, depth):
+        if self.rng.random() < 0.1:
+            return None
+        return self.value(node._f, depth)
+
+    def wrapped(self, node, depth):
+        return self.value(node._f, depth)
+
+    def adaptive(self, node, depth):
+        return self.value(node.converter, depth)
+
+
+def _identity(data):
+    return data
+
+
+def _projector(node, projectors):
+    """
+    Returns a function, that applies structural transformations of node
+    to data, or None, if node does not transform structure.
+    """
+    try:
+        return projectors[id(node)]
+    except KeyError:
+        pass
+    node_type = type(node)
+    if node_type in (Nullable, NotNone):
+        # None passes through, as it does in validation of Nullable
+        project = _projector(node._f, projectors)
+        if project is None:
+            return None
+        return lambda data: None if data is None else project(data)
+    if node_type is _Adaptive:
+        return _projector(node.converter, projectors)
+    if node_type is Chain:
+        projects = [project for project in
+                    (_projector(v, projectors) for v in node.validators)
+                    if project is not None]
+        if not projects:
+            return None
+        if len(projects) == 1:
+            return projects[0]
+
+        def project_chain(data):
+            for project in projects:
+                data = project(data)
+            return data
+        return project_chain
+    if not isinstance(node, (Dict, FromObject, List, FixedList, Union)):
+        if isinstance(node, _Compilable) and \
+                not isinstance(node, (Literal, Enum)):
+            raise SchemaError('cannot project %r' % (node,))
+        # Structure, that is hidden in unknown wrappers, can't be
+        # projected
+        for value in getattr(node, '__dict__', {}).values():
+            if isinstance(value, (_Mapping, List, FixedList, Union)):
+                raise SchemaError('cannot project %r' % (node,))
+        return None
+    # A recursive schema refers to the node, before its function is built
+    built = []
+
+    def forward(data):
+        return built[0](data)
+
+    projectors[id(node)] = forward
+    if isinstance(node, List):
+        project = _list_projector(node, projectors)
+    elif isinstance(node, FixedList):
+        project = _fixed_list_projector(node, projectors)
+    elif isinstance(node, Union):
+        project = _union_projector(node, projectors)
+    else:
+        project = _mapping_projector(node, projectors)
+    built.append(project)
+    projectors[id(node)] = project
+    return project
+
+
+def _mapping_projector(node, projectors):
+    renames = []
+    nested = []
+    for marker, converter in iteritems(node.inner_schema):
+        project = _projector(converter, projectors)
+        if project is None:
+            renames.append((marker.name, marker.rename_to))
+        else:
+            nested.append((marker.name, marker.rename_to, project))
+    allow_extras = node.extras == Extras.ALLOW and \
+        not isinstance(node, FromObject)
+    # Dicts inside of Nullable and NotNone are not compiled
+    names = dict((marker.name, marker) for marker in node.inner_schema)
+    prepare_data = node.prepare_data if isinstance(node, FromObject) \
+        else None
+    prepare_result = node.prepare_result if isinstance(node, MakeObject) \
+        or getattr(node, 'intern', False) else None
+
+    def project_mapping(data):
+        if prepare_data is not None:
+            data = prepare_data(data)
+        result = {}
+        for name, rename_to in renames:
+            if name in data:
+                result[rename_to] = data[name]
+        for name, rename_to, project in nested:
+            if name in data:
+                result[rename_to] = project(data[name])
+        if allow_extras:
+            for key, value in iteritems(data):
+                if key not in names:
+                    result[key] = value
+        if prepare_result is not None:
+            return prepare_result(result)
+        return result
+    return project_mapping
+
+
+def _list_projector(node, projectors):
+    project = _projector(node.inner_schema, projectors)
+    if project is None:
+        return list
+
+    def project_list(data):
+        return [project(value) for value in data]
+    return project_list
+
+
+def _fixed_list_projector(node, projectors):
+    projects = [_projector(inner_schema, projectors) or _identity
+                for inner_schema in node.inner_schemas]
+
+    def project_fixed_list(data):
+        return [project(value) for project, value in zip(projects, data)]
+    return project_fixed_list
+
+
+def _union_projector(node, projectors):
+    projects = dict((id(variant), _projector(variant, projectors) or
+                     _identity)
+                    for variant in node.variants.values())
+    if node.fallback is not None:
+        projects[id(node.fallback)] = _projector(node.fallback,
+                                                 projectors) or _identity
+
+    def project_union(data):
+        return projects[id(node.select(data))](data)
+    return project_union
+
+
+_prefetched = threading.local()
+
+
+def _prefetch(node, data, executor):
+    """
+    Walks data along a schema and submits calls of Blocking converters to
+    an executor. Returns a dictionary, that maps keys of converters and
+    values (see _prefetch_key) to values (to keep them alive) and futures,
+    so equal values are looked up once. Data is not validated: parts, that
+    don't match the schema, are skipped.
+    """
+    table = {}
+    stack = [(node, data)]
+    while stack:
+        node, data = stack.pop()
+        node_type = type(node)
+        if node_type is Blocking:
+            key = _prefetch_key(node, data)
+            if key not in table:
+                table[key] = (data, executor.submit(node._f, data))
+        elif node_type is _Adaptive:
+            stack.append((node.converter, data))
+        elif node_type is Nullable:
+            if data is not None:
+                stack.append((node._f, data))
+        elif node_type in (NotNone, Interned):
+            stack.append((node._f, data))
+        elif node_type is Chain:
+            if node.validators:
+                stack.append((node.validators[0], data))
+        elif isinstance(node, _Mapping):
+            try:
+                data = node.prepare_data(data)
+            except Exception:
+                continue
+            for marker, converter in iteritems(node.inner_schema):
+                if converter is not None and \
+                        node.is_key_in_data(marker.name, data):
+                    stack.append((converter,
+                                  node.get_value(marker.name, data)))
+        elif isinstance(node, List):
+            if not isinstance(data, list):
+                continue
+            if node.sample is None:
+                values = data
+            elif node.sample.seed is None:
+                # Random positions can't be predicted
+                values = [data[idx] for idx in
+                          node.sample.positions(len(data))]
+            else:
+                continue
+            for value in values:
+                stack.append((node.inner_schema, value))
+        elif isinstance(node, FixedList):
+            if isinstance(data, (list, tuple)) and \
+                    len(data) == len(node.inner_schemas):
+                stack.extend(zip(node.inner_schemas, data))
+        elif isinstance(node, Union):
+            try:
+                stack.append((node.select(data), data))
+            except Exception:
+                continue
+    return table
+
+
+_INTERCHANGEABLE_TYPES = STRING_TYPES + (bytes, int)
+
+
+def _prefetch_key(node, value):
+    """
+    Returns a key of a Blocking converter call in tables of _prefetch.
+    Strings and integers are keyed by their types and values, because
+    equal ones are interchangeable. Other values are keyed by ids: equal
+    values of other types can differ (e.g. Decimal('1.0') and
+    Decimal('1.00')).
+    """
+    if type(value) in _INTERCHANGEABLE_TYPES:
+        return id(node), type(value), value
+    return id(node), id(value)
+
+
+class _Result(object):
+    """
+    The last value, yielded by a walker.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _walk_dict(node, data, walkers):
+    data = node.prepare_data(data)
+    result = {}
+    inclusive = defaultdict(set)
+    exclusive = defaultdict(set)
+    errors = []
+    for marker, converter in iteritems(node.inner_schema):
+        key = marker.name
+        if key in data:
+            value = data.pop(key)
+            if isinstance(marker, Inclusive):
+                inclusive[marker._monitor].add(key)
+            if isinstance(marker, Exclusive):
+                exclusive[marker._monitor].add(key)
+            if converter is None:
+                continue
+            walker = walkers.get(type(converter))
+            try:
+                if walker is None:
+                    value = converter(value)
+                else:
+                    value = yield walker(converter, value, walkers)
+            except Exception as e:
+                errors.extend(collect_invalids(e, [key]))
+            else:
+                result[marker.rename_to or key] = value
+        elif isinstance(marker, Required):
+            errors.append(RequiredInvalid('required field is missing',
+                                          [key]))
+    yield _Result(node._finish(data, result, inclusive, exclusive, errors))
+
+
+def _walk_dict_inplace(node, data, walkers):
+    if not isinstance(data, dict):
+        raise DictInvalid('expected a dictionary, got %r instead' % data)
+    inclusive = defaultdict(set)
+    exclusive = defaultdict(set)
+    errors = []
+    # Renaming is postponed, because a new name can be a name of a field,
+    # that is not converted yet
+    renamed = []
+    for marker, converter in iteritems(node.inner_schema):
+        key = marker.name
+        if key in data:
+            if isinstance(marker, Inclusive):
+                inclusive[marker._monitor].add(key)
+            if isinstance(marker, Exclusive):
+                exclusive[marker._monitor].add(key)
+            if converter is None:
+                del data[key]
+                continue
+            walker = walkers.get(type(converter))
+            try:
+                if walker is None:
+                    value = converter(data[key])
+                else:
+                    value = yield walker(converter, data[key], walkers)
+            except Exception as e:
+                errors.extend(collect_invalids(e, [key]))
+                continue
+            rename_to = marker.rename_to
+            if rename_to == key:
+                data[key] = value
+            else:
+                del data[key]
+                renamed.append((rename_to, value))
+        elif isinstance(marker, Required):
+            errors.append(RequiredInvalid('required field is missing',
+                                          [key]))
+    markers_by_name = node._markers_by_name
+    unknown = dict((key, value) for key, value in iteritems(data)
+                   if key not in markers_by_name)
+    # Extras are removed before renaming, because a field can be renamed
+    # to a name of a removed extra
+    if node.extras == Extras.REMOVE:
+        for key in unknown:
+            del data[key]
+    for key, value in renamed:
+        # Allowed extras take precedence, as they do in results
+        if key not in unknown or node.extras != Extras.ALLOW:
+            data[key] = value
+    node._finish(unknown, data, inclusive, exclusive, errors)
+    yield _Result(data)
+
+
+def _walk_list(node, data, walkers):
+    if node.columnar or node.sample is not None or \
+            not isinstance(data, list):
+        yield _Result(node(data))
+        return
+    converter = node.inner_schema
+    walker = walkers.get(type(converter))
+    result = []
+    errors = []
+    for idx, value in enumerate(data):
+        try:
+            if walker is None:
+                value = converter(value)
+            else:
+                value = yield walker(converter, value, walkers)
+        except Exception as e:
+            errors.extend(collect_invalids(e, [idx]))
+        else:
+            result.append(value)
+    if errors:
+        raise MultipleInvalid(errors)
+    yield _Result(result)
+
+
+def _walk_list_inplace(node, data, walkers):
+    if (node.columnar or node.sample is not None) and \
+            isinstance(data, list):
+        data[:] = node(data)
+        yield _Result(data)
+        return
+    if not isinstance(data, list):
+        yield _Result(node(data))
+        return
+    converter = node.inner_schema
+    walker = walkers.get(type(converter))
+    errors = []
+    for idx, value in enumerate(data):
+        try:
+            if walker is None:
+                data[idx] = converter(value)
+            else:
+                data[idx] = yield walker(converter, value, walkers)
+        except Exception as e:
+            errors.extend(collect_invalids(e, [idx]))
+    if errors:
+        raise MultipleInvalid(errors)
+    yield _Result(data)
+
+
+def _walk_fixed_list(node, data, walkers, inplace=False):
+    if not isinstance(data, list) or \
+            len(data) != len(node.inner_schemas):
+        yield _Result(node(data))
+        return
+    result = data if inplace else []
+    errors = []
+    for idx, (converter, value) in enumerate(zip(node.inner_schemas, data)):
+        walker = walkers.get(type(converter))
+        try:
+            if walker is None:
+                value = converter(value)
+            else:
+                value = yield walker(converter, value, walkers)
+        except Exception as e:
+            errors.extend(collect_invalids(e, [idx]))
+        else:
+            if inplace:
+                data[idx] = value
+            else:
+                result.append(value)
+    if errors:
+        raise MultipleInvalid(errors)
+    yield _Result(result)
+
+
+def _walk_fixed_list_inplace(node, data, walkers):
+    return _walk_fixed_list(node, data, walkers, inplace=True)
+
+
+def _walk_union(node, data, walkers):
+    variant = node.select(data)
+    walker = walkers.get(type(variant))
+    if walker is None:
+        yield _Result(variant(data))
+        return
+    value = yield walker(variant, data, walkers)
+    yield _Result(value)
+
+
+def _walk_nullable(node, data, walkers):
+    if data is None and type(node) is Nullable:
+        yield _Result(None)
+        return
+    if type(node) is NotNone:
+        data = not_none(data)
+    walker = walkers.get(type(node._f))
+    if walker is None:
+        yield _Result(node._f(data))
+        return
+    value = yield walker(node._f, data, walkers)
+    yield _Result(value)
+
+
+def _walk_chain(node, data, walkers):
+    for f in node.validators:
+        walker = walkers.get(type(f))
+        if walker is None:
+            data = f(data)
+        else:
+            data = yield walker(f, data, walkers)
+    yield _Result(data)
+
+
+_WALKERS = {
+    Dict: _walk_dict,
+    _ProjectedDict: _walk_dict,
+    MakeObject: _walk_dict,
+    List: _walk_list,
+    FixedList: _walk_fixed_list,
+    Union: _walk_union,
+    Nullable: _walk_nullable,
+    NotNone: _walk_nullable,
+    Chain: _walk_chain,
+}
+
+# MakeObject results are new objects anyway, so they are built as usual
+_INPLACE_WALKERS = {
+    Dict: _walk_dict_inplace,
+    _ProjectedDict: _walk_dict_inplace,
+    MakeObject: _walk_dict,
+    List: _walk_list_inplace,
+    FixedList: _walk_fixed_list_inplace,
+    Union: _walk_union,
+    Nullable: _walk_nullable,
+    NotNone: _walk_nullable,
+    Chain: _walk_chain,
+}
+
+
+def _walk(node, data, walkers=_WALKERS):
+    """
+    Validates data without recursion. Walkers are generators, that yield
+    walkers of nested dictionaries and lists and receive their results
+    (or their exceptions). The last value, that a walker yields, is its
+    result.
+    """
+    walker = walkers.get(type(node))
+    if walker is None:
+        return node(data)
+    stack = [walker(node, data, walkers)]
+    value = None
+    error = None
+    while True:
+        current = stack[-1]
+        try:
+            if error is None:
+                item = current.send(value)
+            else:
+                item = current.throw(error)
+                error = None
+        except Exception as e:
+            stack.pop()
+            if not stack:
+                raise
+            error = e
+            continue
+        if type(item) is _Result:
+            current.close()
+            stack.pop()
+            if not stack:
+                return item.value
+            value = item.value
+        else:
+            stack.append(item)
+            value = None
+
+
+class _CsvDictValidator(object):
+    """
+    Validates chunks of CSV rows with a Dict schema. Positions of columns,
+    that should be passed to the schema, are resolved once per file.
+    """
+
+    def __init__(self, schema, header, limits=None):
+        header = list(header)
+        self.limits = limits
+        self.width = len(header)
+        if schema.extras == Extras.REMOVE:
+            positions = [idx for idx, name in enumerate(header)
+                         if name in schema._markers_by_name]
+        else:
+            positions = list(range(len(header)))
+        self.names = [header[idx] for idx in positions]
+        self.get_values = _tuple_getter(operator.itemgetter, positions)
+        self.columnar_list = List(schema, columnar=True)
+
+    def __call__(self, chunk):
+        data = []
+        positions = []
+        row_errors = {}
+        for pos, row in enumerate(chunk):
+            if len(row) != self.width:
+                row_errors[pos] = MultipleInvalid([Invalid(
+                    'expected %d columns, got %d' % (self.width, len(row)))])
+            else:
+                document = dict(zip(self.names, self.get_values(row)))
+                if self.limits is not None:
+                    # Each row is limited as a separate document, as rows
+                    # of other schemas are
+                    try:
+                        self.limits.check(document)
+                    except LimitInvalid as e:
+                        row_errors[pos] = MultipleInvalid([e])
+                        continue
+                positions.append(pos)
+                data.append(document)
+        valid_results, errors = self.columnar_list._validate_columns(data)
+        results = [None] * len(chunk)
+        for idx, pos in enumerate(positions):
+            results[pos] = valid_results[idx]
+            if idx in errors:
+                row_errors[pos] = errors[idx]
+        return results, row_errors
+
+
+def _split_ndjson(mm, size, chunk_size):
+    ranges = []
+    start = 0
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            newline = mm.find(b'\n', end - 1)
+            end = size if newline == -1 else newline + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _validate_ndjson_range(mm, schema, start, end):
+    """
+    Validates lines of a memory mapped NDJSON file between start and end
+    byte offsets. Returns a list of (line index in the range, result or
+    MultipleInvalid, line start, line end) tuples for non-empty lines
+    and a number of lines in the range.
+    """
+    items = []
+    line_idx = 0
+    pos = start
+    while pos < end:
+        newline = mm.find(b'\n', pos, end)
+        line_end = end if newline == -1 else newline + 1
+        line = mm[pos:line_end]
+        if line.strip():
+            try:
+                item = schema.loads(line)
+            except MultipleInvalid as e:
+                item = e
+            except ValueError as e:
+                item = MultipleInvalid([Invalid('bad JSON: %s' % e)])
+            items.append((line_idx, item, pos, line_end))
+        line_idx += 1
+        pos = line_end
+    return items, line_idx
+
+
+_ndjson_worker_state = None
+
+
+def _init_ndjson_worker(path, schema):
+    global _ndjson_worker_state
+    f = open(path, 'rb')
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _ndjson_worker_state = (f, mm, schema)
+
+
+def _validate_ndjson_worker_range(byte_range):
+    f, mm, schema = _ndjson_worker_state
+    return _validate_ndjson_range(mm, schema, *byte_range)
+
+
+def load_sqlite(connection, schema, data, batch_size=1000, keys=None):
+    """
+    Inserts rows of data (see Schema.to_rows) into tables of a sqlite3
+    database with executemany. Tables should exist and have the columns,
+    that Schema.tables returns. Generated keys continue maximal keys of
+    the tables, unless first keys are given. Generated keys are integers,
+    so SchemaError is raised, if a table has other keys. Data is loaded in
+    a single transaction: if it is invalid, nothing is inserted. Returns
+    a dictionary with numbers of inserted rows by table names:
+
+    >>> import sqlite3
+    >>> connection = sqlite3.connect(':memory:')
+    >>> _ = connection.execute('CREATE TABLE tags (id, name)')
+    >>> schema = Schema(List(Dict({Required('name'): str},
+    ...                           table=Table('tags', key='id'))))
+    >>> assert {'tags': 2} == load_sqlite(connection, schema,
+    ...                                   [{'name': 'a'}, {'name': 'b'}])
+    >>> assert {'tags': 1} == load_sqlite(connection, schema, [{'name': 'c'}])
+    >>> assert [(1, 'a'), (2, 'b'), (3, 'c')] == connection.execute(
+    ...     'SELECT id, name FROM tags ORDER BY id').fetchall()
+
+    :param connection: a sqlite3 connection
+    :param schema: a Schema with tables
+    :param data: a dictionary or an iterable of dictionaries
+    :param batch_size: a minimal number of rows in batches, that are
+    inserted at once.
+    :param keys: a dictionary, that maps names of tables to the first
+    generated keys.
+    """
+    if not isinstance(schema, Schema):
+        schema = Schema(schema)
+
+    def quote(name):
+        return '"%s"' % name.replace('"', '""')
+
+    statements = {}
+    keys = dict(keys or {})
+    counts = {}
+    for builder in schema._get_row_builders():
+        name = builder.table.name
+        columns = builder.columns
+        statements[name] = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            quote(name), ', '.join(map(quote, columns)),
+            ', '.join('?' * len(columns)))
+        counts[name] = 0
+    with connection:
+        for builder in schema._get_row_builders():
+            name = builder.table.name
+            if builder.generated and name not in keys:
+                last_key = connection.execute('SELECT MAX(%s) FROM %s' % (
+                    quote(builder.table.key), quote(name))).fetchone()[0]
+                if last_key is None:
+                    last_key = 0
+                elif not isinstance(last_key, numbers.Integral):
+                    raise SchemaError('table has keys, that are not '
+                                      'integers, first keys should be given',
+                                      [name])
+                keys[name] = last_key + 1
+        for batch in schema.to_rows(data, batch_size, keys):
+            for name, rows in iteritems(batch):
+                if rows:
+                    connection.executemany(statements[name], rows)
+                    counts[name] += len(rows)
+    return counts
+
+
+def validate_ndjson(path, schema, workers=None, rejects_path=None,
+                    chunk_size=16 * 1024 * 1024):
+    """
+    Validates a newline-delimited JSON file line by line. The file is memory
+    mapped and split into newline-aligned byte ranges of about chunk_size
+    bytes, which are validated by a pool of worker processes. Returns a
+    generator of (line number, result) tuples in file order, where result is
+    a MultipleInvalid exception (not raised) for invalid lines and lines,
+    that are not valid JSON. Empty lines are skipped:
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile(suffix='.ndjson') as f:
+    ...     _ = f.write(b'{"id": "1"}\\n\\n{"id": "x"}\\n{"id": 3}\\n')
+    ...     f.flush()
+    ...     res = list(validate_ndjson(f.name, Schema({Required('id'): int}),
+    ...                                workers=1))
+    >>> assert [1, 3, 4] == [line_number for line_number, _ in res]
+    >>> assert {'id': 1} == res[0][1] and {'id': 3} == res[2][1]
+    >>> assert isinstance(res[1][1], MultipleInvalid)
+
+    :param path: a path to NDJSON file
+    :param schema: a Schema object. It should be picklable, if workers
+    are used.
+    :param workers: a number of worker processes. Defaults to the number
+    of CPUs. If 1, lines are validated in the current process.
+    :param rejects_path: if set, invalid lines are copied as is to
+    a file with this path.
+    :param chunk_size: an approximate size of byte ranges in bytes.
+    """
+    if not isinstance(schema, Schema):
+        schema = Schema(schema)
+    workers = workers or multiprocessing.cpu_count()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        pool = None
+        rejects = None
+        try:
+            ranges = _split_ndjson(mm, size, chunk_size)
+            if workers == 1:
+                validated_ranges = (_validate_ndjson_range(mm, schema, *r)
+                                    for r in ranges)
+            else:
+                pool = multiprocessing.Pool(workers, _init_ndjson_worker,
+                                            (path, schema))
+                validated_ranges = pool.imap(_validate_ndjson_worker_range,
+                                             ranges)
+            if rejects_path:
+                rejects = open(rejects_path, 'wb')
+            first_line_number = 1
+            for items, lines_count in validated_ranges:
+                for line_idx, item, start, end in items:
+                    if rejects and isinstance(item, MultipleInvalid):
+                        rejects.write(mm[start:end])
+                    yield first_line_number + line_idx, item
+                first_line_number += lines_count
+        finally:
+            if rejects:
+                rejects.close()
+            if pool:
+                pool.terminate()
+            mm.close()
@@ -2,7 +2,12 @@ from datetime import datetime
 import decimal
 from nose.tools import assert_equal, assert_raises, assert_true
 from pydto import Schema, Required, Optional, MultipleInvalid, List, \
-    MakeObject, MultipleSchemaError
+    MakeObject, MultipleSchemaError, SchemaError, Union, \
+    Limits, LimitInvalid, UnvalidatedList, UnvalidatedDict, Extras, \
+    Ref, Definitions, Chain, Length, Range, Enum, Nullable, NotNone, \
+    not_none, collect_invalids, Literal, Dict, Interned, Sample, \
+    Cache, Blocking, Table, load_sqlite, Inclusive, Exclusive, \
+    FixedList, ParseDateTime, StrictBoolean, parse_decimal
 
 
 def test_schema_failures():
@@ -93,3 +98,1392 @@ def test_object_initializators():
 
     s = schema({'some_string': 'helloagain'})
     assert_equal(s.some_string, 'helloagain')
+
+
+# columnar lists should give the same results and errors as row by row lists
+def test_columnar_list():
+    from pydto import Inclusive, Range, Length, Enum, Literal, \
+        StrictBoolean, Nullable, NotNone, Invalid, DictInvalid, \
+        RequiredInvalid, LengthInvalid, EnumInvalid, LiteralInvalid, \
+        NoneInvalid, InclusiveInvalid, UnknownInvalid
+
+    def make_schema(columnar):
+        return Schema(List({
+            Required('id'): int,
+            Required('score', 'the_score'): (float, Range(1, 10)),
+            Optional('name'): (str, Length(2, 5)),
+            Optional('kind'): Enum('a', 'b', 3),
+            Optional('version'): Literal(2),
+            Optional('flag'): StrictBoolean(),
+            Optional('note'): Nullable(str),
+            Optional('must'): NotNone(int),
+            Inclusive('x'): int,
+            Inclusive('y'): int,
+            Optional('nested'): {Required('v'): int}
+        }, columnar=columnar))
+
+    good = [
+        {'id': '1', 'score': 2.5, 'name': 'abc', 'kind': 'a',
+         'version': '2', 'flag': 'yes', 'note': None, 'must': '4',
+         'x': 1, 'y': 2, 'nested': {'v': '5'}},
+        {'id': 2, 'score': '9', 'kind': '3', 'flag': True},
+    ]
+    bad = good + [
+        'not a dict',
+        {'score': 11, 'name': 'a', 'kind': 'c', 'version': 3,
+         'flag': 'maybe', 'must': None, 'x': 1, 'nested': {}},
+        {'id': 'x', 'score': 'y', 'unknown': 1},
+    ]
+    for columnar in (False, True):
+        schema = make_schema(columnar)
+        assert_equal([{'id': 1, 'the_score': 2.5, 'name': 'abc', 'kind': 'a',
+                       'version': 2, 'flag': True, 'note': None, 'must': 4,
+                       'x': 1, 'y': 2, 'nested': {'v': 5}},
+                      {'id': 2, 'the_score': 9.0, 'kind': 3, 'flag': True}],
+                     schema(good))
+        try:
+            schema(bad)
+            assert_true(False, 'should have raised an exception')
+        except MultipleInvalid as e:
+            assert_equal([
+                (DictInvalid, [2]), (RequiredInvalid, [3, 'id']),
+                (Invalid, [3, 'score']), (LengthInvalid, [3, 'name']),
+                (EnumInvalid, [3, 'kind']), (LiteralInvalid, [3, 'version']),
+                (Invalid, [3, 'flag']), (NoneInvalid, [3, 'must']),
+                (RequiredInvalid, [3, 'nested', 'v']),
+                (InclusiveInvalid, [3]), (Invalid, [4, 'id']),
+                (Invalid, [4, 'score']), (UnknownInvalid, [4, 'unknown'])
+            ], [(type(ie), ie.path) for ie in e.errors])
+
+    # NaN is out of bounds with and without numpy
+    import pydto
+    numpy = pydto.numpy
+    try:
+        for pydto.numpy in set([numpy, None]):
+            assert_raises(MultipleInvalid, make_schema(True),
+                          [{'id': 1, 'score': 'nan'}, {'id': 2, 'score': 2}])
+    finally:
+        pydto.numpy = numpy
+
+
+# decoding JSON with a schema should give the same results and errors as
+# validating decoded JSON
+def test_loads():
+    from pydto import Dict, Extras, Inclusive, Nullable, Invalid, \
+        RequiredInvalid, DictInvalid, InclusiveInvalid, UnknownInvalid, \
+        ListInvalid, FixedListLengthInvalid
+
+    schema = Schema({
+        Required('id'): int,
+        Optional('name', 'the_name'): Nullable(str),
+        Inclusive('x'): int,
+        Inclusive('y'): int,
+        Optional('items'): List(Dict({
+            Required('v'): int
+        }, Extras.REMOVE)),
+        Optional('pair'): [int, str]
+    })
+    assert_equal({'id': 1, 'the_name': None, 'items': [{'v': 1}]},
+                 schema.loads('{"id": "1", "name": null,'
+                              ' "items": [{"v": 1, "skip": {"a": [1]}}]}'))
+    assert_equal({'id': 2, 'x': 1, 'y': 2, 'pair': [1, '2']},
+                 schema.loads(' {"id": 2, "x": 1, "y": 2, "pair": [1, 2]} '))
+    for document, errors in (
+            ('{"id": "x", "x": 1, "items": [{"v": "a"}, {}, 3], "what": 1}',
+             [(Invalid, ['id']), (Invalid, ['items', 0, 'v']),
+              (RequiredInvalid, ['items', 1, 'v']),
+              (DictInvalid, ['items', 2]), (InclusiveInvalid, []),
+              (UnknownInvalid, ['what'])]),
+            ('{"items": {}, "pair": [1]}',
+             [(RequiredInvalid, ['id']), (ListInvalid, ['items']),
+              (FixedListLengthInvalid, ['pair'])]),
+            ('[1, 2]', [(DictInvalid, [])]),
+            ('{}', [(RequiredInvalid, ['id'])])):
+        try:
+            schema.loads(document)
+            assert False, "an exception should've been raised"
+        except MultipleInvalid as e:
+            assert_equal(errors, [(type(ie), ie.path) for ie in e.errors])
+
+    for document in ['{"id": 1', '{"id": 1,}', '{"id": 1} 2',
+                     '{"items": [{"v": 1, "skip": }]}']:
+        assert_raises(ValueError, schema.loads, document)
+
+
+# streaming of a JSON array should not depend on chunk boundaries
+def test_iter_json():
+    from io import BytesIO, StringIO
+    import json
+
+    schema = Schema(List({
+        Required('id'): int,
+        Optional('name'): str
+    }))
+    data = [{'id': i, 'name': u'ж%d' % i} for i in range(20)]
+    data[7] = {'id': 'x'}
+    document = json.dumps(data, ensure_ascii=False)
+    for chunk_size in [1, 3, 7, 1024]:
+        for fp in [StringIO(document), BytesIO(document.encode('utf-8'))]:
+            res = list(schema.iter_json(fp, chunk_size))
+            assert_equal(20, len(res))
+            assert_true(isinstance(res[7], MultipleInvalid))
+            assert_equal([7, 'id'], res[7].path)
+            assert_equal(data[:7] + data[8:], res[:7] + res[8:])
+    assert_equal([], list(schema.iter_json(StringIO(' [ ] '))))
+    for document in ['[{"id": 1}', '[{"id": 1}}', '[{"id": 1}] 1']:
+        assert_raises(ValueError, list,
+                      schema.iter_json(StringIO(document), 2))
+    assert_raises(MultipleInvalid, list, schema.iter_json(StringIO('{}')))
+
+    numbers = '[1.5, 2e3, -4 , 10.25E-1,7]'
+    for chunk_size in range(1, 12):
+        assert_equal([1.5, 2000.0, -4.0, 1.025, 7.0], list(Schema(
+            List(float)).iter_json(StringIO(numbers), chunk_size)))
+
+
+# parallel NDJSON validation should give the same results as a serial one
+def test_validate_ndjson():
+    import os
+    import tempfile
+    from pydto import validate_ndjson
+
+    schema = Schema({Required('id'): int})
+    lines = ['{"id": %d}' % i for i in range(100)]
+    lines[10] = '{"id": "x"}'
+    lines[20] = ''
+    lines[30] = '{"id": 1'
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'data.ndjson')
+    rejects_path = os.path.join(directory, 'rejects.ndjson')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+
+    serial = list(validate_ndjson(path, schema, workers=1,
+                                  rejects_path=rejects_path))
+    assert_equal(99, len(serial))
+    errors = [(n, r.path) for n, r in serial
+              if isinstance(r, MultipleInvalid)]
+    assert_equal([(11, ['id']), (31, [])], errors)
+    assert_equal([{'id': 99}], [r for n, r in serial if n == 100])
+    with open(rejects_path) as f:
+        assert_equal('{"id": "x"}\n{"id": 1\n', f.read())
+
+    parallel = list(validate_ndjson(path, schema, workers=2, chunk_size=64))
+    assert_equal([(n, r) for n, r in serial if isinstance(r, dict)],
+                 [(n, r) for n, r in parallel if isinstance(r, dict)])
+    assert_equal(errors, [(n, r.path) for n, r in parallel
+                          if isinstance(r, MultipleInvalid)])
+
+
+# CSV rows should be mapped by column names or positions
+def test_iter_csv():
+    from io import StringIO
+
+    schema = Schema({
+        Required('id', 'the_id'): int,
+        Optional('name'): str
+    })
+    document = 'id,name\n1,John\n2\n\nx,Jane\n'
+    res = list(schema.iter_csv(StringIO(document), chunk_size=2))
+    assert_equal(3, len(res))
+    assert_equal({'the_id': 1, 'name': 'John'}, res[0])
+    assert_equal([1], res[1].path)
+    # The blank row is counted
+    assert_equal([3, 'id'], res[2].path)
+    res = list(schema.iter_csv(StringIO('1;John\n'), header=['id', 'name'],
+                               delimiter=';'))
+    assert_equal([{'the_id': 1, 'name': 'John'}], res)
+    res = list(schema.iter_csv(StringIO('id,surname\n1,Smith\n')))
+    assert_equal([[0, 'surname']], [e.path for e in res[0].errors])
+
+    schema = Schema([int, int])
+    res = list(schema.iter_csv(StringIO('a,b\n1,2\nx,y\n'), header=True))
+    assert_equal([1, 2], res[0])
+    assert_equal([[1, 0], [1, 1]], [e.path for e in res[1].errors])
+    assert_raises(SchemaError, Schema(List(int)).iter_csv, StringIO(''))
+
+
+# packed results should be unpacked to the same results
+def test_pack():
+    from pydto import Enum, Extras, UnvalidatedDict, ParseDateTime
+
+    schema = Schema({
+        Required('id', rename_to='the_id'): int,
+        Optional('name'): str,
+        Optional('kind'): Enum('a', 'b', 3),
+        Optional('pair'): [int, str],
+        Optional('items'): List({Required('v', rename_to='w'): int}),
+        Optional('raw'): UnvalidatedDict(),
+        Optional('at'): ParseDateTime('%Y-%m-%d %H:%M:%S.%f')
+    }, extras=Extras.ALLOW)
+    values = [
+        {'id': 1},
+        {'id': -2 ** 70, 'name': u'ж', 'kind': '3', 'pair': [1, 'a'],
+         'items': [{'v': 1}, {'v': '2'}], 'extra': [None, True, 1.5],
+         'raw': {'a': {1: decimal.Decimal('1.5')}, 'b': b'\x00'},
+         'at': '2015-06-01 12:30:00.5'},
+    ]
+    for value in values:
+        result = schema(value)
+        assert_equal(result, schema.unpack(schema.pack(result)))
+    # Names of fields aren't packed
+    assert_true(b'id' not in schema.pack(schema({'id': 1})))
+
+    other_schema = Schema({Required('the_id'): int})
+    assert_raises(ValueError, other_schema.unpack, schema.pack({'the_id': 1}))
+    assert_raises(ValueError, schema.unpack,
+                  schema.pack({'the_id': 1})[:-1])
+    assert_raises(ValueError, schema.unpack, b'{"id": 1}')
+    assert_raises(TypeError, schema.pack, {'the_id': object()})
+
+    # Corrupted data never raises anything but ValueError
+    packed = bytearray(schema.pack(schema(values[1])))
+    for idx in range(len(packed)):
+        for byte in (packed[idx] ^ 0xff, packed[idx] ^ 1, 11, 12, 13, 14, 15):
+            corrupted = bytearray(packed)
+            corrupted[idx] = byte
+            try:
+                schema.unpack(bytes(corrupted))
+            except ValueError:
+                pass
+
+
+# encoding objects directly should give the same JSON as json.dumps
+def test_dumps():
+    import json
+    from io import StringIO
+    from pydto import FromObject, Inclusive, FormatDateTime
+
+    class Item(object):
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    schema = Schema(List(FromObject(Item, {
+        Required('id', 'the_id'): int,
+        Optional('name'): str,
+        Optional('created'): FormatDateTime('%Y-%m-%d'),
+        Optional('ratio'): float,
+        Optional('tags'): List(str),
+        Optional('raw'): lambda value: value,
+        Inclusive('x'): int,
+        Inclusive('y'): int
+    })))
+    items = [
+        Item(id='1', name=u'ж"', created=datetime(2000, 1, 2)),
+        Item(id=2, ratio=float('inf'), tags=[1, 'b'], x=1, y=2,
+             raw={'a': [None, True]}),
+    ]
+    assert_equal(json.dumps(schema(items)), schema.dumps(items))
+    fp = StringIO()
+    schema.dump(items, fp)
+    assert_equal(json.dumps(schema(items)), fp.getvalue())
+    assert_equal('[]', schema.dumps([]))
+
+    try:
+        schema.dumps([Item(id=1), Item(name='a', x='b')])
+        assert_true(False, 'should have raised an exception')
+    except MultipleInvalid as e:
+        assert_equal([[1, 'id'], [1, 'x'], [1]],
+                     [ie.path for ie in e.errors])
+    assert_raises(TypeError, schema.dumps, [Item(id=1, raw=object())])
+
+
+# fields should be extracted the same way from different kinds of objects
+def test_from_object_extraction():
+    from pydto import FromObject, Exclusive
+
+    class Plain(object):
+        default = 'd'
+
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class WithProperty(Plain):
+        @property
+        def name(self):
+            if 'hidden' in self.__dict__:
+                raise AttributeError('name')
+            return self.__dict__.get('real_name', 'p')
+
+    class Slotted(object):
+        __slots__ = ('id', 'name')
+
+    class Dynamic(object):
+        def __getattr__(self, name):
+            if name == 'name':
+                return 'dynamic'
+            raise AttributeError(name)
+
+    def make_schema(strict):
+        return Schema(FromObject(object, {
+            Required('id'): int,
+            Optional('name'): str,
+            Optional('default'): str,
+            Exclusive('a'): int,
+            Exclusive('b'): int
+        }, strict=strict))
+
+    for strict in (False, True):
+        schema = make_schema(strict)
+        assert_equal({'id': 1, 'default': 'd'}, schema(Plain(id='1')))
+        assert_equal({'id': 1, 'name': 'p', 'default': 'd'},
+                     schema(WithProperty(id=1, name='ignored')))
+        assert_equal({'id': 1, 'default': 'd'},
+                     schema(WithProperty(id=1, hidden=True)))
+        slotted = Slotted()
+        slotted.id = 2
+        assert_equal({'id': 2}, schema(slotted))
+        slotted.name = 'n'
+        assert_equal({'id': 2, 'name': 'n'}, schema(slotted))
+        dynamic = Dynamic()
+        dynamic.id = 3
+        assert_equal({'id': 3, 'name': 'dynamic'}, schema(dynamic))
+        try:
+            schema(Dynamic())
+            assert_true(False, 'should have raised an exception')
+        except MultipleInvalid as e:
+            assert_equal([['id']], [ie.path for ie in e.errors])
+        try:
+            schema(Plain(id='x', a=1, b=2))
+            assert_true(False, 'should have raised an exception')
+        except MultipleInvalid as e:
+            assert_equal([['id'], []], [ie.path for ie in e.errors])
+
+
+# compiled schemas should survive pickling (e.g. to be sent to workers)
+def test_pickle():
+    import pickle
+    from pydto import FromObject, Enum
+
+    schema = Schema({
+        Required('id'): int,
+        Optional('kind'): Enum('a', 'b'),
+        Optional('items'): List(int)
+    })
+    packed = schema.pack({'id': 1, 'kind': 'a', 'items': [1]})
+    unpickled = pickle.loads(pickle.dumps(schema))
+    assert_equal({'id': 1, 'kind': 'a', 'items': [1]},
+                 unpickled.unpack(packed))
+
+    schema = Schema(FromObject(decimal.Decimal, {Required('real'): str}))
+    schema(decimal.Decimal(1))
+    unpickled = pickle.loads(pickle.dumps(schema))
+    assert_equal({'real': '2'}, unpickled(decimal.Decimal(2)))
+
+
+# all construction strategies should make the same objects
+def test_make_object_construction():
+    from pydto import Construction
+
+    class Plain(object):
+        def __init__(self, a, b=None):
+            self.a = a
+            self.b = b
+
+        def set_stuff(self, a):
+            self.a = a
+
+    class Slotted(object):
+        __slots__ = ('a', 'b')
+
+        def __init__(self, a, b=None):
+            self.a = a
+            self.b = b
+
+    for cls in (Plain, Slotted):
+        for construction in Construction.values:
+            schema = Schema(List(MakeObject(cls, {
+                Required('a'): int,
+                Optional('bee', 'b'): int
+            }, construction=construction)))
+            objects = schema([{'a': '1', 'bee': 2}, {'a': 3}])
+            assert_equal([(1, 2), (3, None if construction !=
+                                   Construction.ATTRIBUTES else 'missing')],
+                         [(o.a, getattr(o, 'b', 'missing'))
+                          for o in objects])
+    assert_raises(SchemaError, MakeObject, Plain, {}, 'set_stuff',
+                  construction=Construction.ATTRIBUTES)
+    assert_raises(SchemaError, MakeObject, Plain, {}, construction='new')
+
+
+# views should convert fields lazily, once each
+def test_view():
+    calls = []
+
+    def parse(value):
+        calls.append(value)
+        return int(value)
+
+    schema = Schema({
+        Required('a'): parse,
+        Optional('b', rename_to='c'): List({Required('d'): parse})
+    })
+    view = schema.view({'a': '1', 'b': [{'d': '2'}, {'d': 'x'}]})
+    assert_equal([], calls)
+    assert_equal(1, view['a'])
+    assert_equal(1, view['a'])
+    assert_equal(['1'], calls)
+    assert_equal(['a', 'c'], sorted(view))
+    assert_equal(2, len(view['c']))
+    assert_equal(2, view['c'][0]['d'])
+    try:
+        view['c'][-1]['d']
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['b', 1, 'd'], e.path)
+    assert_raises(IndexError, view['c'].__getitem__, -3)
+    assert_raises(IndexError, view['c'].__getitem__, 2)
+    assert_equal(1, len(list(view['c'][:1])))
+    try:
+        view['c'].materialize()
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['b', 1, 'd'], e.path)
+    try:
+        schema.view({'a': '1', 'e': 1})
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['e'], e.path)
+    assert_raises(SchemaError, Schema(int).view, 1)
+
+
+# only selected fields should be converted and returned
+def test_projection():
+    calls = []
+
+    def parse(value):
+        calls.append(value)
+        return int(value)
+
+    schema = Schema({
+        Required('a'): parse,
+        Optional('b'): parse,
+        Required('c'): List({
+            Required('d'): parse,
+            Optional('e', rename_to='f'): parse
+        }, columnar=True)
+    })
+    data = {'a': '1', 'b': '2', 'c': [{'d': '3', 'e': '4'}, {'d': '5'}]}
+    assert_equal({'a': 1, 'c': [{'f': 4}, {}]},
+                 schema(data, only=['a', 'c.*.f']))
+    assert_equal(['1', '4'], calls)
+    assert_equal({'b': 2, 'c': [{'d': 3, 'f': 4}, {'d': 5}]},
+                 schema(data, only=['c', 'b', 'c.*.d']))
+    assert_true(schema._projections[frozenset(['a', 'c.*.f'])] is
+                schema._projections[frozenset(['c.*.f', 'a'])])
+    try:
+        schema({'a': '1', 'c': [{'e': '4'}], 'g': 1}, only=['a'])
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['g'], e.path)
+    try:
+        schema({'a': '1', 'c': [{'e': '4'}]}, only=['c.*.f'])
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['c', 0, 'd'], e.path)
+    assert_raises(MultipleSchemaError, schema, data, only=['e'])
+    assert_raises(SchemaError, schema, data, only=['a.b'])
+    assert_raises(SchemaError, schema, data, only=['c.d'])
+
+    # Only recently used projections are kept
+    schema.MAX_PROJECTIONS = 2
+    for only in (['a'], ['b'], ['a'], ['c']):
+        schema(data, only=only)
+    assert_equal([frozenset(['a']), frozenset(['c'])],
+                 list(schema._projections))
+
+    # Projected dictionaries keep settings of the original ones
+    schema = Schema(Dict({Required('a'): str, Optional('b'): int},
+                         intern=True, table='items'))
+    projected = schema._get_projection(['a'])
+    assert_true(projected.table is schema.schema.table)
+    assert_true(projected._interned is schema.schema._interned)
+    assert_equal(['b'], [marker.name for marker, converter
+                         in projected.inner_schema.items()
+                         if converter is None])
+
+
+# dictionaries should be validated by variants, that their tags select
+def test_union():
+    calls = []
+
+    def parse(value):
+        calls.append(value)
+        return int(value)
+
+    schema = Schema({
+        Required('events'): List(Union('type', {
+            'a': {Required('type'): str, Required('x'): parse},
+            'b': {Required('type'): str, Optional('y'): parse},
+        }))
+    })
+    assert_equal({'events': [{'type': 'a', 'x': 1}, {'type': 'b'}]},
+                 schema({'events': [{'type': 'a', 'x': '1'},
+                                    {'type': 'b'}]}))
+    assert_equal(['1'], calls)
+    try:
+        schema({'events': [{'type': 'b', 'x': '1'}, {'type': 'c'}, {},
+                           {'type': ['a']}]})
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal([['events', 0, 'x'], ['events', 1, 'type'],
+                      ['events', 2, 'type'], ['events', 3, 'type']],
+                     [e.path for e in e.errors])
+    assert_raises(SchemaError, Union, 'type', [])
+    assert_raises(MultipleSchemaError, Schema, Union('type', {'a': object()}))
+
+
+# data over limits should be rejected before it is validated
+def test_limits():
+    schema = Schema({
+        Required('a'): UnvalidatedList(),
+        Optional('b'): UnvalidatedDict(),
+        Optional('c'): str
+    }, limits=Limits(max_depth=3, max_list_len=3, max_str_len=4,
+                     max_keys=2, max_total_nodes=8))
+    assert_equal({'a': [[1], 2]}, schema({'a': [[1], 2]}))
+
+    def limit_path(data):
+        try:
+            schema(data)
+            assert False, "an exception should've been raised"
+        except MultipleInvalid as e:
+            assert_true(isinstance(e.errors[0], LimitInvalid))
+            return e.path
+
+    assert_equal(['a', 0, 0], limit_path({'a': [[[1]]]}))
+    assert_equal(['a'], limit_path({'a': [1, 2, 3, 4]}))
+    assert_equal(['c'], limit_path({'a': [], 'c': 'hello'}))
+    assert_equal(['b'], limit_path({'a': [], 'b': {'x': 1, 'y': 2,
+                                                   'z': 3}}))
+    assert_equal(['b'], limit_path({'a': [], 'b': {'hello': 1}}))
+    assert_equal(['a', 0], limit_path({'a': [[1, 2, 3], [1, 2, 3]]}))
+    assert_equal([], limit_path({'a': [], 'b': {}, 'c': ''}))
+    assert_raises(SchemaError, Limits, max_depth=-1)
+    assert_raises(SchemaError, Schema, int, limits={'max_depth': 1})
+
+
+# limits should be checked while JSON is decoded
+def test_limits_decoding():
+    from io import StringIO
+    import json
+
+    limits = Limits(max_depth=4, max_list_len=2, max_str_len=4,
+                    max_keys=2, max_total_nodes=8)
+    schema = Schema(List({Required('a'): List(UnvalidatedList()),
+                          Optional('c'): str}), limits=limits)
+
+    def limit_path(f, *args):
+        try:
+            f(*args)
+            assert False, "an exception should've been raised"
+        except MultipleInvalid as e:
+            assert_true(isinstance(e.errors[0], LimitInvalid))
+            return e.path
+
+    for data, path in (([{'a': [[1]]}], None),
+                       ([{'a': [[[1]]]}], [0, 'a', 0, 0]),
+                       ([{'a': []}] * 3, []),
+                       ([{'a': [], 'c': 'hello'}], [0, 'c']),
+                       ([{'a': [], 'hello': 1}], [0]),
+                       ([{'a': [], 'c': '', 'd': 1}], [0])):
+        text = json.dumps(data)
+        if path is None:
+            assert_equal(schema(data), schema.loads(text))
+            continue
+        # Decoding finds the same violations, as checking decoded data does
+        assert_equal(path, limit_path(schema, data))
+        assert_equal(path, limit_path(schema.loads, text))
+        assert_equal(path, limit_path(list, schema.iter_json(
+            StringIO(text), 4)))
+    # Values are counted in the document order
+    text = json.dumps([{'a': [[1, 2]]}, {'a': [[1, 2]]}])
+    assert_equal([1, 'a', 0], limit_path(schema.loads, text))
+    assert_equal([1, 'a', 0], limit_path(list, schema.iter_json(
+        StringIO(text), 4)))
+
+    csv_schema = Schema({Required('a'): str, Required('b'): str},
+                        extras=Extras.ALLOW, limits=limits)
+    res = list(csv_schema.iter_csv(StringIO('a,b\n1,2\nhello,2\n')))
+    assert_equal({'a': '1', 'b': '2'}, res[0])
+    assert_true(isinstance(res[1].errors[0], LimitInvalid))
+    assert_equal([1, 'a'], res[1].path)
+
+
+# iterative validation should give the same results and errors as a
+# recursive one, for data of any depth
+def test_iterative():
+    from pydto import Invalid, RequiredInvalid, UnknownInvalid, \
+        VariantInvalid, FixedListLengthInvalid, DictInvalid
+
+    def spec():
+        return {
+            Required('a'): int,
+            Optional('b'): List({
+                Required('c'): [int, {Optional('d'): str}],
+                Optional('e'): Union('t', {
+                    'x': {Required('t'): str, Required('f'): int}
+                })
+            })
+        }
+
+    schema = Schema(spec(), iterative=True)
+    valid = {'a': '1', 'b': [{'c': ['2', {'d': 3}],
+                              'e': {'t': 'x', 'f': '4'}}]}
+    assert_equal({'a': 1, 'b': [{'c': [2, {'d': '3'}],
+                                 'e': {'t': 'x', 'f': 4}}]},
+                 schema(valid))
+    try:
+        schema({'b': [{'c': ['x', {'g': 1}]}, {'e': {'t': 'y'}}]})
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal([(RequiredInvalid, ['a']),
+                      (Invalid, ['b', 0, 'c', 0]),
+                      (UnknownInvalid, ['b', 0, 'c', 1, 'g']),
+                      (RequiredInvalid, ['b', 1, 'c']),
+                      (VariantInvalid, ['b', 1, 'e', 't'])],
+                     [(type(e), e.path) for e in e.errors])
+    try:
+        schema({'a': 1, 'b': [{'c': [1]}, 5, {'c': [1, {}],
+                                              'e': {'t': 'x'}}]})
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal([(FixedListLengthInvalid, ['b', 0, 'c']),
+                      (DictInvalid, ['b', 1]),
+                      (RequiredInvalid, ['b', 2, 'e', 'f'])],
+                     [(type(e), e.path) for e in e.errors])
+
+    schema = Schema(spec(), iterative=True, extras=Extras.ALLOW)
+    assert_equal({'b': [{'e': {'t': 'x', 'f': 4}}]},
+                 schema(valid, only=['b.*.e']))
+
+    schema = Schema(Ref('node'), iterative=True, definitions={
+        'node': {Required('name'): str, Optional('children'): [Ref('node')]}
+    })
+    data = {'name': 'leaf', 'unknown': 1}
+    for _ in range(5000):
+        data = {'name': 'node', 'children': [data]}
+    try:
+        schema(data)
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['children', 0] * 5000 + ['unknown'], e.path)
+
+    # Nullable, NotNone and Chain are walked without recursion too
+    schema = Schema(Ref('node'), iterative=True, definitions={
+        'node': NotNone(Dict({
+            Required('name'): str,
+            Optional('children'): Nullable(Chain(list, List(Ref('node'))))
+        }))
+    })
+    data = {'name': 'leaf', 'children': None}
+    for _ in range(5000):
+        data = {'name': 'node', 'children': [data]}
+    result = schema(data)
+    for _ in range(5000):
+        result = result['children'][0]
+    assert_equal({'name': 'leaf', 'children': None}, result)
+
+
+# named schemas should be referenced, also recursively
+def test_ref():
+    import pickle
+
+    definitions = Definitions({
+        'tree': {
+            Required('value'): int,
+            Optional('children'): List(Ref('tree')),
+            Optional('other'): Ref('other')
+        },
+        'other': Ref('leaf'),
+        'leaf': List(int)
+    })
+    schema = Schema({Required('root'): Ref('tree')},
+                    definitions=definitions)
+    data = {'root': {'value': '1', 'children': [{'value': 2,
+                                                 'other': ['3']}]}}
+    expected = {'root': {'value': 1, 'children': [{'value': 2,
+                                                   'other': [3]}]}}
+    assert_equal(expected, schema(data))
+    assert_equal(expected, pickle.loads(pickle.dumps(schema))(data))
+    assert_equal(expected, schema.unpack(schema.pack(expected)))
+    tree = Schema(Ref('tree'), definitions=definitions).schema
+    assert_true(tree.inner_schema[tree._markers_by_name['children']]
+                .inner_schema is tree)
+    # Compiled named schemas are shared
+    assert_true(Schema(Ref('tree'), definitions=definitions).schema is tree)
+    assert_raises(SchemaError, Schema, Ref('tree'))
+    assert_raises(SchemaError, Schema, Ref('x'), definitions={})
+    assert_raises(SchemaError, Schema, Ref('x'),
+                  definitions={'x': Ref('y'), 'y': Ref('x')})
+
+
+# optimisation should keep results and errors of the original converters
+def test_optimizer():
+    from pydto import NoneInvalid, LengthInvalid
+
+    def converters():
+        return [
+            (str, Chain(Length(min=2), Length(max=4)), str),
+            (Length(max=4), Length(min=2)),
+            (Enum('a', 'bb'), str, not_none),
+            (int, Chain(float, int), Range(min=1)),
+            Nullable(NotNone(Nullable(int))),
+            NotNone(Nullable(int)),
+            {Optional('a'): List((str, str))},
+        ]
+
+    (strings, lengths, enum, numbers, nullable, not_nullable,
+     nested) = [Schema(converter) for converter in converters()]
+    # Merged length checks
+    assert_equal('bb', strings('bb'))
+    assert_equal('None', strings(None))
+    assert_equal([1, 2, 3], lengths([1, 2, 3]))
+    for value in ('a', 'ccccc', 5):
+        assert_raises(MultipleInvalid, strings, value)
+    try:
+        lengths(None)
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_true(not isinstance(e.errors[0], LengthInvalid))
+    # Conversions after an enum and inside of chains are removed
+    assert_equal('a', enum('a'))
+    assert_raises(MultipleInvalid, enum, None)
+    assert_equal(3, numbers('3'))
+    assert_raises(MultipleInvalid, numbers, '0')
+    # Nested wrappers are merged into the outer one
+    assert_equal(None, nullable(None))
+    assert_equal(3, nullable('3'))
+    try:
+        not_nullable(None)
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_true(isinstance(e.errors[0], NoneInvalid))
+    assert_equal({'a': ['x', '1']}, nested({'a': ['x', 1]}))
+    try:
+        nested({'a': 'x'})
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['a'], e.path)
+    explanation = Schema(converters()[0]).explain().split('\n')
+    assert_equal(['after:', 'Chain', '  str', '  Length(min=2, max=4)'],
+                 explanation[explanation.index('after:'):])
+
+
+# fast paths of adaptive fields should give the same results and errors
+# as generic converters
+def test_adaptive():
+    import pickle
+
+    def spec():
+        return {
+            Required('kind'): Enum('a', 'b'),
+            Required('n'): (int, Range(max=10)),
+            Optional('flag'): Nullable(bool),
+            Optional('v'): Literal(1),
+            Optional('items'): List((str, Length(max=2)))
+        }
+
+    adaptive = Schema(spec(), adaptive=3)
+    valid = [
+        {'kind': 'a', 'n': 1, 'flag': None, 'v': 1, 'items': ['x']},
+        {'kind': 'b', 'n': 2, 'flag': True, 'v': 1, 'items': ['yy']},
+        {'kind': 'a', 'n': 3, 'flag': None, 'v': 1, 'items': []},
+    ]
+    for _ in range(2):
+        for data in valid:
+            assert_equal(data, adaptive(data))
+        # Fast paths raise the same errors as generic converters
+        try:
+            adaptive({'kind': 'c', 'n': 11, 'flag': None, 'v': 2,
+                      'items': ['zzz', 1]})
+            assert False, "an exception should've been raised"
+        except MultipleInvalid as e:
+            assert_equal([['items', 0], ['kind'], ['n'], ['v']],
+                         sorted(e.path for e in e.errors))
+        # Values of other types take generic paths
+        try:
+            adaptive({'kind': 'b', 'n': '4', 'flag': 'x', 'v': '1',
+                      'items': [None]})
+            assert False, "an exception should've been raised"
+        except MultipleInvalid as e:
+            assert_equal(['items', 0], e.path)
+    stats = adaptive.adaptive_stats()
+    assert_equal(['flag', 'items', 'kind', 'n', 'v'],
+                 sorted(path[0] for path in stats))
+    assert_equal({'types': {type(None): 2, bool: 1}, 'guard': type(None),
+                  'hits': 4, 'misses': 3}, stats[('flag',)])
+    assert_equal({'types': {int: 3}, 'guard': int, 'hits': 5, 'misses': 2},
+                 stats[('n',)])
+    unpickled = pickle.loads(pickle.dumps(adaptive))
+    assert_equal({'types': {}, 'guard': None, 'hits': 0, 'misses': 0},
+                 unpickled.adaptive_stats()[('n',)])
+    assert_raises(SchemaError, Schema, int, adaptive=0)
+    # Shared definitions are not changed by schemas, that use them
+    definitions = Definitions({'item': {Required('kind'): Enum('a', 'b'),
+                                        Required('n'): (int, Range(max=9))}})
+    first = Schema(Ref('item'), definitions=definitions, adaptive=2)
+    second = Schema(Ref('item'), definitions=definitions)
+    third = Schema(Ref('item'), definitions=definitions, adaptive=2)
+    assert_true('Adaptive' in first.explain())
+    assert_true('Adaptive' not in second.explain())
+    assert_equal(['kind', 'n'],
+                 sorted(path[0] for path in third.adaptive_stats()))
+    assert_equal({'kind': 'a', 'n': 1}, second({'kind': 'a', 'n': '1'}))
+
+    # Fields of Union variants are prefixed with tags, fields inside of
+    # wrappers are adaptive too
+    schema = Schema({
+        Required('shape'): Union('t', {
+            'x': {Required('t'): str, Required('n'): (int, Range(max=9))},
+            'y': {Required('t'): str, Required('n'): Literal(1)},
+        }, fallback=Dict({Required('n'): Nullable(int)},
+                         extras=Extras.ALLOW)),
+        Optional('meta'): Nullable(Dict({Required('id'): Nullable(int)})),
+    }, adaptive=1)
+    assert_equal(set([('meta', 'id'), ('shape', None, 'n'),
+                      ('shape', 'x', 'n'), ('shape', 'y', 'n')]),
+                 set(schema.adaptive_stats()))
+    assert_equal({'shape': {'t': 'x', 'n': 1}, 'meta': {'id': 2}},
+                 schema({'shape': {'t': 'x', 'n': 1}, 'meta': {'id': 2}}))
+    stats = schema.adaptive_stats()
+    assert_equal({int: 1}, stats[('shape', 'x', 'n')]['types'])
+    assert_equal({}, stats[('shape', 'y', 'n')]['types'])
+    assert_equal({int: 1}, stats[('meta', 'id')]['types'])
+
+
+# equal strings of interned fields should be returned as the same objects
+def test_interning():
+    import json
+    import pickle
+
+    def text(value):
+        # A new string object, equal to value
+        return json.loads(json.dumps(value))
+
+    schema = Schema(List(Dict({
+        Required('status'): Enum('active', 'closed', intern=True),
+        Required('country'): str,
+        Optional('city', rename_to=text('town')): Interned(str, max_size=1)
+    }, intern=True), columnar=True))
+    data = [{'status': text('active'), 'country': text('NL'),
+             'city': text('Delft')},
+            {'status': text('active'), 'country': text('NL'),
+             'city': text('Gouda')}]
+    for result in (schema(data), Schema(schema.schema.inner_schema)(data[0]),
+                   schema.loads(json.dumps(data))):
+        if isinstance(result, dict):
+            result = [result, schema(data)[1]]
+        a, b = result
+        assert_true(a['status'] is b['status'])
+        assert_true(a['country'] is b['country'])
+        key_a, = [key for key in a if key == 'town']
+        key_b, = [key for key in b if key == 'town']
+        assert_true(key_a is key_b)
+    # Fields have their own tables, so ids don't crowd out countries
+    import pydto
+    size = pydto.INTERN_TABLE_SIZE
+    pydto.INTERN_TABLE_SIZE = 2
+    try:
+        schema = Schema(List(Dict({Required('id'): str,
+                                   Optional('country'): str}, intern=True)))
+        result = schema([{'id': text('a')}, {'id': text('b')},
+                         {'id': text('c'), 'country': text('NL')},
+                         {'id': text('d'), 'country': text('NL')}])
+        assert_true(result[2]['country'] is result[3]['country'])
+    finally:
+        pydto.INTERN_TABLE_SIZE = size
+    schema = Schema(List(Enum('ab', 'cd', intern=True)), adaptive=1)
+    a, b = schema([text('ab'), text('ab')])
+    assert_true(a is b)
+    interned = Interned(max_size=1)
+    assert_true(interned(text('xx')) is interned(text('xx')))
+    assert_true(interned(text('yy')) is not interned(text('yy')))
+    assert_equal({}, pickle.loads(pickle.dumps(interned))._table)
+    assert_raises(SchemaError, Enum, 1, intrn=True)
+
+
+# in-place validation should convert incoming objects
+def test_inplace():
+    import copy
+
+    def spec():
+        return {
+            Required('a', rename_to='b'): int,
+            Optional('b', rename_to='a'): str,
+            Optional('c'): List({Optional('d'): [int, Nullable(int)],
+                                 Optional('e'): str}),
+            Optional('f'): Dict({Optional('g'): int}, extras=Extras.REMOVE),
+            Optional('h', rename_to='i'): int,
+        }
+
+    schema = Schema(spec(), inplace=True)
+    data = {'a': '1', 'b': 2, 'c': [{'d': ['3', None]}], 'f': {'g': 4, 'h': 5}}
+    assert_true(schema(data) is data)
+    assert_equal({'b': 1, 'a': '2', 'c': [{'d': [3, None]}], 'f': {'g': 4}},
+                 data)
+    assert_equal({'b': 1, 'c': [{'d': [3, None]}]},
+                 schema({'a': '1', 'b': 2, 'c': [{'d': ['3', None]}]},
+                        only=['b', 'c.*.d']))
+    try:
+        schema({'a': 'x', 'c': [{'d': [1]}, {'e': 1, 'y': 2}]})
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal([['a'], ['c', 0, 'd'], ['c', 1, 'y']],
+                     sorted(e.path for e in e.errors))
+    try:
+        schema({'a': '1', 'f': []})
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['f'], e.path)
+
+    # Extras are kept or removed in place, allowed extras take precedence
+    # over fields, that are renamed to their names
+    data = {'a': '1', 'x': 1, 'h': '2', 'i': 'junk'}
+    assert_equal({'b': 1, 'x': 1, 'i': 'junk'},
+                 Schema(spec(), extras=Extras.ALLOW,
+                        inplace=True)(copy.deepcopy(data)))
+    assert_equal({'b': 1, 'i': 2},
+                 Schema(spec(), extras=Extras.REMOVE,
+                        inplace=True)(copy.deepcopy(data)))
+    assert_raises(MultipleInvalid, schema, data)
+    data = {'a': '1', 'c': [{'d': ['3', None]}]}
+    items = data['c']
+    element = items[0]
+    assert_equal({'b': 1, 'c': [{'d': [3, None]}]},
+                 Schema(spec(), inplace=True)(data))
+    assert_true(data['c'] is items and items[0] is element)
+    data = {'a': 'x', 'b': 1, 'c': [{'d': [1, '2']}, {'d': 'x'}]}
+    assert_raises(MultipleInvalid, Schema(spec(), inplace=True), data)
+    assert_equal({'a': '1', 'c': [{'d': [1, 2]}, {'d': 'x'}]}, data)
+
+    # Dictionaries inside of Nullable and Chain are updated in place too
+    schema = Schema({
+        Optional('a'): Nullable(Dict({Required('b', rename_to='c'): int})),
+        Optional('d'): Chain(List({Required('e'): int}), Length(max=2)),
+    }, inplace=True)
+    data = {'a': {'b': '1'}, 'd': [{'e': '2'}]}
+    inner, items = data['a'], data['d']
+    assert_equal({'a': {'c': 1}, 'd': [{'e': 2}]}, schema(data))
+    assert_true(data['a'] is inner and data['d'] is items)
+    assert_equal({'a': None}, schema({'a': None}))
+
+    # Rows of columnar lists are new dictionaries
+    schema = Schema(List({Required('a'): int}, columnar=True), inplace=True)
+    data = [{'a': '1'}]
+    row = data[0]
+    assert_true(schema(data) is data)
+    assert_equal([{'a': 1}], data)
+    assert_equal({'a': '1'}, row)
+
+
+# projecting trusted data should rename fields and build objects without
+# converting values
+def test_project():
+    import pickle
+
+    class Point(object):
+        def __init__(self, x, y):
+            self.x = x
+            self.y = y
+
+    schema = Schema({
+        Required('pointList', rename_to='points'): List(MakeObject(Point, {
+            Required('xCoord', rename_to='x'): int,
+            Required('yCoord', rename_to='y'): int
+        })),
+        Optional('tree'): Ref('tree'),
+        Optional('pair'): [str, {Required('aB', rename_to='a_b'): int}],
+        Optional('event'): Union('type', {
+            'a': {Required('type'): str, Required('vV', rename_to='v'): int}
+        }),
+        Optional('meta'): Dict({Optional('k'): str}, extras=Extras.ALLOW),
+    }, definitions={
+        'tree': {Required('nodeName', rename_to='name'): str,
+                 Optional('children'): List(Ref('tree'))}
+    })
+    data = {
+        'pointList': [{'xCoord': 1, 'yCoord': 2, 'zCoord': 3}],
+        'tree': {'nodeName': 'a', 'children': [{'nodeName': 'b'}]},
+        'pair': ['x', {'aB': 1}],
+        'event': {'type': 'a', 'vV': 1},
+        'meta': {'k': 'v', 'other': 1},
+        'unknown': 1,
+    }
+    projected = schema.project(data)
+    del data['unknown']
+    del data['pointList'][0]['zCoord']
+    validated = schema(data)
+    points = projected.pop('points')
+    assert_equal([(1, 2)], [(p.x, p.y) for p in points])
+    validated.pop('points')
+    assert_equal(validated, projected)
+    schema = Schema({Required('x', rename_to='y'): int})
+    assert_equal({'y': '1'}, schema.project({'x': '1'}))
+    assert_equal({'y': '1'},
+                 pickle.loads(pickle.dumps(schema)).project({'x': '1'}))
+    assert_equal('1', Schema(int).project('1'))
+    # Structure inside of wrappers is projected too
+    schema = Schema({
+        Required('addr'): Nullable(Dict({
+            Required('zipCode', rename_to='zip_code'): str})),
+        Optional('items'): (List({Required('aB', rename_to='ab'): int}),
+                            Length(max=3)),
+    })
+    data = {'addr': {'zipCode': '1'}, 'items': [{'aB': 1}]}
+    assert_equal(schema(data), schema.project(data))
+    assert_equal({'addr': None}, schema.project({'addr': None}))
+
+    class Wrapper(object):
+        def __init__(self, inner):
+            self.inner = inner
+
+        def __call__(self, value):
+            return self.inner(value)
+
+    assert_raises(SchemaError, Schema(Wrapper(Dict({}))).project, {})
+
+
+# sampled lists should validate only some of their elements
+def test_sample():
+    data = [{'iD': str(i)} for i in range(10)]
+    data[3]['iD'] = 'x'
+    for columnar in (False, True):
+        reports = []
+        schema = Schema(List({Required('iD', rename_to='id'): int},
+                             columnar=columnar,
+                             sample=Sample(0.5, hook=reports.append)))
+        result = schema(data)
+        assert_equal([{'id': i if i % 2 == 0 else str(i)} for i in range(3)],
+                     result[:3])
+        assert_equal({'id': 'x'}, result[3])
+        assert_equal(5, reports[-1]['sampled'])
+        assert_equal(0, reports[-1]['invalid'])
+        assert_true(not reports[-1]['exceeded'])
+        data[4]['iD'] = 'y'
+        schema(data)
+        assert_equal(0.2, reports[-1]['error_rate'])
+        assert_equal([[4, 'iD']], [e.path for e in reports[-1]['errors']])
+        del data[4]['iD']
+        data[4]['iD'] = '4'
+    results = []
+    for _ in range(2):
+        schema = Schema(List(int, sample=Sample(0.3, seed=1,
+                                               max_error_rate=0.5)))
+        results.append([schema(['1', '2', '3', '4']) for _ in range(10)])
+    # Seeded samples are reproducible, but differ between calls
+    assert_equal(results[0], results[1])
+    assert_true(set([1, 2, 3, 4]) ==
+                set(v for res in results[0] for v in res if v in (1, 2, 3, 4)))
+    assert_raises(MultipleInvalid, schema, ['a', 'b', 'c', 'd'])
+    assert_equal([], schema([]))
+    assert_raises(SchemaError, Sample, 0)
+    assert_raises(SchemaError, Sample, 1.5)
+    assert_raises(SchemaError, List, int, sample=0.5)
+
+    class Wrapper(object):
+        def __init__(self, inner):
+            self.inner = inner
+
+        def __call__(self, value):
+            return self.inner(value)
+
+    assert_raises(SchemaError, Schema, List(
+        Wrapper(Dict({Required('skuId', rename_to='sku'): str})),
+        sample=Sample(0.5)))
+    schema = Schema(List(
+        Nullable(Dict({Required('skuId', rename_to='sku'): str})),
+        sample=Sample(0.5)))
+    assert_equal([{'sku': 'a'}, {'sku': 'b'}, None],
+                 schema([{'skuId': 'a'}, {'skuId': 'b'}, None]))
+    assert_true('sample=0.5' in schema.explain())
+
+
+# cached results should be returned for equal data
+def test_cache():
+    import pickle
+    now = [0]
+    cache = Cache(max_entries=2, ttl=10, clock=lambda: now[0])
+    schema = Schema({Required('id'): int, Optional('tags'): List(str)},
+                    cache=cache)
+    assert_equal({'id': 1, 'tags': ['a']},
+                 schema({'tags': ['a'], 'id': '1'}))
+    result = schema({'id': '1', 'tags': ['a']})
+    result['tags'].append('b')
+    assert_equal({'id': 1, 'tags': ['a']}, schema({'id': '1', 'tags': ['a']}))
+    assert_equal({'id': 1}, schema({'id': '1', 'tags': ['a']}, only=['id']))
+    assert_equal(2, cache.stats()['hits'])
+    for _ in range(2):
+        try:
+            schema({'id': 'x'})
+            assert False, "an exception should've been raised"
+        except MultipleInvalid as e:
+            assert_equal(['id'], e.path)
+            # Changes of errors don't reach the cache
+            e.errors[0].path.insert(0, 'row')
+    assert_equal({'hits': 3, 'misses': 3, 'evictions': 1, 'expirations': 0,
+                  'skipped': 0, 'entries': 2, 'bytes': 0}, cache.stats())
+    # True and 1 are different payloads
+    assert_equal({'id': 1}, schema({'id': True}))
+    now[0] = 10
+    assert_equal({'id': 1}, schema({'id': True}))
+    assert_equal(1, cache.stats()['expirations'])
+    assert_equal({'id': 1}, schema({'id': decimal.Decimal(1.5)}))
+    for _ in range(2):
+        assert_equal({'id': 5}, schema.loads(b'{"id": "5"}'))
+    # Text is keyed by its UTF-8 encoding
+    assert_equal({'id': 5}, schema.loads(u'{"id": "5"}'))
+    assert_equal(5, cache.stats()['hits'])
+    schema = Schema(UnvalidatedDict(), cache=Cache(max_bytes=1000))
+    assert_equal(1, len(schema({'x': 'a'})))
+    stats = pickle.loads(pickle.dumps(schema)).cache.stats()
+    assert_equal(0, stats['entries'])
+    schema.cache.clear()
+    assert_equal(1, len(schema({'x': 'a' * 2000})))
+    assert_equal(0, schema.cache.stats()['entries'])
+    schema({'x': object()})
+    assert_equal(1, schema.cache.stats()['skipped'])
+    assert_raises(SchemaError, Schema, int, cache=Cache(), inplace=True)
+    schema = Schema(UnvalidatedList(), cache=Cache(),
+                    limits=Limits(max_list_len=2))
+    assert_raises(MultipleInvalid, schema, [1, 2, 3])
+    assert_equal(0, schema.cache.stats()['misses'])
+    assert_raises(SchemaError, Cache, max_entries=0)
+    # Keys don't identify schemas
+    assert_raises(SchemaError, Schema, {Required('id'): str}, cache=cache)
+
+
+# blocking converters should run concurrently in an executor
+def test_executor():
+    import pickle
+    import threading
+    threads = set()
+    calls = []
+
+    # concurrent.futures is missing in Python 2
+    class Future(threading.Thread):
+        def __init__(self, f, value):
+            threading.Thread.__init__(self)
+            self.f = f
+            self.value = value
+            self.error = None
+            self.start()
+
+        def run(self):
+            try:
+                self.value = self.f(self.value)
+            except Exception as e:
+                self.error = e
+
+        def result(self):
+            self.join()
+            if self.error is not None:
+                raise self.error
+            return self.value
+
+        def cancel(self):
+            pass
+
+    class Executor(object):
+        def submit(self, f, value):
+            return Future(f, value)
+
+    def lookup(value):
+        threads.add(threading.current_thread().name)
+        calls.append(value)
+        return {'a': 1, 'b': 2}[value.strip()]
+
+    inner = {Required('code', rename_to='value'): Blocking(lookup),
+             Optional('parent'): Chain(Blocking(lookup), Range(max=1)),
+             Optional('alias'): Nullable(Interned(Blocking(lookup)))}
+    executor = Executor()
+    schema = Schema(List(inner), executor=executor)
+    # Codes are equal, but distinct objects
+    codes = [{'code': ''.join([code, ' '])} for code in 'ab' * 10]
+    assert_equal([{'value': 1}, {'value': 2}] * 10, schema(codes))
+    assert_true(threading.current_thread().name not in threads)
+    # Equal values are looked up once per document
+    assert_equal(2, len(calls))
+    del calls[:]
+    threads.clear()
+    assert_equal([{'value': 1, 'alias': 2}, {'value': 2, 'alias': None}],
+                 schema([{'code': 'a', 'alias': 'b'},
+                         {'code': 'b', 'alias': None}]))
+    assert_equal(['a', 'b', 'b'], sorted(calls))
+    assert_true(threading.current_thread().name not in threads)
+    try:
+        schema([{'code': 'a', 'parent': 'b'}, {'code': 'c'}])
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal([[0, 'parent'], [1, 'code']],
+                     sorted(e.path for e in e.errors))
+    unpickled = pickle.loads(pickle.dumps(
+        Schema(Blocking(int), executor=executor)))
+    # Equal values of other types can differ
+    values = [decimal.Decimal('1.0'), decimal.Decimal('1.00'), (1, 2.0),
+              (1.0, 2)]
+    assert_equal(['1.0', '1.00', '(1, 2.0)', '(1.0, 2)'],
+                 Schema(List(Blocking(str)), executor=executor)(values))
+    assert_equal(None, unpickled.executor)
+    assert_equal(1, unpickled('1'))
+    threads.clear()
+    assert_equal([{'value': 2}], Schema(List(inner))([{'code': 'b'}]))
+    assert_equal([threading.current_thread().name], list(threads))
+    assert_raises(SchemaError, Schema, int, executor=object())
+    assert_raises(SchemaError, Blocking, 1)
+
+
+# nested dictionaries should be flattened into rows of tables
+def test_to_rows():
+    import sqlite3
+
+    def node():
+        return Dict({
+            Required('nodeName', rename_to='name'): str,
+            Optional('children'): List(Ref('node')),
+        }, table=Table('nodes', key='id', parent_key='parent_id'))
+
+    schema = Schema(List(Dict({
+        Required('id'): int,
+        Required('meta'): {Optional('note'): str},
+        Required('root'): Ref('node'),
+        Optional('tags'): List(Dict({Required('tag'): str},
+                                    extras=Extras.REMOVE, table='tags')),
+    }, table=Table('docs', key='id'))), definitions={'node': node()})
+    assert_equal([('docs', ('id', 'meta')),
+                  ('nodes', ('id', 'parent_id', 'name')),
+                  ('tags', ('tag',))], list(schema.tables().items()))
+    documents = [
+        {'id': '1', 'meta': {}, 'root': {'nodeName': 'a', 'children': [
+            {'nodeName': 'b'}, {'nodeName': 'c'}]}},
+        {'id': '2', 'meta': {'note': 'n'}, 'root': {'nodeName': 'd'},
+         'tags': [{'tag': 'x', 'other': 1}]},
+    ]
+    batches = list(schema.to_rows(iter(documents), batch_size=1,
+                                  keys={'nodes': 10}))
+    assert_equal(2, len(batches))
+    assert_equal({'docs': [(1, {})],
+                  'nodes': [(10, 1, 'a'), (11, 10, 'b'), (12, 10, 'c')],
+                  'tags': []}, dict(batches[0]))
+    assert_equal({'docs': [(2, {'note': 'n'})],
+                  'nodes': [(13, 2, 'd')],
+                  'tags': [('x',)]}, dict(batches[1]))
+    documents[1]['root']['children'] = [{'nodeName': 1}, {'name': 'e'}]
+    documents[1]['tags'] = 'x'
+    try:
+        list(schema.to_rows(documents))
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal([[1, 'root', 'children', 1, 'name'],
+                      [1, 'root', 'children', 1, 'nodeName'],
+                      [1, 'tags']], sorted(e.path for e in e.errors))
+    assert_raises(SchemaError, Schema({Required('id'): int}).tables)
+    assert_raises(SchemaError, Schema(Dict(
+        {}, table=Table('a', parent_key='p'))).tables)
+    assert_raises(SchemaError, Schema(Dict({
+        Required('x'): Dict({}, table='a')}, table='a')).tables)
+    # Rows of nested tables need keys of their parents
+    schema = Schema(Dict({
+        Optional('k'): int,
+        Optional('c'): List(Dict({Required('x'): int},
+                                 table=Table('c', parent_key='pk')))
+    }, table=Table('p', key='k')))
+    try:
+        list(schema.to_rows({'c': [{'x': '2'}]}))
+        assert False, "an exception should've been raised"
+    except MultipleInvalid as e:
+        assert_equal(['k'], e.path)
+
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE docs (id PRIMARY KEY, meta)')
+    connection.execute('CREATE TABLE nodes (id, parent_id, name)')
+    schema = Schema(List(Dict({
+        Required('id'): int,
+        Required('root'): Ref('node'),
+    }, table=Table('docs', key='id'))), definitions={'node': node()})
+    assert_equal({'docs': 2, 'nodes': 3},
+                 load_sqlite(connection, schema, [
+                     {'id': 1, 'root': {'nodeName': 'a', 'children': [
+                         {'nodeName': 'b'}]}},
+                     {'id': 2, 'root': {'nodeName': 'c'}}], batch_size=1))
+    assert_raises(MultipleInvalid, load_sqlite, connection, schema, [
+        {'id': 3, 'root': {'nodeName': 'd'}}, {'id': 4, 'root': {}}])
+    assert_equal([(1, 1, 'a'), (2, 1, 'b'), (3, 2, 'c')], connection.execute(
+        'SELECT id, parent_id, name FROM nodes ORDER BY id').fetchall())
+
+    # Generated keys cannot continue keys, that are not integers
+    connection.execute("INSERT INTO nodes VALUES ('n1', 1, 'x')")
+    data = [{'id': 5, 'root': {'nodeName': 'e'}}]
+    assert_raises(SchemaError, load_sqlite, connection, schema, data)
+    assert_equal({'docs': 1, 'nodes': 1}, load_sqlite(
+        connection, schema, data, keys={'nodes': 10}))
+    assert_equal([(10, 5, 'e')], connection.execute(
+        'SELECT id, parent_id, name FROM nodes WHERE id = 10').fetchall())
+
+
+# generated data should be valid or invalid, as requested
+def test_generate():
+    import itertools
+
+    def node():
+        return {Required('name'): Chain(str, Length(max=4)),
+                Optional('children'): List(Ref('node'))}
+
+    lookup = {'a': 1, 'b': 2}.__getitem__
+    schema = Schema({
+        Required('id'): Chain(int, Range(min=10, max=12, max_inclusive=True)),
+        Required('price'): Chain(parse_decimal, Range(max=5)),
+        Required('ratio'): float,
+        Required('flag'): bool,
+        Required('strict'): StrictBoolean(),
+        Required('at'): ParseDateTime('%d.%m.%Y'),
+        Required('note'): Nullable(str),
+        Required('code'): Enum(1, 2),
+        Required('size'): Chain(Enum(1, 5, 10), Range(max=6)),
+        Required('count'): NotNone(int),
+        Required('version'): Literal(2),
+        Required('pair'): FixedList(int, Chain(str, Length(min=2, max=2))),
+        Required('tree'): Ref('node'),
+        Required('event'): Union('type', {
+            'a': {Required('type'): str, Required('v'): int},
+            'b': {Required('type'): str},
+        }),
+        Optional('meta'): UnvalidatedDict(),
+        Optional('lookup'): lookup,
+        Inclusive('x', monitor='point'): int,
+        Inclusive('y', monitor='point'): int,
+        Exclusive('email', monitor='contact'): str,
+        Exclusive('phone', monitor='contact'): str,
+    }, definitions={'node': node()})
+    generators = {lookup: lambda rng: rng.choice('ab')}
+    records = list(schema.generate(300, seed=3, generators=generators,
+                                   max_depth=3))
+    results = [schema(record) for record in records]
+    assert_equal(set([11, 12]), set(r['id'] for r in results))
+    assert_true(all(r['price'] < 5 for r in results))
+    assert_true(set(['a', 'b']) ==
+                set(r['event']['type'] for r in results))
+    assert_true(any('x' in r for r in results))
+    assert_true(not any('email' in r and 'phone' in r for r in results))
+    assert_true(any(r['note'] is None for r in results))
+    assert_equal(set([1, 5]), set(r['size'] for r in results))
+    for record in schema.generate(300, seed=3, generators=generators,
+                                  invalid_ratio=1):
+        assert_raises(MultipleInvalid, schema, record)
+    endless = schema.generate(seed=3, generators=generators, max_depth=3)
+    assert_equal(records[:5], list(itertools.islice(endless, 5)))
+    assert_raises(SchemaError, list, schema.generate(50, seed=3))
+    assert_raises(SchemaError, list, Schema(
+        {Required('child'): Ref('node')},
+        definitions={'node': {Required('child'): Ref('node')}}).generate(1))
+    assert_raises(SchemaError, schema.generate, 1, invalid_ratio=2)
+    assert_raises(SchemaError, list, Schema(
+        Chain(Literal(10), Range(max=6))).generate(1))
+
+    # Exclusive bounds of ranges are moved by a step of generated values
+    schema = Schema({Required('ratio'): Chain(float, Range(1, 2)),
+                     Required('count'): Chain(Nullable(int), Range(max=3))})
+    for record in schema.generate(100, seed=3):
+        assert_equal(record, schema(record))
+    assert_raises(SchemaError, list, Schema(
+        Chain(int, Range(1, 2))).generate(1))